@@ -0,0 +1,199 @@
+import json
+import os
+from typing import Dict, Any, List, Optional
+import jwt
+import psycopg2
+from psycopg2.extras import Json, RealDictCursor
+
+SCHEMA = 't_p99005675_game_items_marketpla'
+
+# Действие -> CTE, изменяющие строки одним запросом; последний CTE называется changed
+# и возвращает id затронутых строк, они попадают в журнал той же командой
+ACTIONS: Dict[str, str] = {
+    'delist_items': f"""
+        changed AS (
+            UPDATE {SCHEMA}.items
+            SET status = 'delisted', updated_at = NOW()
+            WHERE is_sold = FALSE AND status = 'active'
+                AND (id = ANY(%(item_ids)s::int[]) OR seller_id = ANY(%(seller_ids)s::int[]))
+            RETURNING id
+        )
+    """,
+    'approve_withdrawals': f"""
+        changed AS (
+            UPDATE {SCHEMA}.withdrawals
+            SET status = 'approved', processed_at = NOW()
+            WHERE id = ANY(%(withdrawal_ids)s::int[]) AND status IN ('pending', 'on_hold')
+            RETURNING id
+        )
+    """,
+    # Баллы списываются при создании заявки, поэтому отказ возвращает их на баланс
+    'reject_withdrawals': f"""
+        rejected AS (
+            UPDATE {SCHEMA}.withdrawals
+            SET status = 'rejected', processed_at = NOW()
+            WHERE id = ANY(%(withdrawal_ids)s::int[]) AND status IN ('pending', 'on_hold')
+            RETURNING id, user_id, amount
+        ),
+        refunded AS (
+            UPDATE {SCHEMA}.users u
+            SET balance = u.balance + r.total
+            FROM (SELECT user_id, SUM(amount) AS total FROM rejected GROUP BY user_id) r
+            WHERE u.id = r.user_id
+        ),
+        changed AS (
+            SELECT id FROM rejected
+        )
+    """,
+    'freeze_users': f"""
+        changed AS (
+            UPDATE {SCHEMA}.users
+            SET is_frozen = TRUE, frozen_at = NOW()
+            WHERE id = ANY(%(user_ids)s::int[]) AND is_frozen = FALSE
+            RETURNING id
+        )
+    """,
+    'unfreeze_users': f"""
+        changed AS (
+            UPDATE {SCHEMA}.users
+            SET is_frozen = FALSE, frozen_at = NULL
+            WHERE id = ANY(%(user_ids)s::int[]) AND is_frozen = TRUE
+            RETURNING id
+        )
+    """
+}
+
+ID_PARAMS = ['item_ids', 'seller_ids', 'withdrawal_ids', 'user_ids']
+REQUIRED_PARAMS: Dict[str, List[str]] = {
+    'delist_items': ['item_ids', 'seller_ids'],
+    'approve_withdrawals': ['withdrawal_ids'],
+    'reject_withdrawals': ['withdrawal_ids'],
+    'freeze_users': ['user_ids'],
+    'unfreeze_users': ['user_ids']
+}
+
+
+def respond(status_code: int, body: Any) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(body, default=str),
+        'isBase64Encoded': False
+    }
+
+
+def get_claims(event: Dict[str, Any], secret: str) -> Optional[Dict[str, Any]]:
+    '''Проверяет JWT, выданный auth, из Authorization: Bearer или X-Auth-Token'''
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    token = headers.get('x-auth-token') or ''
+    authorization = headers.get('authorization') or ''
+    if authorization.lower().startswith('bearer '):
+        token = authorization[7:].strip()
+    if not token:
+        return None
+    try:
+        claims = jwt.decode(token, secret, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    return claims if claims.get('user_id') else None
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: API модерации для администраторов: массовое снятие объявлений, одобрение и отклонение выводов, заморозка аккаунтов с записью в журнал
+    Args: event - dict с httpMethod, headers (JWT с ролью admin), body (action и списки id), queryStringParameters
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response с числом затронутых строк и id записи журнала или списком записей журнала
+    '''
+    method: str = event.get('httpMethod', 'POST')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Auth-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    if method not in ('GET', 'POST'):
+        return respond(405, {'error': 'Method not allowed'})
+
+    # Без секрета любой токен, подписанный известным значением по умолчанию, давал бы роль admin
+    secret = os.environ.get('JWT_SECRET')
+    if not secret:
+        return respond(500, {'error': 'JWT_SECRET is not configured'})
+
+    claims = get_claims(event, secret)
+    if claims is None:
+        return respond(401, {'error': 'Authorization required'})
+    if claims.get('role') != 'admin':
+        return respond(403, {'error': 'Admin role required'})
+    admin_id = int(claims['user_id'])
+
+    if method == 'POST':
+        body_data = json.loads(event.get('body') or '{}')
+        action = body_data.get('action')
+        if action not in ACTIONS:
+            return respond(400, {'error': f"Unknown action, expected one of: {', '.join(ACTIONS)}"})
+        try:
+            params = {name: [int(value) for value in body_data.get(name) or []] for name in ID_PARAMS}
+        except (TypeError, ValueError):
+            return respond(400, {'error': 'Ids must be lists of integers'})
+        if not any(params[name] for name in REQUIRED_PARAMS[action]):
+            return respond(400, {'error': f"{' or '.join(REQUIRED_PARAMS[action])} required"})
+
+    conn = None
+    try:
+        dsn = os.environ.get('DATABASE_URL')
+        conn = psycopg2.connect(dsn)
+
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Роль перепроверяется по базе: разжалованный администратор теряет доступ до истечения токена
+            cur.execute(f"SELECT role FROM {SCHEMA}.users WHERE id = %s", (admin_id,))
+            admin = cur.fetchone()
+            if not admin or admin['role'] != 'admin':
+                return respond(403, {'error': 'Admin role required'})
+
+            if method == 'GET':
+                query = event.get('queryStringParameters') or {}
+                try:
+                    limit = min(max(int(query.get('limit', 50)), 1), 500)
+                except ValueError:
+                    return respond(400, {'error': 'limit must be an integer'})
+                cur.execute(f"""
+                    SELECT id, admin_id, action, reason, params, affected_count, created_at
+                    FROM {SCHEMA}.admin_audit_log
+                    ORDER BY created_at DESC
+                    LIMIT %s
+                """, (limit,))
+                return respond(200, {'entries': cur.fetchall()})
+
+            result = run_action(cur, admin_id, action, params, body_data.get('reason'))
+            conn.commit()
+            return respond(200, {'action': action, **result})
+    finally:
+        if conn:
+            conn.close()
+
+
+def run_action(cur: Any, admin_id: int, action: str, params: Dict[str, List[int]], reason: Optional[str]) -> Dict[str, int]:
+    '''Выполняет действие одним set-based запросом и пишет запись журнала в той же команде'''
+    # id затронутых строк уже лежат в target_ids, из запроса сохраняются продавцы и число запрошенных id
+    filters = {name: values if name == 'seller_ids' else len(values) for name, values in params.items() if values}
+    cur.execute(f"""
+        WITH {ACTIONS[action]}
+        INSERT INTO {SCHEMA}.admin_audit_log (admin_id, action, reason, params, affected_count, target_ids)
+        SELECT %(admin_id)s, %(action)s, %(reason)s, %(filters)s, COUNT(*), COALESCE(array_agg(id), '{{}}')
+        FROM changed
+        RETURNING id, affected_count
+    """, {**params, 'admin_id': admin_id, 'action': action, 'reason': reason, 'filters': Json(filters)})
+    row = cur.fetchone()
+    return {'affected': row['affected_count'], 'audit_id': row['id']}
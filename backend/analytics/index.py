@@ -0,0 +1,407 @@
+import json
+import os
+import shutil
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+import psycopg2
+
+SCHEMA = 't_p99005675_game_items_marketpla'
+
+# Колонки выгрузки: имя -> тип хранения.
+# money хранится в копейках (int64), чтобы суммы оставались точными.
+# refresh_days: последние дни (по часам БД) перечитываются целиком и заменяют прежние файлы.
+# Для transactions это окно догоняет покупки, закоммиченные позже строк с большим id:
+# такая строка ниже водяного знака, и выборка id > last_id ее бы пропустила.
+EXPORT_TABLES: Dict[str, Dict[str, Any]] = {
+    'transactions': {
+        'columns': [
+            ('id', 'int'), ('buyer_id', 'int'), ('seller_id', 'int'), ('item_id', 'int'),
+            ('amount', 'money'), ('transaction_type', 'str'), ('created_at', 'ts')
+        ],
+        'refresh_days': 1
+    },
+    'withdrawals': {
+        'columns': [
+            ('id', 'int'), ('user_id', 'int'), ('amount', 'money'), ('status', 'str'),
+            ('payment_method', 'str'), ('created_at', 'ts'), ('processed_at', 'ts')
+        ],
+        'refresh_days': 7
+    },
+    'payment_history': {
+        'columns': [
+            ('id', 'int'), ('user_id', 'int'), ('amount', 'int'), ('rubles', 'money'),
+            ('status', 'str'), ('payment_method', 'str'), ('created_at', 'ts'), ('completed_at', 'ts')
+        ],
+        'refresh_days': 7
+    }
+}
+
+FETCH_SIZE = 50000
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Инкрементальная выгрузка transactions, withdrawals и payment_history в колоночные файлы по дням и отчеты по ним без обращения к основной БД
+    Args: event - dict с httpMethod, queryStringParameters
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response с результатом выгрузки или данными отчета
+    '''
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    if method not in ('GET', 'POST'):
+        return {
+            'statusCode': 405,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    reports = {
+        'gmv_daily': report_gmv_daily,
+        'top_sellers': report_top_sellers,
+        'totals': report_totals
+    }
+    params = event.get('queryStringParameters') or {}
+    report = params.get('report', 'gmv_daily')
+    if method == 'GET':
+        if report not in reports:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Unknown report'}),
+                'isBase64Encoded': False
+            }
+        try:
+            date_from = parse_day(params.get('date_from'))
+            date_to = parse_day(params.get('date_to'))
+            limit = min(max(int(params.get('limit', 10)), 1), 1000)
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'date_from and date_to must be YYYY-MM-DD, limit an integer'}),
+                'isBase64Encoded': False
+            }
+
+    # Выгрузка и отчеты могут обслуживаться разными контейнерами, поэтому каталог
+    # должен быть общим хранилищем (смонтированный том), а не /tmp контейнера
+    export_dir = os.environ.get('ANALYTICS_DIR')
+    if not export_dir:
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'ANALYTICS_DIR is not configured'}),
+            'isBase64Encoded': False
+        }
+
+    if method == 'POST':
+        result = export_all(export_dir)
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'exported': result}),
+            'isBase64Encoded': False
+        }
+
+    data = reports[report](export_dir, date_from, date_to, dict(params, limit=limit))
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps({'report': report, 'data': data}),
+        'isBase64Encoded': False
+    }
+
+
+def parse_day(value: Optional[str]) -> Optional[date]:
+    '''Разбирает дату формата YYYY-MM-DD; ValueError, если формат другой'''
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+# ---------- Выгрузка ----------
+
+def load_state(export_dir: str) -> Dict[str, Dict[str, Any]]:
+    '''
+    Читает состояние таблиц: last_id - водяной знак, run - номер последнего
+    зафиксированного прогона, pending - прогон, который зафиксирован, но его
+    файлы еще не перенесены из staging
+    '''
+    path = os.path.join(export_dir, '_state.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        state = json.load(f)
+    # Старый формат: таблица -> last_id
+    return {table: value if isinstance(value, dict) else {'last_id': value, 'run': 0} for table, value in state.items()}
+
+
+def save_state(export_dir: str, state: Dict[str, Dict[str, Any]]) -> None:
+    '''Атомарно сохраняет водяные знаки'''
+    path = os.path.join(export_dir, '_state.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def export_all(export_dir: str) -> Dict[str, int]:
+    '''Выгружает новые строки всех таблиц, возвращает число строк по таблицам'''
+    os.makedirs(export_dir, exist_ok=True)
+    state = load_state(export_dir)
+    # Выгрузка читает реплику, если она настроена, чтобы не нагружать основную БД
+    dsn = os.environ.get('ANALYTICS_DATABASE_URL') or os.environ.get('DATABASE_URL')
+    conn = psycopg2.connect(dsn)
+    result = {}
+    try:
+        conn.set_session(readonly=True)
+        for table, spec in EXPORT_TABLES.items():
+            table_state = state.get(table, {'last_id': 0, 'run': 0})
+            # Прогон, упавший после фиксации, доносится; незафиксированный - отбрасывается
+            if table_state.get('pending'):
+                apply_pending(export_dir, table, table_state)
+                save_state(export_dir, state)
+            shutil.rmtree(staging_dir(export_dir, table), ignore_errors=True)
+
+            run = table_state['run'] + 1
+            exported, last_id, refreshed = export_table(conn, export_dir, table, spec, table_state['last_id'], run)
+            if not exported:
+                continue
+            # Фиксация: водяной знак и список файлов прогона сохраняются одной атомарной записью,
+            # файлы переносятся из staging после нее
+            table_state = {'last_id': last_id, 'run': run, 'pending': {'refreshed_days': sorted(refreshed)}}
+            state[table] = table_state
+            save_state(export_dir, state)
+            apply_pending(export_dir, table, table_state)
+            save_state(export_dir, state)
+            result[table] = exported
+    finally:
+        conn.close()
+    return result
+
+
+def staging_dir(export_dir: str, table: str) -> str:
+    return os.path.join(export_dir, '_staging', table)
+
+
+def part_run(part: str) -> int:
+    '''Номер прогона из имени файла part-r000001-...; у файлов старого формата - 0'''
+    return int(part[6:12]) if part.startswith('part-r') else 0
+
+
+def apply_pending(export_dir: str, table: str, table_state: Dict[str, Any]) -> None:
+    '''
+    Переносит файлы зафиксированного прогона из staging в партиции. Повторный
+    вызов после сбоя безопасен: перенесенные файлы уже на месте, а в обновляемых
+    днях удаляются только файлы прежних прогонов.
+    '''
+    run = table_state['run']
+    staged_root = staging_dir(export_dir, table)
+    for day in table_state['pending']['refreshed_days']:
+        day_dir = os.path.join(export_dir, table, f'day={day}')
+        if os.path.isdir(day_dir):
+            for name in os.listdir(day_dir):
+                if part_run(name) != run:
+                    os.remove(os.path.join(day_dir, name))
+    if os.path.isdir(staged_root):
+        for partition in os.listdir(staged_root):
+            day_dir = os.path.join(export_dir, table, partition)
+            os.makedirs(day_dir, exist_ok=True)
+            for name in os.listdir(os.path.join(staged_root, partition)):
+                os.replace(os.path.join(staged_root, partition, name), os.path.join(day_dir, name))
+        shutil.rmtree(staged_root, ignore_errors=True)
+    table_state.pop('pending', None)
+
+
+def export_table(conn: Any, export_dir: str, table: str, spec: Dict[str, Any], last_id: int, run: int) -> Tuple[int, int, set]:
+    '''
+    Выгружает строки с id больше водяного знака в staging по дням created_at.
+    Для изменяемых таблиц (статусы выводов и платежей) последние refresh_days дней
+    выгружаются целиком и при фиксации заменяют прежние файлы этих дней.
+    Возвращает число строк, новый водяной знак и обновляемые дни.
+    '''
+    columns = spec['columns']
+    names = [name for name, _ in columns]
+    refresh_from = None
+    if spec['refresh_days']:
+        # Дни считаются по часам БД: created_at ставит NOW() сервера, а не контейнера
+        with conn.cursor() as cur:
+            cur.execute("SELECT CURRENT_DATE - %s", (spec['refresh_days'],))
+            refresh_from = cur.fetchone()[0]
+
+    query = f"SELECT {', '.join(names)} FROM {SCHEMA}.{table} WHERE id > %s"
+    args: List[Any] = [last_id]
+    if refresh_from:
+        query += " OR created_at >= %s"
+        args.append(refresh_from)
+    query += " ORDER BY created_at, id"
+
+    exported = 0
+    max_id = last_id
+    refreshed = set()
+    # Именованный курсор читает таблицу порциями на стороне сервера
+    with conn.cursor(name=f'export_{table}') as cur:
+        cur.itersize = FETCH_SIZE
+        cur.execute(query, args)
+        while True:
+            rows = cur.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for day, day_rows in group_by_day(rows, names.index('created_at')):
+                day_dir = os.path.join(staging_dir(export_dir, table), f'day={day.isoformat()}')
+                os.makedirs(day_dir, exist_ok=True)
+                if refresh_from and day >= refresh_from:
+                    refreshed.add(day.isoformat())
+                write_part(day_dir, columns, day_rows, run)
+            exported += len(rows)
+            max_id = max(max_id, max(row[0] for row in rows))
+    conn.commit()
+    return exported, max_id, refreshed
+
+
+def group_by_day(rows: List[tuple], ts_index: int) -> List[Tuple[date, List[tuple]]]:
+    '''Делит отсортированные по created_at строки на группы по дням'''
+    groups: List[Tuple[date, List[tuple]]] = []
+    for row in rows:
+        day = row[ts_index].date()
+        if not groups or groups[-1][0] != day:
+            groups.append((day, []))
+        groups[-1][1].append(row)
+    return groups
+
+
+def to_array(values: List[Any], kind: str) -> np.ndarray:
+    '''Преобразует колонку в numpy-массив; NULL кодируется как 0, пустая строка или NaT'''
+    if kind == 'int':
+        return np.array([v or 0 for v in values], dtype=np.int64)
+    if kind == 'money':
+        return np.array([int((v or Decimal(0)) * 100) for v in values], dtype=np.int64)
+    if kind == 'ts':
+        return np.array([v if v is not None else 'NaT' for v in values], dtype='datetime64[us]')
+    return np.array([v or '' for v in values], dtype=np.str_)
+
+
+def write_part(day_dir: str, columns: List[Tuple[str, str]], rows: List[tuple], run: int) -> None:
+    '''Записывает порцию строк одного дня в отдельный колоночный файл'''
+    arrays = {name: to_array([row[i] for row in rows], kind) for i, (name, kind) in enumerate(columns)}
+    part_name = f'part-r{run:06d}-{rows[0][0]:012d}-{len(os.listdir(day_dir)):04d}.npz'
+    tmp_path = os.path.join(day_dir, '.' + part_name)
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, os.path.join(day_dir, part_name))
+
+
+# ---------- Отчеты ----------
+
+def load_table(export_dir: str, table: str, date_from: Optional[date], date_to: Optional[date]) -> Dict[str, np.ndarray]:
+    '''Читает колонки таблицы за диапазон дней, отбрасывая лишние партиции по имени каталога'''
+    names = [name for name, _ in EXPORT_TABLES[table]['columns']]
+    chunks: Dict[str, List[np.ndarray]] = {name: [] for name in names}
+    table_dir = os.path.join(export_dir, table)
+    if os.path.isdir(table_dir):
+        for partition in sorted(os.listdir(table_dir)):
+            day = parse_day(partition.split('=', 1)[1])
+            if (date_from and day < date_from) or (date_to and day > date_to):
+                continue
+            day_dir = os.path.join(table_dir, partition)
+            for part in sorted(os.listdir(day_dir)):
+                if part.startswith('.'):
+                    continue
+                with np.load(os.path.join(day_dir, part)) as data:
+                    for name in names:
+                        chunks[name].append(data[name])
+    columns = {}
+    for name, kind in EXPORT_TABLES[table]['columns']:
+        if chunks[name]:
+            columns[name] = np.concatenate(chunks[name])
+        elif kind == 'ts':
+            columns[name] = np.array([], dtype='datetime64[us]')
+        elif kind == 'str':
+            columns[name] = np.array([], dtype=np.str_)
+        else:
+            columns[name] = np.array([], dtype=np.int64)
+    return columns
+
+
+def to_money(kopecks: Any) -> float:
+    '''Переводит копейки обратно в рубли/баллы'''
+    return round(float(kopecks)) / 100
+
+
+def report_gmv_daily(export_dir: str, date_from: Optional[date], date_to: Optional[date], params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    '''Оборот покупок по дням'''
+    tx = load_table(export_dir, 'transactions', date_from, date_to)
+    mask = tx['transaction_type'] == 'purchase'
+    days = tx['created_at'][mask].astype('datetime64[D]')
+    amounts = tx['amount'][mask]
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    gmv = np.bincount(inverse, weights=amounts, minlength=len(unique_days))
+    counts = np.bincount(inverse, minlength=len(unique_days))
+    return [
+        {'day': str(day), 'gmv': to_money(total), 'purchases': int(count)}
+        for day, total, count in zip(unique_days, gmv, counts)
+    ]
+
+
+def report_top_sellers(export_dir: str, date_from: Optional[date], date_to: Optional[date], params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    '''Продавцы с наибольшим оборотом'''
+    limit = params['limit']
+    tx = load_table(export_dir, 'transactions', date_from, date_to)
+    mask = (tx['transaction_type'] == 'purchase') & (tx['seller_id'] > 0)
+    sellers = tx['seller_id'][mask]
+    amounts = tx['amount'][mask]
+    unique_sellers, inverse = np.unique(sellers, return_inverse=True)
+    totals = np.bincount(inverse, weights=amounts, minlength=len(unique_sellers))
+    counts = np.bincount(inverse, minlength=len(unique_sellers))
+    order = np.argsort(-totals, kind='stable')[:limit]
+    return [
+        {'seller_id': int(unique_sellers[i]), 'gmv': to_money(totals[i]), 'sales': int(counts[i])}
+        for i in order
+    ]
+
+
+def report_totals(export_dir: str, date_from: Optional[date], date_to: Optional[date], params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Итоги: суммы по типам транзакций, выводы по статусам, оплаты и комиссия площадки'''
+    fee_percent = float(os.environ.get('MARKETPLACE_FEE_PERCENT', '0'))
+
+    tx = load_table(export_dir, 'transactions', date_from, date_to)
+    types, inverse = np.unique(tx['transaction_type'], return_inverse=True)
+    by_type = np.bincount(inverse, weights=tx['amount'], minlength=len(types))
+    transactions = {str(t): to_money(total) for t, total in zip(types, by_type)}
+
+    wd = load_table(export_dir, 'withdrawals', date_from, date_to)
+    statuses, inverse = np.unique(wd['status'], return_inverse=True)
+    by_status = np.bincount(inverse, weights=wd['amount'], minlength=len(statuses))
+    withdrawals = {str(s): to_money(total) for s, total in zip(statuses, by_status)}
+
+    ph = load_table(export_dir, 'payment_history', date_from, date_to)
+    completed = ph['status'] == 'completed'
+
+    gmv = transactions.get('purchase', 0.0)
+    return {
+        'transactions': transactions,
+        'withdrawals': withdrawals,
+        'payments_rubles': to_money(ph['rubles'][completed].sum()),
+        'fees': round(gmv * fee_percent / 100, 2)
+    }
@@ -59,10 +59,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    # Без секрета не выдаем токены: подписанные значением по умолчанию подделал бы кто угодно
+    jwt_secret = os.environ.get('JWT_SECRET')
+    if not jwt_secret:
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': 'JWT_SECRET is not configured'}),
+            'isBase64Encoded': False
+        }
+    
     body_data = json.loads(event.get('body', '{}'))
     action = body_data.get('action', 'login')
     username = body_data.get('username', '').strip()
     password = body_data.get('password', '')
+    referral_code_input = (body_data.get('referral_code') or '').strip().upper()
     
     if not username or not password:
         return {
@@ -125,25 +139,57 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
+        # Resolve referrer by code (unique index on referral_code)
+        referrer_id = None
+        if referral_code_input:
+            cur.execute(
+                "SELECT id FROM t_p99005675_game_items_marketpla.users WHERE referral_code = %s",
+                (referral_code_input,)
+            )
+            referrer = cur.fetchone()
+            
+            if not referrer:
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'Неверный реферальный код'}),
+                    'isBase64Encoded': False
+                }
+            referrer_id = referrer[0]
+        
         # Create new user
         password_hash = hash_password(password)
         referral_code = generate_referral_code()
         
         cur.execute(
             """INSERT INTO t_p99005675_game_items_marketpla.users 
-               (username, password_hash, referral_code, balance) 
-               VALUES (%s, %s, %s, 0.00) 
-               RETURNING id, username, balance""",
-            (username, password_hash, referral_code)
+               (username, password_hash, referral_code, referred_by, balance) 
+               VALUES (%s, %s, %s, %s, 0.00) 
+               RETURNING id, username, balance, role""",
+            (username, password_hash, referral_code, referrer_id)
         )
         user = cur.fetchone()
+        user_id, user_username, balance, role = user
+        
+        # Bonus is paid later by the referral-bonus batch job
+        if referrer_id:
+            cur.execute(
+                """INSERT INTO t_p99005675_game_items_marketpla.referrals 
+                   (referrer_id, referred_id) 
+                   VALUES (%s, %s)""",
+                (referrer_id, user_id)
+            )
         conn.commit()
-        user_id, user_username, balance = user
         
     else:  # login
         # Find user by username
         cur.execute(
-            """SELECT id, username, password_hash, balance 
+            """SELECT id, username, password_hash, balance, role 
                FROM t_p99005675_game_items_marketpla.users 
                WHERE LOWER(username) = LOWER(%s)""",
             (username,)
@@ -163,7 +209,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        user_id, user_username, password_hash, balance = user
+        user_id, user_username, password_hash, balance, role = user
         
         # Check if user has password (OAuth users don't have password)
         if not password_hash:
@@ -197,11 +243,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     conn.close()
     
     # Generate JWT token
-    jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-key')
     token = jwt.encode(
         {
             'user_id': user_id,
             'username': user_username,
+            'role': role,
             'exp': datetime.utcnow() + timedelta(days=30)
         },
         jwt_secret,
@@ -219,7 +265,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'user': {
                 'id': user_id,
                 'username': user_username,
-                'balance': float(balance)
+                'balance': float(balance),
+                'role': role
             }
         }),
         'isBase64Encoded': False
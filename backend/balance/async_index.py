@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Any
+import asyncpg
+import psycopg2
+from psycopg2.extensions import parse_dsn
+from index import handler as sync_handler
+
+# Ключ - сам цикл, а не id(loop): id цикла завершившегося потока может достаться новому
+_pools: Dict[asyncio.AbstractEventLoop, Any] = {}
+_local = threading.local()
+
+
+def statement_cache_size() -> int:
+    '''
+    Кеш именованных подготовленных запросов asyncpg; за PgBouncer в режиме transaction
+    (порт 6432 в DATABASE_URL или DB_PREPARE=0) выключен, как PREPARE в marketplace/queries.py
+    '''
+    setting = os.environ.get('DB_PREPARE', 'auto')
+    if setting == 'auto':
+        try:
+            setting = '0' if parse_dsn(os.environ.get('DATABASE_URL') or '').get('port') == '6432' else '1'
+        except psycopg2.ProgrammingError:
+            setting = '1'
+    return 0 if setting == '0' else 100
+
+
+async def get_pool() -> Any:
+    '''Пул asyncpg на каждый цикл событий; asyncpg кеширует подготовленные запросы на соединение'''
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = await asyncpg.create_pool(
+            os.environ.get('DATABASE_URL'),
+            min_size=1,
+            max_size=int(os.environ.get('ASYNC_POOL_SIZE', 10)),
+            statement_cache_size=statement_cache_size()
+        )
+        _pools[loop] = pool
+    return pool
+
+
+def respond(status_code: int, body: Any) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(body, default=str),
+        'isBase64Encoded': False
+    }
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Совместимая точка входа handler(event, context) для асинхронного режима.
+    Цикл событий и его пул свои у каждого потока: один цикл нельзя запускать из двух потоков сразу
+    '''
+    loop = getattr(_local, 'loop', None)
+    if loop is None:
+        loop = _local.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(handler_async(event, context))
+
+
+async def handler_async(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Асинхронный вариант API баланса и профиля на asyncpg
+    Args: event - dict с httpMethod, body, queryStringParameters
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response в том же формате, что и синхронный handler
+    '''
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'GET':
+        params = event.get('queryStringParameters') or {}
+        user_id = int(params.get('user_id', '1'))
+
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            user = await conn.fetchrow(
+                "SELECT id, username, balance, email, bio, profile_avatar FROM t_p99005675_game_items_marketpla.users WHERE id = $1",
+                user_id
+            )
+
+        if not user:
+            return respond(404, {'error': 'User not found'})
+        return respond(200, dict(user))
+
+    if method == 'PUT':
+        body_data = json.loads(event.get('body') or '{}')
+        user_id = body_data.get('user_id')
+
+        if not user_id:
+            return respond(400, {'error': 'user_id required'})
+
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            user = await conn.fetchrow(
+                "UPDATE t_p99005675_game_items_marketpla.users SET email = $1, bio = $2, profile_avatar = $3 WHERE id = $4 RETURNING id, username, balance, email, bio, profile_avatar",
+                body_data.get('email', ''), body_data.get('bio', ''), body_data.get('avatar', ''), int(user_id)
+            )
+
+        if not user:
+            return respond(404, {'error': 'User not found'})
+        return respond(200, dict(user))
+
+    if method == 'POST':
+        body_data = json.loads(event.get('body') or '{}')
+        user_id = int(body_data.get('user_id', 1))
+        amount = float(body_data.get('amount', 0))
+
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            # Пополнение и запись в журнал транзакций - один запрос
+            user = await conn.fetchrow("""
+                WITH topped_up AS (
+                    UPDATE t_p99005675_game_items_marketpla.users
+                    SET balance = balance + $1
+                    WHERE id = $2
+                    RETURNING id, username, balance
+                ),
+                ledger AS (
+                    INSERT INTO t_p99005675_game_items_marketpla.transactions (buyer_id, amount, transaction_type)
+                    SELECT id, $1, 'top_up' FROM topped_up
+                )
+                SELECT * FROM topped_up
+            """, amount, user_id)
+
+        return respond(200, dict(user) if user else None)
+
+    return await asyncio.get_running_loop().run_in_executor(None, sync_handler, event, context)
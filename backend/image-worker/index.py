@@ -0,0 +1,414 @@
+import base64
+import hashlib
+import http.client
+import io
+import ipaddress
+import json
+import os
+import socket
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from urllib.parse import urlparse, unquote
+import psycopg2
+from psycopg2.extras import Json, RealDictCursor
+from PIL import Image
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+SCHEMA = 't_p99005675_game_items_marketpla'
+
+# Размеры миниатюр: имя -> максимальная сторона в пикселях
+THUMB_SIZES = {'card': 400, 'small': 96}
+# Расширение -> (формат Pillow, Content-Type)
+THUMB_FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpg': ('JPEG', 'image/jpeg')}
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_ATTEMPTS = 3
+# Задание в processing дольше этого срока считается брошенным упавшим воркером
+JOB_TIMEOUT_SECONDS = int(os.environ.get('IMAGE_JOB_TIMEOUT_SECONDS', 600))
+
+
+# ---------- Загрузчики изображений ----------
+
+def public_address(host: str, port: int) -> Tuple[str, int]:
+    '''Разрешает имя хоста; любой непубличный адрес (частная сеть, loopback, link-local, служебные) запрещен'''
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise ValueError(f'Image host {host} resolves to a non-public address')
+    return infos[0][4][0], port
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    '''Соединяется только с проверенным адресом, поэтому подмена DNS после проверки не помогает'''
+
+    def connect(self) -> None:
+        self.sock = socket.create_connection(public_address(self.host, self.port), self.timeout)
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self) -> None:
+        sock = socket.create_connection(public_address(self.host, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req: urllib.request.Request) -> Any:
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req: urllib.request.Request) -> Any:
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+class PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    '''Следует только на http(s) и проверяет адрес каждого шага до запроса'''
+    max_redirections = 3
+
+    def redirect_request(self, req: urllib.request.Request, fp: Any, code: int, msg: str,
+                         headers: Any, newurl: str) -> Optional[urllib.request.Request]:
+        target = urlparse(newurl)
+        if target.scheme.lower() not in ('http', 'https'):
+            raise ValueError(f'Redirect to {target.scheme}:// is not allowed')
+        public_address(target.hostname or '', target.port or (443 if target.scheme.lower() == 'https' else 80))
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def build_http_opener() -> urllib.request.OpenerDirector:
+    '''
+    Opener только с публичными HTTP/HTTPS-обработчиками. build_opener добавил бы FTP, file:,
+    data: и прокси из окружения, а стандартный редирект разрешает переход на ftp://
+    '''
+    opener = urllib.request.OpenerDirector()
+    for handler in (PublicHTTPHandler(), PublicHTTPSHandler(), PublicRedirectHandler(),
+                    urllib.request.HTTPDefaultErrorHandler(), urllib.request.HTTPErrorProcessor(),
+                    urllib.request.UnknownHandler()):
+        opener.add_handler(handler)
+    return opener
+
+
+HTTP_OPENER = build_http_opener()
+
+
+def fetch_http(url: str) -> bytes:
+    '''Скачивает изображение по HTTP(S) с публичного адреса с ограничением размера'''
+    request = urllib.request.Request(url, headers={'User-Agent': 'game-items-marketplace-image-worker'})
+    with HTTP_OPENER.open(request, timeout=10) as response:
+        data = response.read(MAX_IMAGE_BYTES + 1)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError('Image too large')
+    return data
+
+
+def fetch_data_url(url: str) -> bytes:
+    '''Декодирует изображение, загруженное продавцом как data:image/...;base64'''
+    header, _, payload = url.partition(',')
+    if not header.endswith(';base64'):
+        raise ValueError('Only base64 data URLs are supported')
+    data = base64.b64decode(payload)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError('Image too large')
+    return data
+
+
+def fetch_local_file(url: str) -> bytes:
+    '''Читает file:// изображение из каталога IMAGE_LOCAL_ROOT (для тестов и локального запуска)'''
+    root = os.environ.get('IMAGE_LOCAL_ROOT')
+    if not root:
+        raise ValueError('Local files are disabled')
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, unquote(urlparse(url).path).lstrip('/')))
+    if not path.startswith(root + os.sep):
+        raise ValueError('Path outside of IMAGE_LOCAL_ROOT')
+    with open(path, 'rb') as f:
+        return f.read(MAX_IMAGE_BYTES)
+
+
+FETCHERS: Dict[str, Callable[[str], bytes]] = {
+    'http': fetch_http,
+    'https': fetch_http,
+    'data': fetch_data_url,
+    'file': fetch_local_file
+}
+
+
+def register_fetcher(scheme: str, fetcher: Callable[[str], bytes]) -> None:
+    '''Подключает загрузчик для схемы URL (например, объектное хранилище)'''
+    FETCHERS[scheme] = fetcher
+
+
+def fetch_image(url: str) -> bytes:
+    scheme = url.split(':', 1)[0].lower()
+    fetcher = FETCHERS.get(scheme)
+    if fetcher is None:
+        raise ValueError(f'Unsupported image URL scheme: {scheme}')
+    return fetcher(url)
+
+
+# ---------- Миниатюры ----------
+
+def make_thumbnails(data: bytes) -> List[Tuple[str, str, bytes]]:
+    '''Генерирует миниатюры всех размеров и форматов; выполняется в дочернем процессе'''
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        image = source.convert('RGB')
+    thumbs = []
+    for size_name, max_side in THUMB_SIZES.items():
+        thumb = image.copy()
+        thumb.thumbnail((max_side, max_side), Image.LANCZOS)
+        for ext, (fmt, _) in THUMB_FORMATS.items():
+            buffer = io.BytesIO()
+            thumb.save(buffer, format=fmt, quality=80, optimize=True)
+            thumbs.append((size_name, ext, buffer.getvalue()))
+    return thumbs
+
+
+def thumb_key(image_hash: str, size_name: str, ext: str) -> str:
+    return f'{image_hash[:2]}/{image_hash}_{size_name}.{ext}'
+
+
+def thumb_urls(base_url: str, image_hash: str) -> Dict[str, Dict[str, str]]:
+    '''Адреса всех вариантов: {размер: {формат: url}}, как в items.thumbs'''
+    return {
+        size_name: {ext: f'{base_url}/{thumb_key(image_hash, size_name, ext)}' for ext in THUMB_FORMATS}
+        for size_name in THUMB_SIZES
+    }
+
+
+# ---------- Хранилища миниатюр ----------
+
+class S3Store:
+    '''S3-совместимое объектное хранилище, миниатюры раздаются через CDN по IMAGE_BASE_URL'''
+
+    def __init__(self, bucket: str) -> None:
+        if boto3 is None:
+            raise RuntimeError('IMAGE_S3_BUCKET is set but boto3 is not installed')
+        self.bucket = bucket
+        self.prefix = os.environ.get('IMAGE_S3_PREFIX', 'thumbnails/')
+        self.client = boto3.client(
+            's3',
+            endpoint_url=os.environ.get('IMAGE_S3_ENDPOINT') or None,
+            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
+        )
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def put(self, key: str, payload: bytes, content_type: str) -> None:
+        # Ключ зависит только от содержимого, поэтому объект кешируется навсегда
+        self.client.put_object(
+            Bucket=self.bucket, Key=self.prefix + key, Body=payload,
+            ContentType=content_type, CacheControl='public, max-age=31536000, immutable'
+        )
+
+
+class DirectoryStore:
+    '''Каталог, который раздает статический сервер по IMAGE_BASE_URL (локальный запуск)'''
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.root, key))
+
+    def put(self, key: str, payload: bytes, content_type: str) -> None:
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+
+def open_store() -> Optional[Any]:
+    '''Хранилище из окружения: IMAGE_S3_BUCKET или IMAGE_STORE_DIR'''
+    bucket = os.environ.get('IMAGE_S3_BUCKET')
+    if bucket:
+        return S3Store(bucket)
+    store_dir = os.environ.get('IMAGE_STORE_DIR')
+    return DirectoryStore(store_dir) if store_dir else None
+
+
+def store_thumbnails(store: Any, image_hash: str, thumbs: List[Tuple[str, str, bytes]]) -> None:
+    '''Сохраняет миниатюры по адресу, зависящему только от содержимого исходника'''
+    for size_name, ext, payload in thumbs:
+        store.put(thumb_key(image_hash, size_name, ext), payload, THUMB_FORMATS[ext][1])
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Обработка очереди изображений объявлений: загрузка исходника, генерация WebP/JPEG миниатюр в пуле процессов и сохранение по хешу содержимого
+    Args: event - dict с httpMethod, body (необязательный batch_size)
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response с количеством обработанных и неудачных заданий
+    '''
+    method: str = event.get('httpMethod', 'POST')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    # thumb_url и thumbs отдаются клиентам как есть, поэтому адрес CDN должен быть абсолютным
+    base_url = os.environ.get('IMAGE_BASE_URL', '').rstrip('/')
+    parsed_base = urlparse(base_url)
+    if parsed_base.scheme not in ('http', 'https') or not parsed_base.netloc:
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'IMAGE_BASE_URL must be an absolute http(s) URL'}),
+            'isBase64Encoded': False
+        }
+
+    store = open_store()
+    if store is None:
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Thumbnail storage is not configured: set IMAGE_S3_BUCKET or IMAGE_STORE_DIR'}),
+            'isBase64Encoded': False
+        }
+
+    body_data = json.loads(event.get('body') or '{}')
+    batch_size = int(body_data.get('batch_size', 50))
+
+    conn = None
+    try:
+        dsn = os.environ.get('DATABASE_URL')
+        conn = psycopg2.connect(dsn)
+        result = process_jobs(conn, batch_size, store, base_url)
+
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps(result),
+            'isBase64Encoded': False
+        }
+    finally:
+        if conn:
+            conn.close()
+
+
+def process_jobs(conn: Any, batch_size: int, store: Any, base_url: str) -> Dict[str, int]:
+    '''Забирает пачку заданий, генерирует миниатюры параллельно и проставляет предметам thumb_url и thumbs'''
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        # Брошенные задания без оставшихся попыток закрываются, остальные забираются заново
+        cur.execute(f"""
+            UPDATE {SCHEMA}.image_jobs
+            SET status = 'failed', processed_at = NOW(), error = 'Worker did not finish the job'
+            WHERE status = 'processing' AND attempts >= %s
+                AND claimed_at < NOW() - make_interval(secs => %s)
+        """, (MAX_ATTEMPTS, JOB_TIMEOUT_SECONDS))
+        cur.execute(f"""
+            UPDATE {SCHEMA}.image_jobs
+            SET status = 'processing', attempts = attempts + 1, claimed_at = NOW()
+            WHERE id IN (
+                SELECT id FROM {SCHEMA}.image_jobs
+                WHERE status = 'pending'
+                    OR (status = 'processing' AND claimed_at < NOW() - make_interval(secs => %s))
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, item_id, source_url, attempts
+        """, (JOB_TIMEOUT_SECONDS, batch_size))
+        jobs = cur.fetchall()
+        conn.commit()
+
+    done = []
+    failed = []
+    pending = []
+    sources: Dict[str, bytes] = {}
+    job_hashes: Dict[int, str] = {}
+    for job in jobs:
+        try:
+            data = fetch_image(job['source_url'])
+        except Exception as e:
+            (failed if job['attempts'] >= MAX_ATTEMPTS else pending).append((job['id'], str(e)))
+            continue
+        image_hash = hashlib.sha256(data).hexdigest()
+        job_hashes[job['id']] = image_hash
+        # Одинаковые изображения обрабатываются один раз, уже сохраненные - не обрабатываются
+        if image_hash not in sources and not store.exists(thumb_key(image_hash, 'card', 'webp')):
+            sources[image_hash] = data
+
+    errors: Dict[str, str] = {}
+    if sources:
+        with ProcessPoolExecutor() as pool:
+            hashes = list(sources)
+            futures = [pool.submit(make_thumbnails, sources[h]) for h in hashes]
+            for image_hash, future in zip(hashes, futures):
+                try:
+                    store_thumbnails(store, image_hash, future.result())
+                except Exception as e:
+                    errors[image_hash] = str(e)
+
+    updates = []
+    for job in jobs:
+        image_hash = job_hashes.get(job['id'])
+        if image_hash is None:
+            continue
+        if image_hash in errors:
+            failed.append((job['id'], errors[image_hash]))
+            continue
+        updates.append((job['item_id'], image_hash, thumb_urls(base_url, image_hash)))
+        done.append(job['id'])
+
+    with conn.cursor() as cur:
+        for item_id, image_hash, thumbs in updates:
+            cur.execute(
+                f"UPDATE {SCHEMA}.items SET image_hash = %s, thumb_url = %s, thumbs = %s WHERE id = %s",
+                (image_hash, thumbs['card']['webp'], Json(thumbs), item_id)
+            )
+        if done:
+            cur.execute(
+                f"UPDATE {SCHEMA}.image_jobs SET status = 'done', processed_at = NOW(), error = NULL WHERE id = ANY(%s)",
+                (done,)
+            )
+        for job_id, error in failed:
+            cur.execute(
+                f"UPDATE {SCHEMA}.image_jobs SET status = 'failed', processed_at = NOW(), error = %s WHERE id = %s",
+                (error, job_id)
+            )
+        for job_id, error in pending:
+            cur.execute(
+                f"UPDATE {SCHEMA}.image_jobs SET status = 'pending', error = %s WHERE id = %s",
+                (error, job_id)
+            )
+        conn.commit()
+
+    return {'processed': len(done), 'failed': len(failed), 'retry': len(pending)}
@@ -0,0 +1,215 @@
+import json
+import os
+from datetime import date
+from typing import Dict, Any
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+SCHEMA = 't_p99005675_game_items_marketpla'
+
+# Продавцов за одну транзакцию переноса счетчика продаж: их строки users заблокированы до коммита
+SALES_SYNC_BATCH = 200
+
+ARCHIVE_COLUMNS = 'id, seller_id, title, description, price, image_url, category, rarity, is_sold, status, created_at, expires_at, updated_at, image_hash, thumb_url, thumbs'
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Фоновая задача: истечение срока объявлений, перенос проданных/снятых/истекших предметов в партиционированный архив пачками, удаление старых карточек архива и перенос счетчиков продаж в карточки ленты
+    Args: event - dict с httpMethod, body (необязательные older_than_days, card_retention_days, batch_size, max_batches)
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response с количеством истекших, перенесенных в архив объявлений, удаленных карточек и обновленных продавцов
+    '''
+    method: str = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    body_data = json.loads(event.get('body') or '{}')
+    older_than_days = int(body_data.get('older_than_days', os.environ.get('ARCHIVE_AFTER_DAYS', 30)))
+    card_retention_days = int(body_data.get('card_retention_days', os.environ.get('LISTING_CARD_RETENTION_DAYS', 365)))
+    batch_size = int(body_data.get('batch_size', 5000))
+    max_batches = int(body_data.get('max_batches', 100))
+    
+    conn = None
+    try:
+        dsn = os.environ.get('DATABASE_URL')
+        conn = psycopg2.connect(dsn)
+        
+        expired = expire_listings(conn, batch_size, max_batches)
+        ensure_archive_partitions(conn)
+        archived = archive_items(conn, older_than_days, batch_size, max_batches)
+        pruned = prune_archived_cards(conn, card_retention_days, batch_size, max_batches)
+        sellers = sync_sales_counts(conn, max_batches)
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'expired': expired, 'archived': archived, 'cards_pruned': pruned, 'sales_counts_synced': sellers}),
+            'isBase64Encoded': False
+        }
+    finally:
+        if conn:
+            conn.close()
+
+
+def expire_listings(conn: Any, batch_size: int, max_batches: int) -> int:
+    '''Переводит активные объявления с истекшим сроком в статус expired'''
+    total = 0
+    with conn.cursor() as cur:
+        for _ in range(max_batches):
+            cur.execute(f"""
+                UPDATE {SCHEMA}.items
+                SET status = 'expired', updated_at = NOW()
+                WHERE id IN (
+                    SELECT id FROM {SCHEMA}.items
+                    WHERE status = 'active' AND is_sold = FALSE AND expires_at <= NOW()
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+            """, (batch_size,))
+            conn.commit()
+            total += cur.rowcount
+            if cur.rowcount < batch_size:
+                break
+    return total
+
+
+def ensure_archive_partitions(conn: Any) -> None:
+    '''
+    Создает партиции архива на текущий и следующий месяц. Месяц берется из часов БД:
+    archived_at ставит NOW() сервера, часы и пояс контейнера могут отличаться, а пачка,
+    начатая в последние секунды месяца, вставляется уже в следующий
+    '''
+    with conn.cursor() as cur:
+        cur.execute("SELECT date_trunc('month', LOCALTIMESTAMP)::date")
+        start = cur.fetchone()[0]
+    conn.commit()
+    ensure_archive_partition(conn, start)
+    ensure_archive_partition(conn, next_month(start))
+
+
+def next_month(start: date) -> date:
+    '''Первое число месяца, следующего за start'''
+    return date(start.year + (start.month == 12), start.month % 12 + 1, 1)
+
+
+def ensure_archive_partition(conn: Any, start: date) -> None:
+    '''Создает месячную партицию архива, начинающуюся с start'''
+    end = next_month(start)
+    name = f'items_archive_{start:%Y%m}'
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SCHEMA}.{name}
+            PARTITION OF {SCHEMA}.items_archive
+            FOR VALUES FROM (%s) TO (%s)
+        """, (start, end))
+    conn.commit()
+
+
+def archive_items(conn: Any, older_than_days: int, batch_size: int, max_batches: int) -> int:
+    '''
+    Переносит проданные и неактивные объявления старше older_than_days в items_archive.
+    Каждая пачка - одна транзакция DELETE ... RETURNING + INSERT, чтобы блокировки
+    на items держались недолго и покупки не ждали архиватор.
+    Карточки в listing_cards остаются: по флагу marketplace.archiving триггер их не удаляет,
+    а отмечает archived_at; удаляет их prune_archived_cards.
+    '''
+    total = 0
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        for _ in range(max_batches):
+            cur.execute("SET LOCAL marketplace.archiving = 'on'")
+            cur.execute(f"""
+                WITH moved AS (
+                    DELETE FROM {SCHEMA}.items
+                    WHERE id IN (
+                        SELECT id FROM {SCHEMA}.items
+                        WHERE (is_sold = TRUE OR status <> 'active')
+                            AND updated_at < NOW() - make_interval(days => %s)
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING {ARCHIVE_COLUMNS}
+                )
+                INSERT INTO {SCHEMA}.items_archive ({ARCHIVE_COLUMNS}, archived_at)
+                SELECT {ARCHIVE_COLUMNS}, NOW() FROM moved
+            """, (older_than_days, batch_size))
+            conn.commit()
+            total += cur.rowcount
+            if cur.rowcount < batch_size:
+                break
+    return total
+
+
+def prune_archived_cards(conn: Any, retention_days: int, batch_size: int, max_batches: int) -> int:
+    '''Удаляет карточки предметов, перенесенных в архив больше retention_days дней назад'''
+    total = 0
+    with conn.cursor() as cur:
+        for _ in range(max_batches):
+            cur.execute(f"""
+                DELETE FROM {SCHEMA}.listing_cards
+                WHERE item_id IN (
+                    SELECT item_id FROM {SCHEMA}.listing_cards
+                    WHERE archived_at < NOW() - make_interval(days => %s)
+                    LIMIT %s
+                )
+            """, (retention_days, batch_size))
+            conn.commit()
+            total += cur.rowcount
+            if cur.rowcount < batch_size:
+                break
+    return total
+
+
+def sync_sales_counts(conn: Any, max_batches: int) -> int:
+    '''
+    Переносит users.sales_count в seller_sales_count активных карточек продавцов, у которых
+    он изменился с прошлого переноса. Покупка меняет только users, так что большой продавец
+    обходится одним UPDATE своих карточек за запуск, а не на каждую продажу.
+    '''
+    total = 0
+    with conn.cursor() as cur:
+        for _ in range(max_batches):
+            cur.execute(f"""
+                WITH pending AS (
+                    SELECT id, sales_count FROM {SCHEMA}.users
+                    WHERE sales_count <> listed_sales_count
+                    ORDER BY id
+                    LIMIT %s
+                ),
+                cards AS (
+                    UPDATE {SCHEMA}.listing_cards c
+                    SET seller_sales_count = p.sales_count
+                    FROM pending p
+                    WHERE c.seller_id = p.id AND c.is_sold = FALSE AND c.status = 'active'
+                )
+                UPDATE {SCHEMA}.users u
+                SET listed_sales_count = p.sales_count
+                FROM pending p
+                WHERE u.id = p.id
+            """, (SALES_SYNC_BATCH,))
+            conn.commit()
+            total += cur.rowcount
+            if cur.rowcount < SALES_SYNC_BATCH:
+                break
+    return total
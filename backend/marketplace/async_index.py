@@ -0,0 +1,260 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Any
+import asyncpg
+from index import handler as sync_handler, parse_id, parse_limit, parse_price, JSON_AGG_THRESHOLD, MAX_HISTORY_LIMIT
+from queries import PREPARE
+from pricing import add_display_prices, get_rates_async
+
+# Ключ - сам цикл, а не id(loop): id цикла завершившегося потока может достаться новому
+_pools: Dict[asyncio.AbstractEventLoop, Any] = {}
+_local = threading.local()
+
+
+class PurchaseError(Exception):
+    '''Отказ в покупке; откатывает транзакцию и превращается в ответ 400/404'''
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+async def init_connection(conn: Any) -> None:
+    '''JSONB (thumbs) приходит словарем, как из psycopg2'''
+    await conn.set_type_codec('jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def get_pool() -> Any:
+    '''Пул asyncpg на каждый цикл событий; asyncpg кеширует подготовленные запросы на соединение'''
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = await asyncpg.create_pool(
+            os.environ.get('DATABASE_URL'),
+            min_size=1,
+            max_size=int(os.environ.get('ASYNC_POOL_SIZE', 10)),
+            statement_cache_size=100 if PREPARE else 0,
+            init=init_connection
+        )
+        _pools[loop] = pool
+    return pool
+
+
+def respond(status_code: int, body: Any) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(body, default=str),
+        'isBase64Encoded': False
+    }
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Совместимая точка входа handler(event, context) для асинхронного режима.
+    Цикл событий и его пул свои у каждого потока: один цикл нельзя запускать из двух потоков сразу
+    '''
+    loop = getattr(_local, 'loop', None)
+    if loop is None:
+        loop = _local.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(handler_async(event, context))
+
+
+async def handler_async(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Асинхронный вариант API маркетплейса на asyncpg: лента, создание и покупка предметов
+    Args: event - dict с httpMethod, queryStringParameters, body, path
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response в том же формате, что и синхронный handler
+    '''
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'GET':
+        return await get_items(event)
+    if method == 'POST':
+        return await create_item(event)
+    if method == 'PUT':
+        return await buy_item(event)
+
+    # OPTIONS, изменение цены и снятие с продажи выполняет синхронный handler в потоке
+    return await asyncio.get_running_loop().run_in_executor(None, sync_handler, event, context)
+
+
+async def get_items(event: Dict[str, Any]) -> Dict[str, Any]:
+    params = event.get('queryStringParameters') or {}
+    user_id = params.get('user_id')
+    currencies = params.get('currency') or os.environ.get('DISPLAY_CURRENCIES', 'RUB')
+
+    # Статистику подготовленных запросов и проверку токена ведет синхронный handler
+    if params.get('query_stats'):
+        return await asyncio.get_running_loop().run_in_executor(None, sync_handler, event, None)
+
+    if user_id:
+        seller_id = parse_id(user_id)
+        if seller_id is None:
+            return respond(400, {'error': 'user_id must be an integer'})
+        limit = parse_limit(params, 50, MAX_HISTORY_LIMIT)
+        if limit is None:
+            return respond(400, {'error': 'limit must be an integer'})
+        # Большие страницы собирает в JSON сам Postgres, этот путь есть только у синхронного handler
+        if limit > JSON_AGG_THRESHOLD:
+            return await asyncio.get_running_loop().run_in_executor(None, sync_handler, event, None)
+
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        if user_id:
+            rows = await conn.fetch("""
+                SELECT
+                    item_id as id,
+                    title,
+                    price,
+                    CASE WHEN thumbs IS NULL THEN image_url END AS image_url,
+                    thumb_url,
+                    thumbs,
+                    category,
+                    rarity,
+                    is_sold,
+                    status,
+                    seller_id,
+                    created_at,
+                    seller_name,
+                    buyer_id,
+                    buyer_name,
+                    sold_at
+                FROM t_p99005675_game_items_marketpla.listing_cards
+                WHERE seller_id = $1
+                ORDER BY created_at DESC
+                LIMIT $2
+            """, seller_id, limit)
+        else:
+            rows = await conn.fetch("""
+                SELECT
+                    item_id as id,
+                    title,
+                    price,
+                    CASE WHEN thumbs IS NULL THEN image_url END AS image_url,
+                    thumb_url,
+                    thumbs,
+                    category,
+                    rarity,
+                    is_sold,
+                    seller_id,
+                    seller_name,
+                    seller_sales_count
+                FROM t_p99005675_game_items_marketpla.listing_cards
+                WHERE is_sold = FALSE AND status = 'active'
+                    AND (expires_at IS NULL OR expires_at > NOW())
+                ORDER BY created_at DESC
+                LIMIT 5
+            """)
+        rates = await get_rates_async(conn)
+
+    items = [dict(row) for row in rows]
+    add_display_prices(items, rates, currencies.upper().split(','))
+    return respond(200, {'items': items})
+
+
+async def create_item(event: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body') or '{}')
+
+    seller_id = int(body_data.get('seller_id', 1))
+    title = body_data.get('title', '')
+    description = body_data.get('description', '')
+    price = parse_price(body_data.get('price', 0))
+    if price is None:
+        return respond(400, {'error': 'price must be a number'})
+    image_url = body_data.get('image_url', 'https://images.unsplash.com/photo-1542751371-adc38448a05e?w=400')
+    category = body_data.get('category', 'Разное')
+    rarity = body_data.get('rarity', 'Обычный')
+    ttl_days = int(body_data.get('ttl_days', os.environ.get('LISTING_TTL_DAYS', 30)))
+
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        # Вставка предмета и задания на миниатюры - один запрос и один проход до БД
+        row = await conn.fetchrow("""
+            WITH new_item AS (
+                INSERT INTO t_p99005675_game_items_marketpla.items (seller_id, title, description, price, image_url, category, rarity, expires_at)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, NOW() + make_interval(days => $8))
+                RETURNING id, seller_id, title, description, price, image_url, category, rarity, is_sold, status, expires_at
+            ),
+            job AS (
+                INSERT INTO t_p99005675_game_items_marketpla.image_jobs (item_id, source_url)
+                SELECT id, image_url FROM new_item WHERE image_url IS NOT NULL AND image_url <> ''
+            )
+            SELECT * FROM new_item
+        """, seller_id, title, description, price, image_url, category, rarity, ttl_days if ttl_days > 0 else None)
+
+    return respond(201, dict(row))
+
+
+async def buy_item(event: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body') or '{}')
+    buyer_id = body_data.get('buyer_id')
+    item_id = body_data.get('item_id')
+
+    if not buyer_id or not item_id:
+        return respond(400, {'error': 'buyer_id and item_id required'})
+
+    pool = await get_pool()
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                item = await conn.fetchrow("""
+                    SELECT id, seller_id, title, price, is_sold, status, image_url,
+                        COALESCE(expires_at <= NOW(), FALSE) AS is_expired
+                    FROM t_p99005675_game_items_marketpla.items
+                    WHERE id = $1
+                    FOR UPDATE
+                """, int(item_id))
+
+                if not item:
+                    raise PurchaseError(404, 'Item not found')
+                if item['is_sold']:
+                    raise PurchaseError(400, 'Item already sold')
+                if item['is_expired'] or item['status'] != 'active':
+                    raise PurchaseError(400, 'Item is no longer listed')
+                if item['seller_id'] == int(buyer_id):
+                    raise PurchaseError(400, 'Cannot buy your own item')
+
+                # Проверка баланса и списание - одно условное обновление
+                buyer = await conn.fetchrow("""
+                    UPDATE t_p99005675_game_items_marketpla.users
+                    SET balance = balance - $1
+                    WHERE id = $2 AND balance >= $1 AND is_frozen = FALSE
+                    RETURNING id
+                """, item['price'], int(buyer_id))
+
+                if not buyer:
+                    if await conn.fetchval("SELECT is_frozen FROM t_p99005675_game_items_marketpla.users WHERE id = $1", int(buyer_id)):
+                        raise PurchaseError(403, 'Account is frozen')
+                    raise PurchaseError(400, 'Insufficient balance')
+
+                transaction = await conn.fetchrow("""
+                    WITH sold AS (
+                        UPDATE t_p99005675_game_items_marketpla.items
+                        SET is_sold = TRUE, updated_at = NOW()
+                        WHERE id = $1
+                    ),
+                    credited AS (
+                        UPDATE t_p99005675_game_items_marketpla.users
+                        SET balance = balance + $2
+                        WHERE id = $3
+                    )
+                    INSERT INTO t_p99005675_game_items_marketpla.transactions
+                    (buyer_id, seller_id, item_id, amount, transaction_type)
+                    VALUES ($4, $3, $1, $2, 'purchase')
+                    RETURNING id
+                """, item['id'], item['price'], item['seller_id'], int(buyer_id))
+    except PurchaseError as e:
+        return respond(e.status_code, {'error': e.message})
+
+    return respond(200, {
+        'success': True,
+        'transaction_id': transaction['id'],
+        'item': {key: value for key, value in item.items() if key != 'is_expired'}
+    })
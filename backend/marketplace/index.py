@@ -1,15 +1,24 @@
+import hmac
 import json
+import math
 import os
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from pricing import display_prices, get_rates
+from queries import execute, get_connection, release_connection, query_stats
+from serialize import encode_rows, cursor_columns
+
+# Страницы истории продавца больше порога собираются в JSON самим Postgres (json_agg)
+JSON_AGG_THRESHOLD = 200
+MAX_HISTORY_LIMIT = 10000
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: API для получения, создания и покупки игровых предметов на маркетплейсе
+    Business: API для получения, создания, покупки, изменения цены и снятия с продажи игровых предметов на маркетплейсе
     Args: event - dict с httpMethod, queryStringParameters, body, path
           context - объект с атрибутами request_id, function_name
-    Returns: HTTP response с JSON списком предметов, созданным или купленным предметом
+    Returns: HTTP response с JSON списком предметов, созданным, купленным или измененным предметом
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -18,7 +27,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, PATCH, DELETE, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
                 'Access-Control-Max-Age': '86400'
             },
@@ -26,59 +35,78 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = None
+    conn = get_connection()
+    broken = False
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        
         if method == 'GET':
             params = event.get('queryStringParameters', {})
             user_id = params.get('user_id')
             
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            currencies = params.get('currency') or os.environ.get('DISPLAY_CURRENCIES', 'RUB')
+            
+            # Списки читаются кортежами и кодируются в JSON без словаря на строку
+            with conn.cursor() as cur:
+                if params.get('query_stats'):
+                    # Служебный вывод: только с токеном из QUERY_STATS_TOKEN, без него недоступен
+                    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+                    stats_token = os.environ.get('QUERY_STATS_TOKEN')
+                    if not stats_token or not hmac.compare_digest(headers.get('x-stats-token', ''), stats_token):
+                        return {
+                            'statusCode': 403,
+                            'headers': {'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'X-Stats-Token required'}),
+                            'isBase64Encoded': False
+                        }
+                    return {
+                        'statusCode': 200,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'queries': query_stats(cur)}, default=str),
+                        'isBase64Encoded': False
+                    }
+                
                 if user_id:
-                    cur.execute("""
-                        SELECT 
-                            i.id, 
-                            i.title, 
-                            i.price, 
-                            i.image_url,
-                            i.category, 
-                            i.rarity,
-                            i.is_sold,
-                            i.seller_id,
-                            i.created_at,
-                            u.username as seller_name,
-                            t.buyer_id,
-                            buyer.username as buyer_name,
-                            t.created_at as sold_at
-                        FROM t_p99005675_game_items_marketpla.items i
-                        LEFT JOIN t_p99005675_game_items_marketpla.users u ON i.seller_id = u.id
-                        LEFT JOIN t_p99005675_game_items_marketpla.transactions t ON t.item_id = i.id
-                        LEFT JOIN t_p99005675_game_items_marketpla.users buyer ON buyer.id = t.buyer_id
-                        WHERE i.seller_id = %s
-                        ORDER BY i.created_at DESC
-                        LIMIT 50
-                    """, (user_id,))
+                    seller_id = parse_id(user_id)
+                    if seller_id is None:
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'user_id must be an integer'}),
+                            'isBase64Encoded': False
+                        }
+                    limit = parse_limit(params, 50, MAX_HISTORY_LIMIT)
+                    if limit is None:
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'limit must be an integer'}),
+                            'isBase64Encoded': False
+                        }
+                    if limit > JSON_AGG_THRESHOLD:
+                        rates = get_rates(conn)
+                        page_currencies = [currency for currency in currencies.upper().split(',') if currency in rates]
+                        execute(cur, 'seller_history_json', (seller_id, limit, page_currencies, [rates[currency] for currency in page_currencies]))
+                        return {
+                            'statusCode': 200,
+                            'headers': {
+                                'Content-Type': 'application/json',
+                                'Access-Control-Allow-Origin': '*'
+                            },
+                            'body': '{"items":' + cur.fetchone()[0] + '}',
+                            'isBase64Encoded': False
+                        }
+                    execute(cur, 'seller_history', (seller_id, limit))
                 else:
-                    cur.execute("""
-                        SELECT 
-                            i.id, 
-                            i.title, 
-                            i.price, 
-                            i.image_url,
-                            i.category, 
-                            i.rarity,
-                            i.is_sold,
-                            i.seller_id,
-                            u.username as seller_name
-                        FROM t_p99005675_game_items_marketpla.items i
-                        LEFT JOIN t_p99005675_game_items_marketpla.users u ON i.seller_id = u.id
-                        WHERE i.is_sold = FALSE
-                        ORDER BY i.created_at DESC
-                        LIMIT 5
-                    """)
-                items = cur.fetchall()
+                    execute(cur, 'feed')
+                rows = cur.fetchall()
+                columns = cursor_columns(cur)
+                
+                price_index = columns.index('price')
+                prices = display_prices([row[price_index] for row in rows], get_rates(conn), currencies.upper().split(','))
+                rows = [row + (row_prices,) for row, row_prices in zip(rows, prices)]
+                columns.append('display_prices')
                 
                 return {
                     'statusCode': 200,
@@ -86,7 +114,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'Content-Type': 'application/json',
                         'Access-Control-Allow-Origin': '*'
                     },
-                    'body': json.dumps({'items': items}, default=str),
+                    'body': '{"items":' + encode_rows(columns, rows) + '}',
                     'isBase64Encoded': False
                 }
         
@@ -96,20 +124,28 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             seller_id = body_data.get('seller_id', 1)
             title = body_data.get('title', '')
             description = body_data.get('description', '')
-            price = float(body_data.get('price', 0))
+            price = parse_price(body_data.get('price', 0))
+            if price is None:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'price must be a number'}),
+                    'isBase64Encoded': False
+                }
             image_url = body_data.get('image_url', 'https://images.unsplash.com/photo-1542751371-adc38448a05e?w=400')
             category = body_data.get('category', 'Разное')
             rarity = body_data.get('rarity', 'Обычный')
+            ttl_days = int(body_data.get('ttl_days', os.environ.get('LISTING_TTL_DAYS', 30)))
             
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    INSERT INTO t_p99005675_game_items_marketpla.items (seller_id, title, description, price, image_url, category, rarity)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id, seller_id, title, description, price, image_url, category, rarity, is_sold
-                """, (seller_id, title, description, price, image_url, category, rarity))
+                execute(cur, 'insert_item', (seller_id, title, description, price, image_url, category, rarity, ttl_days if ttl_days > 0 else None))
+                new_item = cur.fetchone()
+                
+                # Миниатюры генерирует image-worker, до этого карточка показывает исходное изображение
+                if image_url:
+                    execute(cur, 'insert_image_job', (new_item['id'], image_url))
                 
                 conn.commit()
-                new_item = cur.fetchone()
                 
                 return {
                     'statusCode': 201,
@@ -135,11 +171,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT id, seller_id, title, price, is_sold, image_url
-                    FROM t_p99005675_game_items_marketpla.items
-                    WHERE id = %s
-                """, (item_id,))
+                execute(cur, 'item_for_purchase', (item_id,))
                 item = cur.fetchone()
                 
                 if not item:
@@ -158,6 +190,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
+                # Истекшее объявление, которое архиватор еще не перевел в expired, тоже не продается
+                if item.pop('is_expired') or item['status'] != 'active':
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Item is no longer listed'}),
+                        'isBase64Encoded': False
+                    }
+                
                 if item['seller_id'] == buyer_id:
                     return {
                         'statusCode': 400,
@@ -166,11 +207,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                cur.execute("""
-                    SELECT balance FROM t_p99005675_game_items_marketpla.users WHERE id = %s
-                """, (buyer_id,))
+                execute(cur, 'buyer_balance', (buyer_id,))
                 buyer = cur.fetchone()
                 
+                if buyer and buyer['is_frozen']:
+                    return {
+                        'statusCode': 403,
+                        'headers': {'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Account is frozen'}),
+                        'isBase64Encoded': False
+                    }
+                
                 if not buyer or float(buyer['balance']) < float(item['price']):
                     return {
                         'statusCode': 400,
@@ -179,30 +226,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                cur.execute("""
-                    UPDATE t_p99005675_game_items_marketpla.users 
-                    SET balance = balance - %s 
-                    WHERE id = %s
-                """, (item['price'], buyer_id))
-                
-                cur.execute("""
-                    UPDATE t_p99005675_game_items_marketpla.users 
-                    SET balance = balance + %s 
-                    WHERE id = %s
-                """, (item['price'], item['seller_id']))
-                
-                cur.execute("""
-                    UPDATE t_p99005675_game_items_marketpla.items 
-                    SET is_sold = TRUE 
-                    WHERE id = %s
-                """, (item_id,))
-                
-                cur.execute("""
-                    INSERT INTO t_p99005675_game_items_marketpla.transactions 
-                    (buyer_id, seller_id, item_id, amount, transaction_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id
-                """, (buyer_id, item['seller_id'], item_id, item['price'], 'purchase'))
+                execute(cur, 'debit_buyer', (item['price'], buyer_id))
+                execute(cur, 'credit_seller', (item['price'], item['seller_id']))
+                execute(cur, 'mark_sold', (item_id,))
+                execute(cur, 'insert_purchase', (buyer_id, item['seller_id'], item_id, item['price']))
                 
                 transaction = cur.fetchone()
                 conn.commit()
@@ -220,13 +247,132 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     }, default=str),
                     'isBase64Encoded': False
                 }
+        
+        elif method == 'PATCH':
+            body_data = json.loads(event.get('body', '{}'))
+            seller_id = body_data.get('seller_id')
+            item_id = body_data.get('item_id')
+            price = body_data.get('price')
+            
+            if not seller_id or not item_id or price is None:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'seller_id, item_id and price required'}),
+                    'isBase64Encoded': False
+                }
+            
+            price = parse_price(price)
+            if price is None:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'price must be a number'}),
+                    'isBase64Encoded': False
+                }
+            
+            if price <= 0:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Price must be positive'}),
+                    'isBase64Encoded': False
+                }
+            
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                execute(cur, 'update_price', (price, item_id, seller_id))
+                item = cur.fetchone()
+                conn.commit()
+                
+                if not item:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Active listing not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps(item, default=str),
+                    'isBase64Encoded': False
+                }
+        
+        elif method == 'DELETE':
+            body_data = json.loads(event.get('body', '{}'))
+            seller_id = body_data.get('seller_id')
+            item_id = body_data.get('item_id')
+            
+            if not seller_id or not item_id:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'seller_id and item_id required'}),
+                    'isBase64Encoded': False
+                }
+            
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                execute(cur, 'delist', (item_id, seller_id))
+                item = cur.fetchone()
+                conn.commit()
+                
+                if not item:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Active listing not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'success': True, 'item': item}, default=str),
+                    'isBase64Encoded': False
+                }
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
     finally:
-        if conn:
-            conn.close()
+        release_connection(conn, broken)
     
     return {
         'statusCode': 405,
         'headers': {'Access-Control-Allow-Origin': '*'},
         'body': json.dumps({'error': 'Method not allowed'}),
         'isBase64Encoded': False
-    }
\ No newline at end of file
+    }
+
+
+def parse_limit(params: Dict[str, Any], default: int, maximum: int) -> Optional[int]:
+    '''Разбирает limit из query string: целое, приведенное к диапазону 1..maximum; None, если не число'''
+    try:
+        limit = int(params.get('limit', default))
+    except (TypeError, ValueError):
+        return None
+    return min(max(limit, 1), maximum)
+
+
+def parse_id(value: Any) -> Optional[int]:
+    '''Разбирает идентификатор из query string: положительное целое в пределах INTEGER; None, если нет'''
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if 0 < parsed <= 2147483647 else None
+
+
+def parse_price(value: Any) -> Optional[float]:
+    '''Разбирает цену из тела запроса: конечное число; None, если не число (NaN и бесконечность тоже)'''
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return price if math.isfinite(price) else None
\ No newline at end of file
@@ -0,0 +1,287 @@
+'''
+Каталог горячих запросов маркетплейса.
+
+Каждый запрос определен здесь один раз и при первом использовании на соединении
+подготавливается на сервере (PREPARE); дальше выполняется через EXECUTE без
+повторного разбора, а после нескольких вызовов Postgres переходит на общий план.
+Соединение переиспользуется между вызовами теплого контейнера, поэтому
+подготовленные запросы живут столько же, сколько контейнер.
+
+Соединение и набор подготовленных запросов свои у каждого потока: async_index и
+asgi_app вызывают синхронный обработчик из пула потоков, и общее соединение
+означало бы общую транзакцию, где откат одного запроса отменяет чужое списание.
+
+Именованные PREPARE живут в серверной сессии, а PgBouncer в режиме transaction
+отдает каждую транзакцию любой из своих сессий: EXECUTE попадает туда, где запрос
+не подготовлен. Поэтому за PgBouncer (порт 6432 в DATABASE_URL или DB_PREPARE=0)
+запросы каталога отправляются текстом с приведением параметров к типам каталога;
+DB_PREPARE=1 включает PREPARE явно, например для PgBouncer в режиме session.
+'''
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+import psycopg2
+from psycopg2.extensions import STATUS_READY, parse_dsn
+
+# Исходное изображение (для загруженных продавцом - data: URL до 10 МБ) в ленте и истории
+# отдается, только пока image-worker не сделал миниатюры
+SELLER_HISTORY_SELECT = """
+        SELECT
+            item_id as id,
+            title,
+            price,
+            CASE WHEN thumbs IS NULL THEN image_url END AS image_url,
+            thumb_url,
+            thumbs,
+            category,
+            rarity,
+            is_sold,
+            status,
+            seller_id,
+            created_at,
+            seller_name,
+            buyer_id,
+            buyer_name,
+            sold_at
+        FROM t_p99005675_game_items_marketpla.listing_cards
+        WHERE seller_id = $1
+        ORDER BY created_at DESC
+"""
+
+
+
+def text_timestamp(column: str) -> str:
+    '''SQL-выражение: timestamp строкой как str(datetime) в Python - микросекунды всегда шестью цифрами или без них'''
+    return (
+        f"to_char({column}, 'YYYY-MM-DD HH24:MI:SS') || "
+        f"CASE WHEN EXTRACT(MICROSECONDS FROM {column})::int % 1000000 = 0 THEN '' ELSE to_char({column}, '.US') END"
+    )
+
+
+CATALOG: Dict[str, Tuple[List[str], str]] = {
+    'feed': ([], """
+        SELECT
+            item_id as id,
+            title,
+            price,
+            CASE WHEN thumbs IS NULL THEN image_url END AS image_url,
+            thumb_url,
+            thumbs,
+            category,
+            rarity,
+            is_sold,
+            seller_id,
+            seller_name,
+            seller_sales_count
+        FROM t_p99005675_game_items_marketpla.listing_cards
+        WHERE is_sold = FALSE AND status = 'active'
+            AND (expires_at IS NULL OR expires_at > NOW())
+        ORDER BY created_at DESC
+        LIMIT 5
+    """),
+    'seller_history': (['integer', 'integer'], f"""
+        {SELLER_HISTORY_SELECT}
+        LIMIT $2
+    """),
+    # Большие страницы собираются в JSON на стороне Postgres одной строкой.
+    # Цены и даты приводятся к тексту того же вида, что дает обычный путь (str в Python).
+    # Курсы ($3 валюты, $4 баллов за единицу) передаются из кеша pricing; совпадение округления
+    # с convert_prices проверяет tools/test_price_rounding.py
+    'seller_history_json': (['integer', 'integer', 'text[]', 'numeric[]'], f"""
+        SELECT COALESCE(json_agg(page ORDER BY page.created_at DESC), '[]')::text
+        FROM (
+            SELECT
+                id, title, price::text AS price, image_url, thumb_url, thumbs, category, rarity,
+                is_sold, status, seller_id, {text_timestamp('created_at')} AS created_at, seller_name,
+                buyer_id, buyer_name, {text_timestamp('sold_at')} AS sold_at,
+                (
+                    SELECT COALESCE(json_object_agg(r.currency, ROUND(history.price / r.points_per_unit, 2)::text), '{{}}')
+                    FROM unnest($3, $4) AS r(currency, points_per_unit)
+                ) AS display_prices
+            FROM (
+                {SELLER_HISTORY_SELECT}
+                LIMIT $2
+            ) history
+        ) page
+    """),
+    'insert_item': (['integer', 'varchar', 'text', 'numeric', 'text', 'varchar', 'varchar', 'integer'], """
+        INSERT INTO t_p99005675_game_items_marketpla.items (seller_id, title, description, price, image_url, category, rarity, expires_at)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, NOW() + make_interval(days => $8))
+        RETURNING id, seller_id, title, description, price, image_url, category, rarity, is_sold, status, expires_at
+    """),
+    'insert_image_job': (['integer', 'text'], """
+        INSERT INTO t_p99005675_game_items_marketpla.image_jobs (item_id, source_url)
+        VALUES ($1, $2)
+    """),
+    'item_for_purchase': (['integer'], """
+        SELECT id, seller_id, title, price, is_sold, status, image_url,
+            COALESCE(expires_at <= NOW(), FALSE) AS is_expired
+        FROM t_p99005675_game_items_marketpla.items
+        WHERE id = $1
+        FOR UPDATE
+    """),
+    'buyer_balance': (['integer'], """
+        SELECT balance, is_frozen FROM t_p99005675_game_items_marketpla.users WHERE id = $1
+    """),
+    'debit_buyer': (['numeric', 'integer'], """
+        UPDATE t_p99005675_game_items_marketpla.users
+        SET balance = balance - $1
+        WHERE id = $2
+    """),
+    'credit_seller': (['numeric', 'integer'], """
+        UPDATE t_p99005675_game_items_marketpla.users
+        SET balance = balance + $1
+        WHERE id = $2
+    """),
+    'mark_sold': (['integer'], """
+        UPDATE t_p99005675_game_items_marketpla.items
+        SET is_sold = TRUE, updated_at = NOW()
+        WHERE id = $1
+    """),
+    'insert_purchase': (['integer', 'integer', 'integer', 'numeric'], """
+        INSERT INTO t_p99005675_game_items_marketpla.transactions
+        (buyer_id, seller_id, item_id, amount, transaction_type)
+        VALUES ($1, $2, $3, $4, 'purchase')
+        RETURNING id
+    """),
+    'update_price': (['numeric', 'integer', 'integer'], """
+        UPDATE t_p99005675_game_items_marketpla.items
+        SET price = $1, updated_at = NOW()
+        WHERE id = $2 AND seller_id = $3 AND is_sold = FALSE AND status = 'active'
+            AND (expires_at IS NULL OR expires_at > NOW())
+        RETURNING id, seller_id, title, price, image_url, category, rarity, is_sold, status, expires_at
+    """),
+    'delist': (['integer', 'integer'], """
+        UPDATE t_p99005675_game_items_marketpla.items
+        SET status = 'delisted', updated_at = NOW()
+        WHERE id = $1 AND seller_id = $2 AND is_sold = FALSE AND status = 'active'
+        RETURNING id, status
+    """)
+}
+
+# Соединение, простаивавшее дольше этого, перед выдачей проверяется SELECT 1:
+# сервер мог закрыть его (idle_session_timeout, перезапуск), а psycopg2 узнает об этом только на запросе.
+# 0 - проверять при каждом вызове
+PING_AFTER_SECONDS = float(os.environ.get('DB_PING_AFTER_SECONDS', '30'))
+
+
+def _prepare_enabled() -> bool:
+    '''PREPARE включен, если не задано DB_PREPARE=0 и соединение идет не на порт PgBouncer'''
+    setting = os.environ.get('DB_PREPARE', 'auto')
+    if setting != 'auto':
+        return setting != '0'
+    try:
+        return parse_dsn(os.environ.get('DATABASE_URL') or '').get('port') != '6432'
+    except psycopg2.ProgrammingError:
+        return True
+
+
+def _as_text(types: List[str], sql: str) -> str:
+    '''$1, $2 ... -> именованные параметры psycopg2 с типами из PREPARE, чтобы сервер понял их так же'''
+    sql = sql.replace('%', '%%')
+    if not types:
+        return sql
+    return re.sub(r'\$(\d+)', lambda match: f'(%(p{match.group(1)})s)::{types[int(match.group(1)) - 1]}', sql)
+
+
+PREPARE = _prepare_enabled()
+TEXT_SQL = {name: _as_text(types, sql) for name, (types, sql) in CATALOG.items()}
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {
+    name: {'calls': 0, 'exec_ms': 0.0, 'prepares': 0, 'prepare_ms': 0.0} for name in CATALOG
+}
+
+
+def _connect() -> Any:
+    '''Открывает соединение текущего потока; подготовленные запросы прежнего соединения не переносятся'''
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    _local.conn = conn
+    _local.prepared = set()
+    _local.released_at = time.monotonic()
+    return conn
+
+
+def _alive(conn: Any) -> bool:
+    '''Проверяет, что сервер не закрыл простаивавшее соединение'''
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def get_connection() -> Any:
+    '''Возвращает соединение текущего потока, переподключаясь после закрытия, сбоя или обрыва сервером'''
+    conn = getattr(_local, 'conn', None)
+    if conn is None or conn.closed:
+        return _connect()
+    if time.monotonic() - _local.released_at > PING_AFTER_SECONDS and not _alive(conn):
+        conn.close()
+        return _connect()
+    return conn
+
+
+def release_connection(conn: Any, broken: bool = False) -> None:
+    '''Завершает незакоммиченную транзакцию; сломанное соединение закрывается и будет открыто заново'''
+    _local.released_at = time.monotonic()
+    if broken:
+        try:
+            conn.close()
+        finally:
+            _local.conn = None
+        return
+    if conn.status != STATUS_READY:
+        conn.rollback()
+
+
+def execute(cur: Any, name: str, params: Optional[tuple] = None) -> None:
+    '''Выполняет запрос каталога, подготавливая его на этом соединении при первом вызове (или текстом без PREPARE)'''
+    params = params or ()
+    stats = _stats[name]
+    if not PREPARE:
+        started = time.perf_counter()
+        cur.execute(TEXT_SQL[name], {f'p{index}': value for index, value in enumerate(params, 1)})
+        with _stats_lock:
+            stats['calls'] += 1
+            stats['exec_ms'] += (time.perf_counter() - started) * 1000
+        return
+    if name not in _local.prepared:
+        types, sql = CATALOG[name]
+        started = time.perf_counter()
+        cur.execute(f"PREPARE {name}{'(' + ', '.join(types) + ')' if types else ''} AS {sql}")
+        with _stats_lock:
+            stats['prepares'] += 1
+            stats['prepare_ms'] += (time.perf_counter() - started) * 1000
+        _local.prepared.add(name)
+
+    started = time.perf_counter()
+    if params:
+        cur.execute(f"EXECUTE {name}({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
+    elapsed = (time.perf_counter() - started) * 1000
+    with _stats_lock:
+        stats['calls'] += 1
+        stats['exec_ms'] += elapsed
+
+
+def query_stats(cur: Any) -> Dict[str, Dict[str, Any]]:
+    '''Статистика каталога в этом контейнере вместе с числом общих/частных планов из pg_prepared_statements'''
+    with _stats_lock:
+        result = {name: dict(stats) for name, stats in _stats.items()}
+    # Планы считаются по соединению текущего потока
+    # generic_plans/custom_plans есть в pg_prepared_statements начиная с PostgreSQL 14
+    cur.execute("SELECT name, generic_plans, custom_plans FROM pg_prepared_statements")
+    for name, generic_plans, custom_plans in cur.fetchall():
+        if name in result:
+            result[name]['generic_plans'] = generic_plans
+            result[name]['custom_plans'] = custom_plans
+    for stats in result.values():
+        stats['avg_exec_ms'] = round(stats['exec_ms'] / stats['calls'], 3) if stats['calls'] else None
+    return result
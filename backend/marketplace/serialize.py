@@ -0,0 +1,85 @@
+'''
+Быстрая сериализация списков строк в JSON.
+
+Строки берутся из обычного курсора кортежами. Если установлен orjson, вся страница
+кодируется им за один вызов: Decimal и datetime/date уходят в default=str, поэтому
+результат совпадает с json.dumps(..., default=str) по содержимому - цены и даты
+остаются строками того же вида.
+
+Без orjson строки кодируются по столбцам: кодировщик выбирается один раз на столбец
+по типу значений, а объект собирается подстановкой готовых фрагментов в шаблон
+'{"id":%s,"title":%s,...}', без словаря на строку.
+'''
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from json.encoder import encode_basestring
+from typing import Any, Callable, Dict, List, Sequence
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _encode_any(value: Any) -> str:
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+if orjson is not None:
+    def _encode_any(value: Any) -> str:  # noqa: F811
+        return orjson.dumps(value, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+
+
+def _encode_quoted(value: Any) -> str:
+    # str() у Decimal и datetime не содержит символов, требующих экранирования
+    return f'"{value}"'
+
+
+# Для строк стандартный кодировщик на C быстрее, чем вызов orjson на каждое значение
+ENCODERS: Dict[type, Callable[[Any], str]] = {
+    int: str,
+    float: repr,
+    bool: lambda value: 'true' if value else 'false',
+    str: encode_basestring,
+    Decimal: _encode_quoted,
+    datetime: _encode_quoted,
+    date: _encode_quoted
+}
+
+
+def encode_value(value: Any) -> str:
+    if value is None:
+        return 'null'
+    return ENCODERS.get(type(value), _encode_any)(value)
+
+
+def encode_column(values: List[Any]) -> List[str]:
+    '''Кодирует значения одного столбца; значения другого типа и NULL идут через encode_value'''
+    column_type = next((type(value) for value in values if value is not None), None)
+    encoder = ENCODERS.get(column_type)
+    if encoder is None:
+        return [encode_value(value) for value in values]
+    return [encoder(value) if type(value) is column_type else encode_value(value) for value in values]
+
+
+def encode_rows(columns: Sequence[str], rows: Sequence[tuple]) -> str:
+    '''Кодирует кортежи строк в JSON-массив объектов с ключами columns'''
+    if orjson is None:
+        return encode_rows_by_column(columns, rows)
+    return orjson.dumps(
+        [dict(zip(columns, row)) for row in rows], default=str, option=orjson.OPT_PASSTHROUGH_DATETIME
+    ).decode()
+
+
+def encode_rows_by_column(columns: Sequence[str], rows: Sequence[tuple]) -> str:
+    '''То же без orjson: по столбцам, без словаря на строку'''
+    if not rows:
+        return '[]'
+    template = '{' + ','.join(encode_basestring(name).replace('%', '%%') + ':%s' for name in columns) + '}'
+    encoded = [encode_column([row[i] for row in rows]) for i in range(len(columns))]
+    return '[' + ','.join([template % values for values in zip(*encoded)]) + ']'
+
+
+def cursor_columns(cur: Any) -> List[str]:
+    return [column[0] for column in cur.description]
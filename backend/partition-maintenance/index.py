@@ -0,0 +1,133 @@
+import json
+import os
+from datetime import date
+from typing import Dict, Any, List
+import psycopg2
+
+SCHEMA = 't_p99005675_game_items_marketpla'
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Обслуживание месячных партиций transactions: создание партиций наперед и отсоединение старых.
+              Запускается по расписанию раз в сутки (см. README), запас партиций - TRANSACTIONS_MONTHS_AHEAD месяцев
+    Args: event - dict с httpMethod, body (необязательные months_ahead, retention_months)
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response со списками созданных и отсоединенных партиций
+    '''
+    method: str = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    body_data = json.loads(event.get('body') or '{}')
+    months_ahead = int(body_data.get('months_ahead', os.environ.get('TRANSACTIONS_MONTHS_AHEAD', 24)))
+    retention_months = int(body_data.get('retention_months', os.environ.get('TRANSACTIONS_RETENTION_MONTHS', 0)))
+    
+    conn = None
+    try:
+        dsn = os.environ.get('DATABASE_URL')
+        conn = psycopg2.connect(dsn)
+        # DETACH PARTITION ... CONCURRENTLY нельзя выполнять внутри транзакции
+        conn.autocommit = True
+        
+        today = date.today().replace(day=1)
+        ensured = ensure_partitions(conn, months_ahead)
+        detached = finalize_pending_detaches(conn)
+        if retention_months > 0:
+            detached += detach_old_partitions(conn, add_months(today, -retention_months))
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'ensured': ensured, 'detached': detached}),
+            'isBase64Encoded': False
+        }
+    finally:
+        if conn:
+            conn.close()
+
+
+def add_months(month: date, months: int) -> date:
+    '''Сдвигает первое число месяца на months месяцев'''
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_partitions(conn: Any, months_ahead: int) -> List[str]:
+    '''
+    Создает партиции от текущего месяца на months_ahead месяцев вперед.
+    Месяцы внутри партиции старых данных (V0011) функция возвращает как NULL, они пропускаются
+    '''
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {SCHEMA}.ensure_transactions_partitions(%s)", (months_ahead,))
+        return [row[0] for row in cur.fetchall() if row[0]]
+
+
+def finalize_pending_detaches(conn: Any) -> List[str]:
+    '''
+    Завершает DETACH ... CONCURRENTLY, прерванные на второй транзакции (обрыв соединения, таймаут).
+    Такая партиция остается в состоянии pending detach, и повторный CONCURRENTLY для нее невозможен
+    '''
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_namespace ns ON ns.oid = parent.relnamespace
+            WHERE ns.nspname = %s AND parent.relname = 'transactions' AND pg_inherits.inhdetachpending
+            ORDER BY child.relname
+        """, (SCHEMA,))
+        pending = [row[0] for row in cur.fetchall()]
+        for name in pending:
+            cur.execute(f"ALTER TABLE {SCHEMA}.transactions DETACH PARTITION {SCHEMA}.{name} FINALIZE")
+    return pending
+
+
+def detach_old_partitions(conn: Any, cutoff: date) -> List[str]:
+    '''
+    Отсоединяет партиции, целиком лежащие раньше cutoff. Отсоединенные таблицы
+    остаются в схеме для выгрузки в архив или удаления, запросы к transactions их не видят.
+    '''
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_namespace ns ON ns.oid = parent.relnamespace
+            WHERE ns.nspname = %s AND parent.relname = 'transactions'
+                AND child.relname ~ '^transactions_p[0-9]{{6}}$'
+            ORDER BY child.relname
+        """, (SCHEMA,))
+        partitions = [row[0] for row in cur.fetchall()]
+        
+        detached = []
+        cutoff_name = f'transactions_p{cutoff:%Y%m}'
+        for name in partitions:
+            if name >= cutoff_name:
+                break
+            cur.execute(f"ALTER TABLE {SCHEMA}.transactions DETACH PARTITION {SCHEMA}.{name} CONCURRENTLY")
+            detached.append(name)
+    return detached
@@ -5,6 +5,7 @@ from psycopg2.extras import RealDictCursor
 from typing import Dict, Any
 import hashlib
 import hmac
+from pricing import convert_points, get_rates
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -63,15 +64,24 @@ def create_payment(event: Dict[str, Any]) -> Dict[str, Any]:
         dsn = os.environ.get('DATABASE_URL')
         conn = psycopg2.connect(dsn)
         
+        # Сумма считается до записи платежа: без курса платеж не создается
+        price_rub = convert_points(amount, get_rates(conn), 'RUB')
+        if price_rub is None:
+            return {
+                'statusCode': 500,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'RUB exchange rate is not configured'}),
+                'isBase64Encoded': False
+            }
+        
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 "INSERT INTO t_p99005675_game_items_marketpla.pending_payments (user_id, amount, status) VALUES (%s, %s, %s) RETURNING id",
                 (user_id, amount, 'pending')
             )
+            payment = cur.fetchone()
             conn.commit()
-            payment_id = cur.fetchone()['id']
-            
-            price_rub = amount / 10
+            payment_id = payment['id']
             
             payment_url = f"https://tbank.ru/cf/2bwxNMfSFLa"
             
@@ -85,7 +95,7 @@ def create_payment(event: Dict[str, Any]) -> Dict[str, Any]:
                     'payment_id': payment_id,
                     'payment_url': payment_url,
                     'amount': amount,
-                    'price_rub': price_rub
+                    'price_rub': float(price_rub)
                 }),
                 'isBase64Encoded': False
             }
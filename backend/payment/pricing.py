@@ -0,0 +1,83 @@
+'''
+Пересчет баллов в валюты: цены в ленте, суммы платежей в payment и sbp-payment.
+Курсы берутся из таблицы currency_rates, загружаются один раз на контейнер и
+перечитываются не чаще раза в RATES_TTL_SECONDS.
+Функции разворачиваются каждая из своего каталога, поэтому файл лежит в
+marketplace, payment и sbp-payment и должен оставаться одинаковым во всех трех.
+'''
+import os
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Any, Callable, List, Optional
+
+RATES_TTL_SECONDS = int(os.environ.get('RATES_TTL_SECONDS', 300))
+CENT = Decimal('0.01')
+
+_rates_cache: Dict[str, Any] = {'rates': None, 'loaded_at': 0.0}
+
+
+RATES_QUERY = "SELECT currency, points_per_unit FROM t_p99005675_game_items_marketpla.currency_rates"
+
+
+def _rates_expired() -> bool:
+    return _rates_cache['rates'] is None or time.monotonic() - _rates_cache['loaded_at'] > RATES_TTL_SECONDS
+
+
+def _store_rates(rows: List[Any]) -> Dict[str, Decimal]:
+    _rates_cache['rates'] = {currency: Decimal(rate) for currency, rate in rows}
+    _rates_cache['loaded_at'] = time.monotonic()
+    return _rates_cache['rates']
+
+
+def get_rates(conn: Any) -> Dict[str, Decimal]:
+    '''Возвращает курсы валюта -> баллов за единицу, перечитывая таблицу по истечении TTL'''
+    if _rates_expired():
+        with conn.cursor() as cur:
+            cur.execute(RATES_QUERY)
+            return _store_rates(cur.fetchall())
+    return _rates_cache['rates']
+
+
+def get_rates_cached(connect: Callable[[], Any]) -> Dict[str, Decimal]:
+    '''То же, что get_rates, но соединение открывается только когда кеш устарел'''
+    if _rates_expired():
+        conn = connect()
+        try:
+            return get_rates(conn)
+        finally:
+            conn.close()
+    return _rates_cache['rates']
+
+
+async def get_rates_async(conn: Any) -> Dict[str, Decimal]:
+    '''То же, что get_rates, для соединения asyncpg'''
+    if _rates_expired():
+        return _store_rates(await conn.fetch(RATES_QUERY))
+    return _rates_cache['rates']
+
+
+def convert_prices(prices: List[Decimal], rate: Decimal) -> List[Decimal]:
+    '''Переводит цены страницы одним проходом; округление как у ROUND(numeric, 2) в Postgres'''
+    return [(Decimal(price) / rate).quantize(CENT, rounding=ROUND_HALF_UP) for price in prices]
+
+
+def convert_points(points: Any, rates: Dict[str, Decimal], currency: str) -> Optional[Decimal]:
+    '''Переводит одну сумму в валюту; None, если курса валюты нет'''
+    rate = rates.get(currency)
+    return convert_prices([points], rate)[0] if rate is not None else None
+
+
+def display_prices(prices: List[Decimal], rates: Dict[str, Decimal], currencies: List[str]) -> List[Dict[str, Decimal]]:
+    '''Возвращает для каждой цены страницы словарь {валюта: цена} по запрошенным валютам'''
+    currencies = [currency for currency in currencies if currency in rates]
+    columns = {currency: convert_prices(prices, rates[currency]) for currency in currencies}
+    return [
+        {currency: columns[currency][index] for currency in currencies}
+        for index in range(len(prices))
+    ]
+
+
+def add_display_prices(items: List[Dict[str, Any]], rates: Dict[str, Decimal], currencies: List[str]) -> None:
+    '''Добавляет каждому предмету display_prices {валюта: цена} для запрошенных валют'''
+    for item, prices in zip(items, display_prices([item['price'] for item in items], rates, currencies)):
+        item['display_prices'] = prices
@@ -0,0 +1,114 @@
+import json
+import os
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from typing import Dict, Any
+
+CREDIT_PENDING_BONUSES = """
+    WITH batch AS (
+        SELECT id
+        FROM t_p99005675_game_items_marketpla.referrals
+        WHERE credited_at IS NULL
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ),
+    credited AS (
+        UPDATE t_p99005675_game_items_marketpla.referrals r
+        SET credited_at = NOW()
+        FROM batch
+        WHERE r.id = batch.id
+        RETURNING r.referrer_id, r.bonus_amount
+    ),
+    totals AS (
+        SELECT referrer_id, SUM(bonus_amount) AS bonus, COUNT(*) AS referrals_count
+        FROM credited
+        WHERE referrer_id IS NOT NULL
+        GROUP BY referrer_id
+    ),
+    balances AS (
+        UPDATE t_p99005675_game_items_marketpla.users u
+        SET balance = u.balance + totals.bonus
+        FROM totals
+        WHERE u.id = totals.referrer_id
+        RETURNING u.id
+    ),
+    ledger AS (
+        INSERT INTO t_p99005675_game_items_marketpla.transactions (buyer_id, amount, transaction_type)
+        SELECT referrer_id, bonus, 'referral_bonus'
+        FROM totals
+        RETURNING id
+    )
+    SELECT
+        (SELECT COUNT(*) FROM credited) AS referrals_credited,
+        (SELECT COUNT(*) FROM balances) AS referrers_credited,
+        (SELECT COALESCE(SUM(bonus), 0) FROM totals) AS total_bonus,
+        (SELECT COUNT(*) FROM ledger) AS transactions_created
+"""
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Пакетное начисление реферальных бонусов одним set-based запросом за запуск
+    Args: event - dict с httpMethod, body (необязательный batch_size)
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response с количеством начисленных рефералов и суммой бонусов
+    '''
+    method: str = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    body_data = json.loads(event.get('body') or '{}')
+    batch_size = int(body_data.get('batch_size', os.environ.get('REFERRAL_BATCH_SIZE', 1000000)))
+    
+    if batch_size <= 0:
+        return {
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'batch_size must be positive'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = None
+    try:
+        dsn = os.environ.get('DATABASE_URL')
+        conn = psycopg2.connect(dsn)
+        
+        # Бонус помечается credited_at в той же транзакции, что и зачисление на баланс,
+        # поэтому повторный запуск не начислит его второй раз; SKIP LOCKED позволяет
+        # параллельным запускам брать непересекающиеся пачки.
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(CREDIT_PENDING_BONUSES, (batch_size,))
+            result = cur.fetchone()
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps(result, default=str),
+                'isBase64Encoded': False
+            }
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,361 @@
+import bisect
+import heapq
+import json
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+import psycopg2
+from psycopg2.extras import execute_values
+
+SCHEMA = 't_p99005675_game_items_marketpla'
+
+WINDOW = timedelta(seconds=int(os.environ.get('RISK_WINDOW_SECONDS', 86400)))
+VELOCITY_WINDOW = timedelta(seconds=int(os.environ.get('RISK_VELOCITY_SECONDS', 3600)))
+VELOCITY_LIMIT = int(os.environ.get('RISK_VELOCITY_LIMIT', 20))
+CONCENTRATION_MIN_VOLUME = float(os.environ.get('RISK_CONCENTRATION_MIN_VOLUME', 1000))
+FLAG_SCORE = 0.5
+HOLD_SCORE = 0.7
+BATCH_SIZE = 10000
+# created_at - время начала транзакции: строка с меньшим created_at может закоммититься позже
+# уже прочитанных. Потоки читаются до начала самой старой открытой транзакции, но не дольше
+# этого срока: транзакции, открытые дольше, не задерживают оценку, и их строки будут пропущены
+LATE_COMMIT = timedelta(seconds=int(os.environ.get('RISK_LATE_COMMIT_SECONDS', 300)))
+
+# Событие: (поток, id, пользователь, контрагент, сумма, тип, created_at, баланс после вывода)
+STREAMS = {
+    'transactions': f"SELECT id, buyer_id, seller_id, amount, transaction_type, created_at, NULL::numeric FROM {SCHEMA}.transactions",
+    'withdrawals': f"SELECT id, user_id, NULL::integer, amount, 'withdraw', created_at, balance_after FROM {SCHEMA}.withdrawals"
+}
+
+# Позиция потока: (created_at, id) последнего обработанного события в порядке (created_at, id)
+Marks = Dict[str, Tuple[Optional[datetime], int]]
+
+# Окно признаков живет между вызовами теплого контейнера вместе с позицией потоков,
+# до которой оно построено. Если позиция в базе другая (ее продвинул другой экземпляр
+# или прошлый вызов не закоммитился), окно строится заново из последних WINDOW событий
+STATE: Dict[str, Any] = {'users': {}, 'marks': None}
+
+
+class UserWindow:
+    '''Скользящее окно событий пользователя с инкрементально поддерживаемыми суммами'''
+    __slots__ = ('events', 'recent', 'volumes', 'sold_to', 'top', 'trade_volume', 'topups', 'withdrawn')
+
+    def __init__(self) -> None:
+        self.events: deque = deque()
+        self.recent: deque = deque()
+        # Оборот с каждым контрагентом (покупки и продажи вместе) и отдельно продажи
+        self.volumes: Dict[int, float] = {}
+        self.sold_to: Dict[int, float] = {}
+        # Куча (-оборот, контрагент) для самого крупного контрагента; записи с устаревшим
+        # оборотом отбрасываются при чтении, куча пересобирается, когда их становится много
+        self.top: List[Tuple[float, int]] = []
+        self.trade_volume = 0.0
+        self.topups = 0.0
+        self.withdrawn = 0.0
+
+    def add(self, ts: datetime, kind: str, amount: float, counterpart: Optional[int]) -> None:
+        if self.recent and ts < self.recent[-1]:
+            # Событие из прошлого встает на свое место: вытеснение снимает события с головы
+            # очереди и рассчитывает на порядок по времени
+            bisect.insort(self.events, (ts, kind, amount, counterpart), key=lambda event: event[0])
+            bisect.insort(self.recent, ts)
+        else:
+            self.events.append((ts, kind, amount, counterpart))
+            self.recent.append(ts)
+        self._apply(kind, amount, counterpart, 1)
+
+    def evict(self, now: datetime) -> None:
+        horizon = now - WINDOW
+        while self.events and self.events[0][0] < horizon:
+            _, kind, amount, counterpart = self.events.popleft()
+            self._apply(kind, amount, counterpart, -1)
+        velocity_horizon = now - VELOCITY_WINDOW
+        while self.recent and self.recent[0] < velocity_horizon:
+            self.recent.popleft()
+
+    def _apply(self, kind: str, amount: float, counterpart: Optional[int], sign: int) -> None:
+        if kind == 'buy' or kind == 'sell':
+            if kind == 'sell':
+                add_to(self.sold_to, counterpart, sign * amount)
+            volume = add_to(self.volumes, counterpart, sign * amount)
+            if volume:
+                heapq.heappush(self.top, (-volume, counterpart))
+                if len(self.top) > 2 * len(self.volumes) + 16:
+                    self.top = [(-left, other) for other, left in self.volumes.items()]
+                    heapq.heapify(self.top)
+            self.trade_volume += sign * amount
+        elif kind == 'top_up':
+            self.topups += sign * amount
+        elif kind == 'withdraw':
+            self.withdrawn += sign * amount
+
+    def concentration(self) -> float:
+        '''Доля оборота с самым крупным контрагентом'''
+        if self.trade_volume < CONCENTRATION_MIN_VOLUME:
+            return 0.0
+        while self.top:
+            volume, counterpart = self.top[0]
+            if self.volumes.get(counterpart) == -volume:
+                return -volume / self.trade_volume
+            heapq.heappop(self.top)
+        return 0.0
+
+
+def add_to(book: Dict[int, float], counterpart: int, delta: float) -> float:
+    '''Меняет сумму по контрагенту; обнулившуюся запись удаляет. Возвращает новую сумму'''
+    left = book.get(counterpart, 0.0) + delta
+    if left > 0.005:
+        book[counterpart] = left
+        return left
+    book.pop(counterpart, None)
+    return 0.0
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Потоковая оценка риска: инкрементально читает новые транзакции и выводы, ведет скользящие признаки по пользователям и помечает или задерживает подозрительные выводы
+    Args: event - dict с httpMethod
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response с количеством обработанных событий, флагов и задержанных выводов
+    '''
+    method: str = event.get('httpMethod', 'POST')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    conn = None
+    try:
+        dsn = os.environ.get('DATABASE_URL')
+        conn = psycopg2.connect(dsn)
+        result = run_scoring(conn)
+
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps(result),
+            'isBase64Encoded': False
+        }
+    finally:
+        if conn:
+            conn.close()
+
+
+def window_for(user_id: int) -> UserWindow:
+    users = STATE['users']
+    window = users.get(user_id)
+    if window is None:
+        window = users[user_id] = UserWindow()
+    return window
+
+
+def read_horizon(cur: Any) -> datetime:
+    '''
+    Граница чтения потоков: начало самой старой открытой транзакции клиента. Все строки
+    с created_at раньше нее уже закоммичены, поэтому позиция не перескочит поздний коммит
+    '''
+    cur.execute("""
+        SELECT GREATEST(COALESCE(MIN(xact_start), clock_timestamp()), clock_timestamp() - %s)::timestamp
+        FROM pg_stat_activity
+        WHERE datname = current_database() AND backend_type = 'client backend'
+            AND pid <> pg_backend_pid() AND xact_start IS NOT NULL
+    """, (LATE_COMMIT,))
+    return cur.fetchone()[0]
+
+
+def fetch_events(cur: Any, marks: Marks, horizon: datetime) -> List[tuple]:
+    '''
+    Читает новые события обоих потоков после их позиций и до horizon, упорядоченные по времени.
+    Ограничение по created_at позволяет отсечь старые партиции transactions.
+    '''
+    events: List[tuple] = []
+    limited = []
+    for stream, select in STREAMS.items():
+        last_ts, last_id = marks[stream]
+        since = last_ts or datetime(1970, 1, 1)
+        cur.execute(f"""
+            {select}
+            WHERE created_at >= %s AND (created_at, id) > (%s, %s) AND created_at < %s
+            ORDER BY created_at, id
+            LIMIT %s
+        """, (since, since, last_id, horizon, BATCH_SIZE))
+        rows = cur.fetchall()
+        events += [(stream,) + row for row in rows]
+        if len(rows) == BATCH_SIZE:
+            limited.append((stream, rows[-1][5]))
+    events.sort(key=lambda e: (e[6], e[0], e[1]))
+
+    # Если поток уперся в лимит, события другого потока позже его последнего события
+    # откладываются до следующего вызова, чтобы окна получали события по порядку времени
+    for stream, cutoff in limited:
+        events = [e for e in events if e[0] == stream or e[6] <= cutoff]
+    return events
+
+
+def replay_events(cur: Any, marks: Marks, since: datetime) -> List[tuple]:
+    '''Обработанные события обоих потоков от since до их позиций, упорядоченные по времени'''
+    events: List[tuple] = []
+    for stream, select in STREAMS.items():
+        last_ts, last_id = marks[stream]
+        if last_ts is None:
+            continue
+        cur.execute(f"""
+            {select}
+            WHERE created_at >= %s AND (created_at, id) <= (%s, %s)
+            ORDER BY created_at, id
+        """, (since, last_ts, last_id))
+        events += [(stream,) + row for row in cur.fetchall()]
+    events.sort(key=lambda e: (e[6], e[0], e[1]))
+    return events
+
+
+def load_watermarks(cur: Any) -> Marks:
+    cur.execute(f"SELECT stream, last_id, last_created_at FROM {SCHEMA}.risk_scoring_state")
+    marks: Marks = {stream: (None, 0) for stream in STREAMS}
+    for stream, last_id, last_created_at in cur.fetchall():
+        marks[stream] = (last_created_at, last_id)
+    return marks
+
+
+def warm_up(cur: Any, marks: Marks) -> None:
+    '''Строит окна заново до позиции marks, проигрывая обработанные события без оценки'''
+    STATE['users'] = {}
+    latest = max((ts for ts, _ in marks.values() if ts), default=None)
+    if latest is not None:
+        for ev in replay_events(cur, marks, latest - WINDOW):
+            apply_event(ev)
+    STATE['marks'] = marks
+
+
+def apply_event(ev: tuple) -> None:
+    '''Обновляет окна участников события'''
+    stream, _, user_id, counterpart, amount, kind, ts, _ = ev
+    amount = float(amount)
+    if stream == 'withdrawals':
+        window_for(user_id).add(ts, 'withdraw', amount, None)
+    elif kind == 'purchase' and user_id and counterpart:
+        window_for(user_id).add(ts, 'buy', amount, counterpart)
+        window_for(counterpart).add(ts, 'sell', amount, user_id)
+    elif kind == 'top_up' and user_id:
+        window_for(user_id).add(ts, 'top_up', amount, None)
+
+
+def score_purchase(buyer: UserWindow, seller_id: int) -> Tuple[float, List[str]]:
+    '''Оценка покупки: частота операций, встречная торговля и концентрация на одном контрагенте'''
+    score = 0.0
+    reasons = []
+    if len(buyer.recent) > VELOCITY_LIMIT:
+        score += 0.3
+        reasons.append('velocity')
+    if seller_id in buyer.sold_to:
+        score += 0.4
+        reasons.append('wash_trading')
+    if buyer.concentration() >= 0.8:
+        score += 0.3
+        reasons.append('counterpart_concentration')
+    return score, reasons
+
+
+def score_withdrawal(user: UserWindow, amount: float, balance_after: float) -> Tuple[float, List[str]]:
+    '''Оценка вывода: цикл пополнение->вывод, вывод почти всего баланса, частота и концентрация'''
+    score = 0.0
+    reasons = []
+    if user.topups > 0 and user.withdrawn >= 0.8 * user.topups and user.trade_volume < 0.1 * user.topups:
+        score += 0.4
+        reasons.append('topup_withdraw_cycle')
+    if amount >= 0.9 * (amount + max(balance_after, 0.0)):
+        score += 0.2
+        reasons.append('balance_drain')
+    if len(user.recent) > VELOCITY_LIMIT:
+        score += 0.2
+        reasons.append('velocity')
+    if user.concentration() >= 0.8:
+        score += 0.3
+        reasons.append('counterpart_concentration')
+    return score, reasons
+
+
+def run_scoring(conn: Any) -> Dict[str, int]:
+    '''Обрабатывает следующую порцию событий и сохраняет флаги, задержки и позицию потоков'''
+    with conn.cursor() as cur:
+        marks = load_watermarks(cur)
+        if STATE['marks'] != marks:
+            warm_up(cur, marks)
+        # До коммита окна опережают позицию в базе
+        STATE['marks'] = None
+        events = fetch_events(cur, marks, read_horizon(cur))
+
+        # Баланс на момент вывода хранится в заявке; текущий нужен только заявкам до V0024
+        withdrawal_users = list({ev[2] for ev in events if ev[0] == 'withdrawals' and ev[7] is None})
+        balances: Dict[int, float] = {}
+        if withdrawal_users:
+            cur.execute(f"SELECT id, balance FROM {SCHEMA}.users WHERE id = ANY(%s)", (withdrawal_users,))
+            balances = {user_id: float(balance) for user_id, balance in cur.fetchall()}
+
+        flags = []
+        holds = []
+        new_marks: Marks = dict(marks)
+        for ev in events:
+            stream, source_id, user_id, counterpart, amount, kind, ts, balance_after = ev
+            for participant in (user_id, counterpart):
+                if participant:
+                    window_for(participant).evict(ts)
+            apply_event(ev)
+
+            if stream == 'withdrawals':
+                balance = float(balance_after) if balance_after is not None else balances.get(user_id, 0.0)
+                score, reasons = score_withdrawal(window_for(user_id), float(amount), balance)
+                if score >= HOLD_SCORE:
+                    holds.append(source_id)
+                if score >= FLAG_SCORE:
+                    action = 'hold' if score >= HOLD_SCORE else 'flag'
+                    flags.append((user_id, 'withdrawal', source_id, round(score, 2), ','.join(reasons), action))
+            elif kind == 'purchase' and user_id and counterpart:
+                score, reasons = score_purchase(window_for(user_id), counterpart)
+                if score >= FLAG_SCORE:
+                    flags.append((user_id, 'transaction', source_id, round(score, 2), ','.join(reasons), 'flag'))
+
+            new_marks[stream] = (ts, source_id)
+
+        if flags:
+            execute_values(
+                cur,
+                f"INSERT INTO {SCHEMA}.risk_flags (user_id, source, source_id, score, reasons, action) VALUES %s",
+                flags
+            )
+        if holds:
+            cur.execute(
+                f"UPDATE {SCHEMA}.withdrawals SET status = 'on_hold' WHERE id = ANY(%s) AND status = 'pending'",
+                (holds,)
+            )
+        execute_values(
+            cur,
+            f"""INSERT INTO {SCHEMA}.risk_scoring_state (stream, last_id, last_created_at) VALUES %s
+                ON CONFLICT (stream) DO UPDATE SET last_id = EXCLUDED.last_id, last_created_at = EXCLUDED.last_created_at""",
+            [(stream, last_id, last_ts) for stream, (last_ts, last_id) in new_marks.items()]
+        )
+        conn.commit()
+        STATE['marks'] = new_marks
+
+    return {'events': len(events), 'flags': len(flags), 'held': len(holds)}
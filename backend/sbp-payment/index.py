@@ -1,13 +1,22 @@
 import json
+import os
 import uuid
 import io
 import base64
-from typing import Dict, Any
+from decimal import Decimal
+from typing import Dict, Any, Optional
+import psycopg2
+from pricing import convert_points, get_rates_cached
 try:
     import qrcode
 except ImportError:
     qrcode = None
 
+def points_to_rubles(amount: float) -> Optional[Decimal]:
+    '''Пересчитывает баллы в рубли по кешированному курсу; к БД обращается только при устаревшем кеше'''
+    rates = get_rates_cached(lambda: psycopg2.connect(os.environ.get('DATABASE_URL')))
+    return convert_points(amount, rates, 'RUB')
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Generate СБП QR code for payment to card 2200700628083809
@@ -53,8 +62,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Invalid amount'})
             }
         
+        rubles = points_to_rubles(amount)
+        if rubles is None:
+            return {
+                'statusCode': 500,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'error': 'RUB exchange rate is not configured'})
+            }
+        rubles = float(rubles)
+        
         payment_id = str(uuid.uuid4())
-        rubles = amount / 10
         recipient_card = '2200700628083809'
         
         sbp_url = f"https://qr.nspk.ru/AD10003H7CH2FNNHH0QGFMVHQ26LO3I5?type=02&bank=100000000111&sum={rubles}&cur=RUB&crc=B68B"
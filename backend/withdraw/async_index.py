@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Any
+import asyncpg
+import psycopg2
+from psycopg2.extensions import parse_dsn
+from index import handler as sync_handler, parse_id, parse_limit, JSON_AGG_THRESHOLD
+
+# Ключ - сам цикл, а не id(loop): id цикла завершившегося потока может достаться новому
+_pools: Dict[asyncio.AbstractEventLoop, Any] = {}
+_local = threading.local()
+
+
+def statement_cache_size() -> int:
+    '''
+    Кеш именованных подготовленных запросов asyncpg; за PgBouncer в режиме transaction
+    (порт 6432 в DATABASE_URL или DB_PREPARE=0) выключен, как PREPARE в marketplace/queries.py
+    '''
+    setting = os.environ.get('DB_PREPARE', 'auto')
+    if setting == 'auto':
+        try:
+            setting = '0' if parse_dsn(os.environ.get('DATABASE_URL') or '').get('port') == '6432' else '1'
+        except psycopg2.ProgrammingError:
+            setting = '1'
+    return 0 if setting == '0' else 100
+
+
+async def get_pool() -> Any:
+    '''Пул asyncpg на каждый цикл событий; asyncpg кеширует подготовленные запросы на соединение'''
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = await asyncpg.create_pool(
+            os.environ.get('DATABASE_URL'),
+            min_size=1,
+            max_size=int(os.environ.get('ASYNC_POOL_SIZE', 10)),
+            statement_cache_size=statement_cache_size()
+        )
+        _pools[loop] = pool
+    return pool
+
+
+def respond(status_code: int, body: Any) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(body, default=str),
+        'isBase64Encoded': False
+    }
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Совместимая точка входа handler(event, context) для асинхронного режима.
+    Цикл событий и его пул свои у каждого потока: один цикл нельзя запускать из двух потоков сразу
+    '''
+    loop = getattr(_local, 'loop', None)
+    if loop is None:
+        loop = _local.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(handler_async(event, context))
+
+
+async def handler_async(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Асинхронный вариант API вывода балов на asyncpg
+    Args: event - dict с httpMethod, body, queryStringParameters
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response в том же формате, что и синхронный handler
+    '''
+    method: str = event.get('httpMethod', 'POST')
+
+    if method == 'POST':
+        body_data = json.loads(event.get('body') or '{}')
+        user_id = int(body_data.get('user_id', 1))
+        amount = float(body_data.get('amount', 0))
+        payment_method = body_data.get('payment_method', 'card')
+        payment_details = body_data.get('payment_details', '')
+
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            # Проверка баланса, списание и создание заявки - один запрос
+            row = await conn.fetchrow("""
+                WITH target AS (
+                    SELECT id, balance, is_frozen FROM users WHERE id = $1
+                ),
+                debited AS (
+                    UPDATE users SET balance = balance - $2
+                    WHERE id = $1 AND balance >= $2 AND is_frozen = FALSE
+                    RETURNING id, balance
+                ),
+                withdrawal AS (
+                    INSERT INTO withdrawals (user_id, amount, payment_method, payment_details, status, balance_after)
+                    SELECT id, $2, $3, $4, 'pending', balance FROM debited
+                    RETURNING id, amount, status, created_at
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM target) AS user_found,
+                    (SELECT is_frozen FROM target) AS is_frozen,
+                    w.id, w.amount, w.status, w.created_at
+                FROM (SELECT 1) AS one
+                LEFT JOIN withdrawal w ON TRUE
+            """, user_id, amount, payment_method, payment_details)
+
+        if not row['user_found']:
+            return respond(404, {'error': 'User not found'})
+        if row['is_frozen']:
+            return respond(403, {'error': 'Account is frozen'})
+        if row['id'] is None:
+            return respond(400, {'error': 'Insufficient balance'})
+        return respond(200, {
+            'id': row['id'],
+            'amount': row['amount'],
+            'status': row['status'],
+            'created_at': row['created_at']
+        })
+
+    if method == 'GET':
+        params = event.get('queryStringParameters') or {}
+        user_id = parse_id(params.get('user_id', '1'))
+        if user_id is None:
+            return respond(400, {'error': 'user_id must be an integer'})
+        limit = parse_limit(params, 10, 1000)
+        if limit is None:
+            return respond(400, {'error': 'limit must be an integer'})
+        # Большие страницы собирает в JSON сам Postgres, этот путь есть только у синхронного handler
+        if limit > JSON_AGG_THRESHOLD:
+            return await asyncio.get_running_loop().run_in_executor(None, sync_handler, event, context)
+
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                """SELECT id, amount, status, payment_method, created_at, processed_at
+                   FROM withdrawals WHERE user_id = $1 ORDER BY created_at DESC LIMIT $2""",
+                user_id, limit
+            )
+        return respond(200, {'withdrawals': [dict(row) for row in rows]})
+
+    return await asyncio.get_running_loop().run_in_executor(None, sync_handler, event, context)
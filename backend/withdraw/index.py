@@ -2,7 +2,10 @@ import json
 import os
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+# Страницы истории выводов больше порога собираются в JSON самим Postgres (json_agg), как в marketplace
+JSON_AGG_THRESHOLD = 200
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -40,7 +43,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             payment_details = body_data.get('payment_details', '')
             
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
+                cur.execute("SELECT balance, is_frozen FROM users WHERE id = %s", (user_id,))
                 user = cur.fetchone()
                 
                 if not user:
@@ -51,6 +54,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
+                if user['is_frozen']:
+                    return {
+                        'statusCode': 403,
+                        'headers': {'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Account is frozen'}),
+                        'isBase64Encoded': False
+                    }
+                
                 current_balance = float(user['balance'])
                 
                 if current_balance < amount:
@@ -62,15 +73,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     }
                 
                 cur.execute(
-                    "UPDATE users SET balance = balance - %s WHERE id = %s",
+                    "UPDATE users SET balance = balance - %s WHERE id = %s RETURNING balance",
                     (amount, user_id)
                 )
+                balance_after = cur.fetchone()['balance']
                 
                 cur.execute(
-                    """INSERT INTO withdrawals (user_id, amount, payment_method, payment_details, status)
-                       VALUES (%s, %s, %s, %s, %s)
+                    """INSERT INTO withdrawals (user_id, amount, payment_method, payment_details, status, balance_after)
+                       VALUES (%s, %s, %s, %s, %s, %s)
                        RETURNING id, amount, status, created_at""",
-                    (user_id, amount, payment_method, payment_details, 'pending')
+                    (user_id, amount, payment_method, payment_details, 'pending', balance_after)
                 )
                 
                 withdrawal = cur.fetchone()
@@ -88,15 +100,51 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         elif method == 'GET':
             params = event.get('queryStringParameters', {})
-            user_id = params.get('user_id', '1')
+            user_id = parse_id(params.get('user_id', '1'))
+            if user_id is None:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'user_id must be an integer'}),
+                    'isBase64Encoded': False
+                }
+            
+            limit = parse_limit(params, 10, 1000)
+            if limit is None:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'limit must be an integer'}),
+                    'isBase64Encoded': False
+                }
             
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(
-                    """SELECT id, amount, status, payment_method, created_at, processed_at
-                       FROM withdrawals WHERE user_id = %s ORDER BY created_at DESC LIMIT 10""",
-                    (user_id,)
-                )
-                withdrawals = cur.fetchall()
+                if limit <= JSON_AGG_THRESHOLD:
+                    cur.execute(
+                        """SELECT id, amount, status, payment_method, created_at, processed_at
+                           FROM withdrawals WHERE user_id = %s ORDER BY created_at DESC LIMIT %s""",
+                        (user_id, limit)
+                    )
+                    withdrawals = json.dumps(cur.fetchall(), default=str)
+                else:
+                    # JSON-массив собирается в Postgres: без словаря на строку и default=str в Python.
+                    # Суммы и даты приводятся к тексту того же вида, что дает json.dumps(default=str):
+                    # у ::text нет завершающих нулей микросекунд, у str(datetime) они есть
+                    cur.execute(
+                        """SELECT COALESCE(json_agg(w ORDER BY w.created_at DESC), '[]')::text AS withdrawals
+                           FROM (
+                               SELECT id, amount::text AS amount, status, payment_method,
+                                      to_char(created_at, 'YYYY-MM-DD HH24:MI:SS') || CASE
+                                          WHEN EXTRACT(MICROSECONDS FROM created_at)::int %% 1000000 = 0 THEN ''
+                                          ELSE to_char(created_at, '.US') END AS created_at,
+                                      to_char(processed_at, 'YYYY-MM-DD HH24:MI:SS') || CASE
+                                          WHEN EXTRACT(MICROSECONDS FROM processed_at)::int %% 1000000 = 0 THEN ''
+                                          ELSE to_char(processed_at, '.US') END AS processed_at
+                               FROM withdrawals WHERE user_id = %s ORDER BY created_at DESC LIMIT %s
+                           ) w""",
+                        (user_id, limit)
+                    )
+                    withdrawals = cur.fetchone()['withdrawals']
                 
                 return {
                     'statusCode': 200,
@@ -104,7 +152,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'Content-Type': 'application/json',
                         'Access-Control-Allow-Origin': '*'
                     },
-                    'body': json.dumps({'withdrawals': withdrawals}, default=str),
+                    'body': '{"withdrawals":' + withdrawals + '}',
                     'isBase64Encoded': False
                 }
     finally:
@@ -117,3 +165,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'body': json.dumps({'error': 'Method not allowed'}),
         'isBase64Encoded': False
     }
+
+
+def parse_limit(params: Dict[str, Any], default: int, maximum: int) -> Optional[int]:
+    '''Разбирает limit из query string: целое, приведенное к диапазону 1..maximum; None, если не число'''
+    try:
+        limit = int(params.get('limit', default))
+    except (TypeError, ValueError):
+        return None
+    return min(max(limit, 1), maximum)
+
+
+def parse_id(value: Any) -> Optional[int]:
+    '''Разбирает идентификатор из query string: положительное целое в пределах INTEGER; None, если нет'''
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if 0 < parsed <= 2147483647 else None
@@ -0,0 +1,9 @@
+-- Отметка о начислении реферального бонуса
+ALTER TABLE t_p99005675_game_items_marketpla.referrals
+ADD COLUMN IF NOT EXISTS credited_at TIMESTAMP;
+
+-- Пользователь может быть приглашен только один раз
+CREATE UNIQUE INDEX IF NOT EXISTS idx_referrals_referred_id ON t_p99005675_game_items_marketpla.referrals(referred_id);
+
+-- Частичный индекс по еще не начисленным бонусам для пакетного начисления
+CREATE INDEX IF NOT EXISTS idx_referrals_pending ON t_p99005675_game_items_marketpla.referrals(id) WHERE credited_at IS NULL;
@@ -0,0 +1,137 @@
+-- Счетчик продаж продавца, поддерживается триггером на transactions
+ALTER TABLE t_p99005675_game_items_marketpla.users
+ADD COLUMN IF NOT EXISTS sales_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE t_p99005675_game_items_marketpla.users u
+SET sales_count = s.cnt
+FROM (
+    SELECT seller_id, COUNT(*) AS cnt
+    FROM t_p99005675_game_items_marketpla.transactions
+    WHERE transaction_type = 'purchase'
+    GROUP BY seller_id
+) s
+WHERE u.id = s.seller_id;
+
+-- Денормализованные карточки объявлений: поля предмета + продавец + покупатель,
+-- чтобы лента и история продавца читались из одной таблицы без JOIN
+CREATE TABLE IF NOT EXISTS t_p99005675_game_items_marketpla.listing_cards (
+    item_id INTEGER PRIMARY KEY,
+    seller_id INTEGER,
+    title VARCHAR(255) NOT NULL,
+    price DECIMAL(10, 2) NOT NULL,
+    image_url TEXT,
+    category VARCHAR(100),
+    rarity VARCHAR(50),
+    is_sold BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP,
+    seller_name VARCHAR(100),
+    seller_sales_count INTEGER NOT NULL DEFAULT 0,
+    buyer_id INTEGER,
+    buyer_name VARCHAR(100),
+    sold_at TIMESTAMP
+);
+
+INSERT INTO t_p99005675_game_items_marketpla.listing_cards
+    (item_id, seller_id, title, price, image_url, category, rarity, is_sold, created_at,
+     seller_name, seller_sales_count, buyer_id, buyer_name, sold_at)
+SELECT
+    i.id, i.seller_id, i.title, i.price, i.image_url, i.category, i.rarity, i.is_sold, i.created_at,
+    u.username, COALESCE(u.sales_count, 0), t.buyer_id, buyer.username, t.created_at
+FROM t_p99005675_game_items_marketpla.items i
+LEFT JOIN t_p99005675_game_items_marketpla.users u ON u.id = i.seller_id
+LEFT JOIN LATERAL (
+    SELECT buyer_id, created_at
+    FROM t_p99005675_game_items_marketpla.transactions
+    WHERE item_id = i.id AND transaction_type = 'purchase'
+    ORDER BY created_at DESC
+    LIMIT 1
+) t ON TRUE
+LEFT JOIN t_p99005675_game_items_marketpla.users buyer ON buyer.id = t.buyer_id
+ON CONFLICT (item_id) DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS idx_listing_cards_feed ON t_p99005675_game_items_marketpla.listing_cards(created_at DESC) WHERE is_sold = FALSE;
+CREATE INDEX IF NOT EXISTS idx_listing_cards_seller ON t_p99005675_game_items_marketpla.listing_cards(seller_id, created_at DESC);
+
+-- items -> listing_cards
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_item()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM t_p99005675_game_items_marketpla.listing_cards WHERE item_id = OLD.id;
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO t_p99005675_game_items_marketpla.listing_cards
+        (item_id, seller_id, title, price, image_url, category, rarity, is_sold, created_at,
+         seller_name, seller_sales_count)
+    SELECT NEW.id, NEW.seller_id, NEW.title, NEW.price, NEW.image_url, NEW.category, NEW.rarity,
+           NEW.is_sold, NEW.created_at, u.username, COALESCE(u.sales_count, 0)
+    FROM (SELECT 1) AS one
+    LEFT JOIN t_p99005675_game_items_marketpla.users u ON u.id = NEW.seller_id
+    ON CONFLICT (item_id) DO UPDATE SET
+        seller_id = EXCLUDED.seller_id,
+        title = EXCLUDED.title,
+        price = EXCLUDED.price,
+        image_url = EXCLUDED.image_url,
+        category = EXCLUDED.category,
+        rarity = EXCLUDED.rarity,
+        is_sold = EXCLUDED.is_sold,
+        created_at = EXCLUDED.created_at,
+        seller_name = EXCLUDED.seller_name,
+        seller_sales_count = EXCLUDED.seller_sales_count;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_items_listing_card ON t_p99005675_game_items_marketpla.items;
+CREATE TRIGGER trg_items_listing_card
+AFTER INSERT OR UPDATE OR DELETE ON t_p99005675_game_items_marketpla.items
+FOR EACH ROW EXECUTE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_item();
+
+-- users -> listing_cards (имя и счетчик продаж продавца)
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_cards_from_user()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE t_p99005675_game_items_marketpla.listing_cards
+    SET seller_name = NEW.username, seller_sales_count = NEW.sales_count
+    WHERE seller_id = NEW.id;
+
+    IF NEW.username IS DISTINCT FROM OLD.username THEN
+        UPDATE t_p99005675_game_items_marketpla.listing_cards
+        SET buyer_name = NEW.username
+        WHERE buyer_id = NEW.id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_listing_cards ON t_p99005675_game_items_marketpla.users;
+CREATE TRIGGER trg_users_listing_cards
+AFTER UPDATE OF username, sales_count ON t_p99005675_game_items_marketpla.users
+FOR EACH ROW
+WHEN (NEW.username IS DISTINCT FROM OLD.username OR NEW.sales_count IS DISTINCT FROM OLD.sales_count)
+EXECUTE FUNCTION t_p99005675_game_items_marketpla.sync_listing_cards_from_user();
+
+-- transactions -> users.sales_count и покупатель в карточке
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_purchase()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE t_p99005675_game_items_marketpla.users
+    SET sales_count = sales_count + 1
+    WHERE id = NEW.seller_id;
+
+    UPDATE t_p99005675_game_items_marketpla.listing_cards c
+    SET buyer_id = NEW.buyer_id,
+        buyer_name = (SELECT username FROM t_p99005675_game_items_marketpla.users WHERE id = NEW.buyer_id),
+        sold_at = NEW.created_at
+    WHERE c.item_id = NEW.item_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_transactions_listing_card ON t_p99005675_game_items_marketpla.transactions;
+CREATE TRIGGER trg_transactions_listing_card
+AFTER INSERT ON t_p99005675_game_items_marketpla.transactions
+FOR EACH ROW
+WHEN (NEW.transaction_type = 'purchase')
+EXECUTE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_purchase();
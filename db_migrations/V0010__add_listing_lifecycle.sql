@@ -0,0 +1,85 @@
+-- Жизненный цикл объявления: active -> delisted/expired, срок жизни и время последнего изменения
+ALTER TABLE t_p99005675_game_items_marketpla.items
+ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'active',
+ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP,
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+UPDATE t_p99005675_game_items_marketpla.items i
+SET updated_at = COALESCE(c.sold_at, i.created_at)
+FROM t_p99005675_game_items_marketpla.listing_cards c
+WHERE c.item_id = i.id;
+
+CREATE INDEX IF NOT EXISTS idx_items_expiry ON t_p99005675_game_items_marketpla.items(expires_at)
+WHERE status = 'active' AND is_sold = FALSE AND expires_at IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_items_archivable ON t_p99005675_game_items_marketpla.items(updated_at)
+WHERE is_sold = TRUE OR status <> 'active';
+
+-- Статус в карточках, лента показывает только активные объявления
+ALTER TABLE t_p99005675_game_items_marketpla.listing_cards
+ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'active',
+ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP;
+
+-- Индекс ленты с новым условием строится онлайн под временным именем, старый удаляется
+-- и новый переименовывается одной короткой транзакцией: лента ни минуты не остается без индекса
+CREATE INDEX IF NOT EXISTS idx_listing_cards_feed_active ON t_p99005675_game_items_marketpla.listing_cards(created_at DESC)
+WHERE is_sold = FALSE AND status = 'active';
+
+DROP INDEX IF EXISTS t_p99005675_game_items_marketpla.idx_listing_cards_feed;
+ALTER INDEX IF EXISTS t_p99005675_game_items_marketpla.idx_listing_cards_feed_active RENAME TO idx_listing_cards_feed;
+
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_item()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM t_p99005675_game_items_marketpla.listing_cards WHERE item_id = OLD.id;
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO t_p99005675_game_items_marketpla.listing_cards
+        (item_id, seller_id, title, price, image_url, category, rarity, is_sold, created_at,
+         seller_name, seller_sales_count, status, expires_at)
+    SELECT NEW.id, NEW.seller_id, NEW.title, NEW.price, NEW.image_url, NEW.category, NEW.rarity,
+           NEW.is_sold, NEW.created_at, u.username, COALESCE(u.sales_count, 0), NEW.status, NEW.expires_at
+    FROM (SELECT 1) AS one
+    LEFT JOIN t_p99005675_game_items_marketpla.users u ON u.id = NEW.seller_id
+    ON CONFLICT (item_id) DO UPDATE SET
+        seller_id = EXCLUDED.seller_id,
+        title = EXCLUDED.title,
+        price = EXCLUDED.price,
+        image_url = EXCLUDED.image_url,
+        category = EXCLUDED.category,
+        rarity = EXCLUDED.rarity,
+        is_sold = EXCLUDED.is_sold,
+        created_at = EXCLUDED.created_at,
+        seller_name = EXCLUDED.seller_name,
+        seller_sales_count = EXCLUDED.seller_sales_count,
+        status = EXCLUDED.status,
+        expires_at = EXCLUDED.expires_at;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Проданные предметы переносятся в архив, история покупок остается в transactions
+ALTER TABLE t_p99005675_game_items_marketpla.transactions DROP CONSTRAINT IF EXISTS transactions_item_id_fkey;
+
+-- Архив объявлений, партиционированный по месяцу архивации
+CREATE TABLE IF NOT EXISTS t_p99005675_game_items_marketpla.items_archive (
+    id INTEGER NOT NULL,
+    seller_id INTEGER,
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    price DECIMAL(10, 2) NOT NULL,
+    image_url TEXT,
+    category VARCHAR(100),
+    rarity VARCHAR(50),
+    is_sold BOOLEAN,
+    status VARCHAR(20),
+    created_at TIMESTAMP,
+    expires_at TIMESTAMP,
+    updated_at TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, archived_at)
+) PARTITION BY RANGE (archived_at);
+
+CREATE INDEX IF NOT EXISTS idx_items_archive_seller ON t_p99005675_game_items_marketpla.items_archive(seller_id);
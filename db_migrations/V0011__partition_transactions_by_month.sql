@@ -0,0 +1,133 @@
+-- Создает месячную партицию transactions, если ее еще нет.
+-- Используется миграцией и задачей partition-maintenance.
+-- Месяц, уже покрытый партицией старых данных (см. ниже), пропускается: возвращается NULL
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.ensure_transactions_partition(p_month DATE)
+RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_month)::DATE;
+    partition_name TEXT := 'transactions_p' || to_char(month_start, 'YYYYMM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS t_p99005675_game_items_marketpla.%I PARTITION OF t_p99005675_game_items_marketpla.transactions FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, (month_start + INTERVAL '1 month')::DATE
+    );
+    RETURN partition_name;
+EXCEPTION WHEN invalid_object_definition THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Старая таблица не копируется, а целиком становится партицией новой: все, что читает
+-- ее строки, выполняется до переименования без блокировки записи, а под ACCESS EXCLUSIVE
+-- остается только короткая замена в конце. Ключ партиционирования не может быть NULL
+UPDATE t_p99005675_game_items_marketpla.transactions
+SET created_at = CURRENT_TIMESTAMP
+WHERE created_at IS NULL;
+
+-- Индексы партиции строятся онлайн (CONCURRENTLY, см. tools/migrate.py) и при ATTACH
+-- присоединяются к индексам новой таблицы вместо построения под блокировкой
+CREATE UNIQUE INDEX IF NOT EXISTS transactions_legacy_id_created_at
+ON t_p99005675_game_items_marketpla.transactions (id, created_at);
+
+-- Граница партиции старых данных - начало месяца после следующего: вставки,
+-- идущие до замены, даже на стыке месяцев в нее попадают. NOT VALID не сканирует таблицу
+DO $$
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE t_p99005675_game_items_marketpla.transactions ADD CONSTRAINT transactions_legacy_range CHECK (created_at IS NOT NULL AND created_at < %L) NOT VALID',
+        (date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '2 months')::TIMESTAMP
+    );
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS transactions_legacy_buyer
+ON t_p99005675_game_items_marketpla.transactions (buyer_id, created_at);
+
+-- Проверка сканирует таблицу под SHARE UPDATE EXCLUSIVE: чтение и запись продолжаются.
+-- Проверенное ограничение позволяет SET NOT NULL и ATTACH PARTITION обойтись без скана
+ALTER TABLE t_p99005675_game_items_marketpla.transactions VALIDATE CONSTRAINT transactions_legacy_range;
+
+CREATE INDEX IF NOT EXISTS transactions_legacy_seller
+ON t_p99005675_game_items_marketpla.transactions (seller_id, created_at);
+
+CREATE INDEX IF NOT EXISTS transactions_legacy_item
+ON t_p99005675_game_items_marketpla.transactions (item_id);
+
+-- Замена одной транзакцией: только каталог, без чтения строк.
+-- Старая таблица получает имя месячной партиции своего последнего месяца, поэтому
+-- partition-maintenance отсоединит ее, когда этот месяц выйдет за срок хранения
+DROP TRIGGER IF EXISTS trg_transactions_listing_card ON t_p99005675_game_items_marketpla.transactions;
+ALTER TABLE t_p99005675_game_items_marketpla.transactions ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE t_p99005675_game_items_marketpla.transactions DROP CONSTRAINT transactions_pkey;
+ALTER TABLE t_p99005675_game_items_marketpla.transactions
+ADD CONSTRAINT transactions_legacy_pkey PRIMARY KEY USING INDEX transactions_legacy_id_created_at;
+ALTER SEQUENCE t_p99005675_game_items_marketpla.transactions_id_seq OWNED BY NONE;
+
+DO $$
+DECLARE
+    legacy_end TIMESTAMP;
+BEGIN
+    SELECT substring(pg_get_constraintdef(c.oid) FROM '''([^'']+)''')::TIMESTAMP
+    INTO legacy_end
+    FROM pg_constraint c
+    WHERE c.conrelid = 't_p99005675_game_items_marketpla.transactions'::regclass
+        AND c.conname = 'transactions_legacy_range';
+
+    EXECUTE format(
+        'ALTER TABLE t_p99005675_game_items_marketpla.transactions RENAME TO %I',
+        'transactions_p' || to_char(legacy_end - INTERVAL '1 month', 'YYYYMM')
+    );
+END;
+$$;
+
+CREATE TABLE t_p99005675_game_items_marketpla.transactions (
+    id INTEGER NOT NULL DEFAULT nextval('t_p99005675_game_items_marketpla.transactions_id_seq'),
+    buyer_id INTEGER REFERENCES t_p99005675_game_items_marketpla.users(id),
+    seller_id INTEGER REFERENCES t_p99005675_game_items_marketpla.users(id),
+    item_id INTEGER,
+    amount DECIMAL(10, 2) NOT NULL,
+    transaction_type VARCHAR(50),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_buyer ON t_p99005675_game_items_marketpla.transactions(buyer_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_seller ON t_p99005675_game_items_marketpla.transactions(seller_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_item ON t_p99005675_game_items_marketpla.transactions(item_id);
+
+-- Старые данные - партиция до границы ограничения, дальше месячные партиции на три месяца вперед.
+-- DEFAULT-партиция не создается: с ней невозможен DETACH ... CONCURRENTLY
+DO $$
+DECLARE
+    legacy_name TEXT;
+    legacy_end TIMESTAMP;
+    month_start DATE;
+BEGIN
+    SELECT cl.relname, substring(pg_get_constraintdef(c.oid) FROM '''([^'']+)''')::TIMESTAMP
+    INTO legacy_name, legacy_end
+    FROM pg_constraint c
+    JOIN pg_class cl ON cl.oid = c.conrelid
+    WHERE cl.relnamespace = 't_p99005675_game_items_marketpla'::regnamespace
+        AND c.conname = 'transactions_legacy_range';
+
+    EXECUTE format(
+        'ALTER TABLE t_p99005675_game_items_marketpla.transactions ATTACH PARTITION t_p99005675_game_items_marketpla.%I FOR VALUES FROM (MINVALUE) TO (%L)',
+        legacy_name, legacy_end
+    );
+
+    month_start := legacy_end::DATE;
+    WHILE month_start <= (date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '3 months')::DATE LOOP
+        PERFORM t_p99005675_game_items_marketpla.ensure_transactions_partition(month_start);
+        month_start := (month_start + INTERVAL '1 month')::DATE;
+    END LOOP;
+END;
+$$;
+
+ALTER SEQUENCE t_p99005675_game_items_marketpla.transactions_id_seq OWNED BY t_p99005675_game_items_marketpla.transactions.id;
+
+-- Триггер карточек объявлений остался на старой таблице и снят перед заменой
+CREATE TRIGGER trg_transactions_listing_card
+AFTER INSERT ON t_p99005675_game_items_marketpla.transactions
+FOR EACH ROW
+WHEN (NEW.transaction_type = 'purchase')
+EXECUTE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_purchase();
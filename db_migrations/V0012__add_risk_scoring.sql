@@ -0,0 +1,28 @@
+-- Флаги подозрительной активности от потоковой оценки риска
+CREATE TABLE IF NOT EXISTS t_p99005675_game_items_marketpla.risk_flags (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES t_p99005675_game_items_marketpla.users(id),
+    source VARCHAR(20) NOT NULL,
+    source_id INTEGER NOT NULL,
+    score NUMERIC(4, 2) NOT NULL,
+    reasons TEXT NOT NULL,
+    action VARCHAR(20) NOT NULL DEFAULT 'flag',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_risk_flags_user_id ON t_p99005675_game_items_marketpla.risk_flags(user_id, created_at DESC);
+
+-- Позиция потоковой оценки риска в transactions и withdrawals
+CREATE TABLE IF NOT EXISTS t_p99005675_game_items_marketpla.risk_scoring_state (
+    stream VARCHAR(50) PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    last_created_at TIMESTAMP
+);
+
+INSERT INTO t_p99005675_game_items_marketpla.risk_scoring_state (stream, last_id, last_created_at)
+SELECT 'transactions', COALESCE(MAX(id), 0), MAX(created_at) FROM t_p99005675_game_items_marketpla.transactions
+ON CONFLICT (stream) DO NOTHING;
+
+INSERT INTO t_p99005675_game_items_marketpla.risk_scoring_state (stream, last_id, last_created_at)
+SELECT 'withdrawals', COALESCE(MAX(id), 0), MAX(created_at) FROM t_p99005675_game_items_marketpla.withdrawals
+ON CONFLICT (stream) DO NOTHING;
@@ -0,0 +1,59 @@
+-- Миниатюры изображений объявлений: адрес по хешу содержимого исходного изображения
+ALTER TABLE t_p99005675_game_items_marketpla.items
+ADD COLUMN IF NOT EXISTS image_hash VARCHAR(64),
+ADD COLUMN IF NOT EXISTS thumb_url TEXT;
+
+ALTER TABLE t_p99005675_game_items_marketpla.listing_cards
+ADD COLUMN IF NOT EXISTS thumb_url TEXT;
+
+-- Очередь загрузки изображений и генерации миниатюр
+CREATE TABLE IF NOT EXISTS t_p99005675_game_items_marketpla.image_jobs (
+    id SERIAL PRIMARY KEY,
+    item_id INTEGER NOT NULL,
+    source_url TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_jobs_pending ON t_p99005675_game_items_marketpla.image_jobs(id) WHERE status = 'pending';
+
+-- Существующие объявления тоже получают миниатюры
+INSERT INTO t_p99005675_game_items_marketpla.image_jobs (item_id, source_url)
+SELECT id, image_url FROM t_p99005675_game_items_marketpla.items
+WHERE image_url IS NOT NULL AND image_url <> '' AND is_sold = FALSE AND status = 'active';
+
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_item()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM t_p99005675_game_items_marketpla.listing_cards WHERE item_id = OLD.id;
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO t_p99005675_game_items_marketpla.listing_cards
+        (item_id, seller_id, title, price, image_url, category, rarity, is_sold, created_at,
+         seller_name, seller_sales_count, status, expires_at, thumb_url)
+    SELECT NEW.id, NEW.seller_id, NEW.title, NEW.price, NEW.image_url, NEW.category, NEW.rarity,
+           NEW.is_sold, NEW.created_at, u.username, COALESCE(u.sales_count, 0), NEW.status, NEW.expires_at, NEW.thumb_url
+    FROM (SELECT 1) AS one
+    LEFT JOIN t_p99005675_game_items_marketpla.users u ON u.id = NEW.seller_id
+    ON CONFLICT (item_id) DO UPDATE SET
+        seller_id = EXCLUDED.seller_id,
+        title = EXCLUDED.title,
+        price = EXCLUDED.price,
+        image_url = EXCLUDED.image_url,
+        category = EXCLUDED.category,
+        rarity = EXCLUDED.rarity,
+        is_sold = EXCLUDED.is_sold,
+        created_at = EXCLUDED.created_at,
+        seller_name = EXCLUDED.seller_name,
+        seller_sales_count = EXCLUDED.seller_sales_count,
+        status = EXCLUDED.status,
+        expires_at = EXCLUDED.expires_at,
+        thumb_url = EXCLUDED.thumb_url;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,10 @@
+-- Курсы пересчета баллов в валюты: сколько баллов стоит одна единица валюты
+CREATE TABLE IF NOT EXISTS t_p99005675_game_items_marketpla.currency_rates (
+    currency VARCHAR(3) PRIMARY KEY,
+    points_per_unit NUMERIC(12, 4) NOT NULL CHECK (points_per_unit > 0),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO t_p99005675_game_items_marketpla.currency_rates (currency, points_per_unit) VALUES
+    ('RUB', 10.0000)
+ON CONFLICT (currency) DO NOTHING;
@@ -0,0 +1,23 @@
+-- Роль пользователя для JWT (user/admin) и заморозка баланса модератором
+ALTER TABLE t_p99005675_game_items_marketpla.users ADD COLUMN IF NOT EXISTS role VARCHAR(20) NOT NULL DEFAULT 'user';
+ALTER TABLE t_p99005675_game_items_marketpla.users ADD COLUMN IF NOT EXISTS is_frozen BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE t_p99005675_game_items_marketpla.users ADD COLUMN IF NOT EXISTS frozen_at TIMESTAMP;
+
+-- Массовое снятие объявлений продавца без полного прохода по items
+CREATE INDEX IF NOT EXISTS idx_items_seller_active ON t_p99005675_game_items_marketpla.items(seller_id)
+    WHERE is_sold = FALSE AND status = 'active';
+
+-- Журнал действий администраторов: одна запись на вызов с идентификаторами затронутых строк
+CREATE TABLE IF NOT EXISTS t_p99005675_game_items_marketpla.admin_audit_log (
+    id SERIAL PRIMARY KEY,
+    admin_id INTEGER NOT NULL REFERENCES t_p99005675_game_items_marketpla.users(id),
+    action VARCHAR(50) NOT NULL,
+    reason TEXT,
+    params JSONB NOT NULL DEFAULT '{}',
+    affected_count INTEGER NOT NULL DEFAULT 0,
+    target_ids INTEGER[] NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_admin_audit_log_created_at ON t_p99005675_game_items_marketpla.admin_audit_log(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_admin_audit_log_admin_id ON t_p99005675_game_items_marketpla.admin_audit_log(admin_id, created_at DESC);
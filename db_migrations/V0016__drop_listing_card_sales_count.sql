@@ -0,0 +1,58 @@
+-- Счетчик продаж больше не копируется в карточки: каждая покупка переписывала
+-- все карточки продавца. Лента берет users.sales_count по seller_id (JOIN на 5 строк)
+DROP TRIGGER IF EXISTS trg_users_listing_cards ON t_p99005675_game_items_marketpla.users;
+
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_cards_from_user()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE t_p99005675_game_items_marketpla.listing_cards
+    SET seller_name = NEW.username
+    WHERE seller_id = NEW.id;
+
+    UPDATE t_p99005675_game_items_marketpla.listing_cards
+    SET buyer_name = NEW.username
+    WHERE buyer_id = NEW.id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Только смена имени, она редкая; sales_count обновляется без каскада
+CREATE TRIGGER trg_users_listing_cards
+AFTER UPDATE OF username ON t_p99005675_game_items_marketpla.users
+FOR EACH ROW
+WHEN (NEW.username IS DISTINCT FROM OLD.username)
+EXECUTE FUNCTION t_p99005675_game_items_marketpla.sync_listing_cards_from_user();
+
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_item()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM t_p99005675_game_items_marketpla.listing_cards WHERE item_id = OLD.id;
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO t_p99005675_game_items_marketpla.listing_cards
+        (item_id, seller_id, title, price, image_url, category, rarity, is_sold, created_at,
+         seller_name, status, expires_at, thumb_url)
+    SELECT NEW.id, NEW.seller_id, NEW.title, NEW.price, NEW.image_url, NEW.category, NEW.rarity,
+           NEW.is_sold, NEW.created_at, u.username, NEW.status, NEW.expires_at, NEW.thumb_url
+    FROM (SELECT 1) AS one
+    LEFT JOIN t_p99005675_game_items_marketpla.users u ON u.id = NEW.seller_id
+    ON CONFLICT (item_id) DO UPDATE SET
+        seller_id = EXCLUDED.seller_id,
+        title = EXCLUDED.title,
+        price = EXCLUDED.price,
+        image_url = EXCLUDED.image_url,
+        category = EXCLUDED.category,
+        rarity = EXCLUDED.rarity,
+        is_sold = EXCLUDED.is_sold,
+        created_at = EXCLUDED.created_at,
+        seller_name = EXCLUDED.seller_name,
+        status = EXCLUDED.status,
+        expires_at = EXCLUDED.expires_at,
+        thumb_url = EXCLUDED.thumb_url;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE t_p99005675_game_items_marketpla.listing_cards DROP COLUMN IF EXISTS seller_sales_count;
@@ -0,0 +1,51 @@
+-- Архиватор удаляет строку из items после переноса в items_archive. Карточка при этом
+-- остается: история продавца читает listing_cards и не должна терять проданные предметы.
+-- Архиватор выставляет SET LOCAL marketplace.archiving = 'on' в транзакции пачки
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_item()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF current_setting('marketplace.archiving', true) IS DISTINCT FROM 'on' THEN
+            DELETE FROM t_p99005675_game_items_marketpla.listing_cards WHERE item_id = OLD.id;
+        END IF;
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO t_p99005675_game_items_marketpla.listing_cards
+        (item_id, seller_id, title, price, image_url, category, rarity, is_sold, created_at,
+         seller_name, status, expires_at, thumb_url)
+    SELECT NEW.id, NEW.seller_id, NEW.title, NEW.price, NEW.image_url, NEW.category, NEW.rarity,
+           NEW.is_sold, NEW.created_at, u.username, NEW.status, NEW.expires_at, NEW.thumb_url
+    FROM (SELECT 1) AS one
+    LEFT JOIN t_p99005675_game_items_marketpla.users u ON u.id = NEW.seller_id
+    ON CONFLICT (item_id) DO UPDATE SET
+        seller_id = EXCLUDED.seller_id,
+        title = EXCLUDED.title,
+        price = EXCLUDED.price,
+        image_url = EXCLUDED.image_url,
+        category = EXCLUDED.category,
+        rarity = EXCLUDED.rarity,
+        is_sold = EXCLUDED.is_sold,
+        created_at = EXCLUDED.created_at,
+        seller_name = EXCLUDED.seller_name,
+        status = EXCLUDED.status,
+        expires_at = EXCLUDED.expires_at,
+        thumb_url = EXCLUDED.thumb_url;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Карточки, удаленные архиватором до этой миграции, восстанавливаются из архива
+INSERT INTO t_p99005675_game_items_marketpla.listing_cards
+    (item_id, seller_id, title, price, image_url, category, rarity, is_sold, created_at,
+     seller_name, status, expires_at, buyer_id, buyer_name, sold_at)
+SELECT DISTINCT ON (a.id)
+    a.id, a.seller_id, a.title, a.price, a.image_url, a.category, a.rarity, a.is_sold, a.created_at,
+    seller.username, a.status, a.expires_at, t.buyer_id, buyer.username, t.created_at
+FROM t_p99005675_game_items_marketpla.items_archive a
+LEFT JOIN t_p99005675_game_items_marketpla.users seller ON seller.id = a.seller_id
+LEFT JOIN t_p99005675_game_items_marketpla.transactions t
+    ON t.item_id = a.id AND t.transaction_type = 'purchase'
+LEFT JOIN t_p99005675_game_items_marketpla.users buyer ON buyer.id = t.buyer_id
+ORDER BY a.id, a.archived_at DESC
+ON CONFLICT (item_id) DO NOTHING;
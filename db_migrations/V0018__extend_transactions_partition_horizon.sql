@@ -0,0 +1,17 @@
+-- Партиции transactions создаются на 24 месяца вперед: если partition-maintenance
+-- перестанет запускаться, вставки продолжат работать еще два года.
+-- DEFAULT-партиция по-прежнему не создается, чтобы старые месяцы отсоединялись CONCURRENTLY
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.ensure_transactions_partitions(p_months_ahead INTEGER)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', CURRENT_TIMESTAMP)::DATE;
+BEGIN
+    FOR offset_months IN 0..p_months_ahead LOOP
+        RETURN NEXT t_p99005675_game_items_marketpla.ensure_transactions_partition(
+            (month_start + make_interval(months => offset_months))::DATE
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT t_p99005675_game_items_marketpla.ensure_transactions_partitions(24);
@@ -0,0 +1,24 @@
+-- Оценка риска читает потоки по created_at с перекрытием: транзакция с меньшим id может
+-- закоммититься позже. recent_ids - уже обработанные id внутри перекрытия, чтобы не учесть их дважды
+ALTER TABLE t_p99005675_game_items_marketpla.risk_scoring_state
+ADD COLUMN IF NOT EXISTS recent_ids INTEGER[] NOT NULL DEFAULT '{}';
+
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON t_p99005675_game_items_marketpla.transactions(created_at);
+CREATE INDEX IF NOT EXISTS idx_withdrawals_created_at ON t_p99005675_game_items_marketpla.withdrawals(created_at);
+
+-- События перекрытия до текущей позиции уже обработаны прежней версией по id
+UPDATE t_p99005675_game_items_marketpla.risk_scoring_state s
+SET recent_ids = ARRAY(
+    SELECT t.id FROM t_p99005675_game_items_marketpla.transactions t
+    WHERE t.id <= s.last_id AND t.created_at >= s.last_created_at - INTERVAL '5 minutes'
+    ORDER BY t.id
+)
+WHERE s.stream = 'transactions' AND s.last_created_at IS NOT NULL;
+
+UPDATE t_p99005675_game_items_marketpla.risk_scoring_state s
+SET recent_ids = ARRAY(
+    SELECT w.id FROM t_p99005675_game_items_marketpla.withdrawals w
+    WHERE w.id <= s.last_id AND w.created_at >= s.last_created_at - INTERVAL '5 minutes'
+    ORDER BY w.id
+)
+WHERE s.stream = 'withdrawals' AND s.last_created_at IS NOT NULL;
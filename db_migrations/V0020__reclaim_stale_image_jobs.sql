@@ -0,0 +1,23 @@
+-- Время захвата задания воркером: задания, зависшие в processing после падения воркера,
+-- забираются повторно по истечении IMAGE_JOB_TIMEOUT_SECONDS
+ALTER TABLE t_p99005675_game_items_marketpla.image_jobs ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP;
+
+UPDATE t_p99005675_game_items_marketpla.image_jobs SET claimed_at = CURRENT_TIMESTAMP WHERE status = 'processing';
+
+CREATE INDEX IF NOT EXISTS idx_image_jobs_claimed ON t_p99005675_game_items_marketpla.image_jobs(claimed_at)
+WHERE status = 'processing';
+
+-- Относительные адреса /thumbnails/... из временного каталога воркера никто не раздает:
+-- миниатюры сбрасываются и генерируются заново в хранилище с абсолютным IMAGE_BASE_URL
+UPDATE t_p99005675_game_items_marketpla.items
+SET thumb_url = NULL, image_hash = NULL
+WHERE thumb_url IS NOT NULL AND thumb_url !~ '^https?://';
+
+INSERT INTO t_p99005675_game_items_marketpla.image_jobs (item_id, source_url)
+SELECT id, image_url FROM t_p99005675_game_items_marketpla.items
+WHERE thumb_url IS NULL AND image_url IS NOT NULL AND image_url <> ''
+    AND is_sold = FALSE AND status = 'active'
+    AND NOT EXISTS (
+        SELECT 1 FROM t_p99005675_game_items_marketpla.image_jobs j
+        WHERE j.item_id = items.id AND j.status IN ('pending', 'processing')
+    );
@@ -0,0 +1,52 @@
+-- Счетчик продаж снова хранится в карточке, чтобы лента читала одну таблицу без JOIN users.
+-- Покупка по-прежнему меняет только users.sales_count; в активные карточки продавца
+-- значение переносит listing-archiver пачками продавцов (sync_sales_counts), поэтому
+-- покупка не переписывает карточки, а счетчик в ленте отстает не больше чем на интервал задачи.
+-- users.listed_sales_count - значение, уже перенесенное в карточки; у продавцов с продажами
+-- оно пока 0, так что существующие карточки заполнит первый запуск задачи
+ALTER TABLE t_p99005675_game_items_marketpla.listing_cards
+ADD COLUMN IF NOT EXISTS seller_sales_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE t_p99005675_game_items_marketpla.users
+ADD COLUMN IF NOT EXISTS listed_sales_count INTEGER NOT NULL DEFAULT 0;
+
+-- Новая или снова активная карточка сразу получает текущий счетчик продавца
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_item()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF current_setting('marketplace.archiving', true) IS DISTINCT FROM 'on' THEN
+            DELETE FROM t_p99005675_game_items_marketpla.listing_cards WHERE item_id = OLD.id;
+        END IF;
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO t_p99005675_game_items_marketpla.listing_cards
+        (item_id, seller_id, title, price, image_url, category, rarity, is_sold, created_at,
+         seller_name, seller_sales_count, status, expires_at, thumb_url)
+    SELECT NEW.id, NEW.seller_id, NEW.title, NEW.price, NEW.image_url, NEW.category, NEW.rarity,
+           NEW.is_sold, NEW.created_at, u.username, COALESCE(u.sales_count, 0), NEW.status, NEW.expires_at, NEW.thumb_url
+    FROM (SELECT 1) AS one
+    LEFT JOIN t_p99005675_game_items_marketpla.users u ON u.id = NEW.seller_id
+    ON CONFLICT (item_id) DO UPDATE SET
+        seller_id = EXCLUDED.seller_id,
+        title = EXCLUDED.title,
+        price = EXCLUDED.price,
+        image_url = EXCLUDED.image_url,
+        category = EXCLUDED.category,
+        rarity = EXCLUDED.rarity,
+        is_sold = EXCLUDED.is_sold,
+        created_at = EXCLUDED.created_at,
+        seller_name = EXCLUDED.seller_name,
+        seller_sales_count = EXCLUDED.seller_sales_count,
+        status = EXCLUDED.status,
+        expires_at = EXCLUDED.expires_at,
+        thumb_url = EXCLUDED.thumb_url;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Перенос счетчика затрагивает только активные карточки продавца
+CREATE INDEX IF NOT EXISTS idx_listing_cards_seller_active
+ON t_p99005675_game_items_marketpla.listing_cards (seller_id)
+WHERE is_sold = FALSE AND status = 'active';
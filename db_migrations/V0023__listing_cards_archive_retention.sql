@@ -0,0 +1,59 @@
+-- Карточки архивированных предметов (V0017) больше не хранятся вечно: триггер отмечает
+-- момент архивации, а listing-archiver удаляет карточки старше LISTING_CARD_RETENTION_DAYS.
+-- История продавца показывает проданное за этот срок, сами предметы остаются в items_archive
+ALTER TABLE t_p99005675_game_items_marketpla.listing_cards
+ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_item()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF current_setting('marketplace.archiving', true) = 'on' THEN
+            UPDATE t_p99005675_game_items_marketpla.listing_cards
+            SET archived_at = NOW()
+            WHERE item_id = OLD.id;
+        ELSE
+            DELETE FROM t_p99005675_game_items_marketpla.listing_cards WHERE item_id = OLD.id;
+        END IF;
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO t_p99005675_game_items_marketpla.listing_cards
+        (item_id, seller_id, title, price, image_url, category, rarity, is_sold, created_at,
+         seller_name, seller_sales_count, status, expires_at, thumb_url)
+    SELECT NEW.id, NEW.seller_id, NEW.title, NEW.price, NEW.image_url, NEW.category, NEW.rarity,
+           NEW.is_sold, NEW.created_at, u.username, COALESCE(u.sales_count, 0), NEW.status, NEW.expires_at, NEW.thumb_url
+    FROM (SELECT 1) AS one
+    LEFT JOIN t_p99005675_game_items_marketpla.users u ON u.id = NEW.seller_id
+    ON CONFLICT (item_id) DO UPDATE SET
+        seller_id = EXCLUDED.seller_id,
+        title = EXCLUDED.title,
+        price = EXCLUDED.price,
+        image_url = EXCLUDED.image_url,
+        category = EXCLUDED.category,
+        rarity = EXCLUDED.rarity,
+        is_sold = EXCLUDED.is_sold,
+        created_at = EXCLUDED.created_at,
+        seller_name = EXCLUDED.seller_name,
+        seller_sales_count = EXCLUDED.seller_sales_count,
+        status = EXCLUDED.status,
+        expires_at = EXCLUDED.expires_at,
+        thumb_url = EXCLUDED.thumb_url;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE INDEX IF NOT EXISTS idx_listing_cards_archived_at
+ON t_p99005675_game_items_marketpla.listing_cards (archived_at)
+WHERE archived_at IS NOT NULL;
+
+-- Карточки, уже оставленные архиватором, получают дату архивации предмета
+UPDATE t_p99005675_game_items_marketpla.listing_cards c
+SET archived_at = a.archived_at
+FROM (
+    SELECT id, MAX(archived_at) AS archived_at
+    FROM t_p99005675_game_items_marketpla.items_archive
+    GROUP BY id
+) a
+WHERE a.id = c.item_id AND c.archived_at IS NULL
+    AND NOT EXISTS (SELECT 1 FROM t_p99005675_game_items_marketpla.items i WHERE i.id = c.item_id);
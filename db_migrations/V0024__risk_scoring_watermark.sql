@@ -0,0 +1,24 @@
+-- Баланс пользователя сразу после списания вывода: оценка риска сравнивает сумму вывода
+-- с балансом на момент заявки, а не с текущим. У старых заявок NULL - для них берется текущий
+ALTER TABLE t_p99005675_game_items_marketpla.withdrawals
+ADD COLUMN IF NOT EXISTS balance_after DECIMAL(10, 2);
+
+-- Позиция потока оценки риска - пара (last_created_at, last_id) последнего обработанного события
+-- в порядке (created_at, id). Поток читается только до начала самой старой открытой транзакции,
+-- поэтому список обработанных id внутри перекрытия больше не нужен.
+-- Последним обработанным считается наибольший id с временем last_created_at
+UPDATE t_p99005675_game_items_marketpla.risk_scoring_state s
+SET last_id = COALESCE((
+    SELECT MAX(t.id) FROM t_p99005675_game_items_marketpla.transactions t
+    WHERE t.created_at = s.last_created_at
+), s.last_id)
+WHERE s.stream = 'transactions' AND s.last_created_at IS NOT NULL;
+
+UPDATE t_p99005675_game_items_marketpla.risk_scoring_state s
+SET last_id = COALESCE((
+    SELECT MAX(w.id) FROM t_p99005675_game_items_marketpla.withdrawals w
+    WHERE w.created_at = s.last_created_at
+), s.last_id)
+WHERE s.stream = 'withdrawals' AND s.last_created_at IS NOT NULL;
+
+ALTER TABLE t_p99005675_game_items_marketpla.risk_scoring_state DROP COLUMN IF EXISTS recent_ids;
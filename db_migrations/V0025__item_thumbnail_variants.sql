@@ -0,0 +1,90 @@
+-- Все варианты миниатюр предмета: {"card": {"webp": ..., "jpg": ...}, "small": {"webp": ..., "jpg": ...}}.
+-- Лента берет card, списки (история продаж) - small, jpg - запасной формат для браузеров без WebP.
+-- thumb_url (card/webp) остается для клиентов, которые читают только его
+ALTER TABLE t_p99005675_game_items_marketpla.items
+ADD COLUMN IF NOT EXISTS thumbs JSONB;
+
+ALTER TABLE t_p99005675_game_items_marketpla.listing_cards
+ADD COLUMN IF NOT EXISTS thumbs JSONB;
+
+-- Архив сохраняет хеш исходника и миниатюры: сами файлы в хранилище остаются
+ALTER TABLE t_p99005675_game_items_marketpla.items_archive
+ADD COLUMN IF NOT EXISTS image_hash VARCHAR(64),
+ADD COLUMN IF NOT EXISTS thumb_url TEXT,
+ADD COLUMN IF NOT EXISTS thumbs JSONB;
+
+CREATE OR REPLACE FUNCTION t_p99005675_game_items_marketpla.sync_listing_card_from_item()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF current_setting('marketplace.archiving', true) = 'on' THEN
+            UPDATE t_p99005675_game_items_marketpla.listing_cards
+            SET archived_at = NOW()
+            WHERE item_id = OLD.id;
+        ELSE
+            DELETE FROM t_p99005675_game_items_marketpla.listing_cards WHERE item_id = OLD.id;
+        END IF;
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO t_p99005675_game_items_marketpla.listing_cards
+        (item_id, seller_id, title, price, image_url, category, rarity, is_sold, created_at,
+         seller_name, seller_sales_count, status, expires_at, thumb_url, thumbs)
+    SELECT NEW.id, NEW.seller_id, NEW.title, NEW.price, NEW.image_url, NEW.category, NEW.rarity,
+           NEW.is_sold, NEW.created_at, u.username, COALESCE(u.sales_count, 0), NEW.status, NEW.expires_at,
+           NEW.thumb_url, NEW.thumbs
+    FROM (SELECT 1) AS one
+    LEFT JOIN t_p99005675_game_items_marketpla.users u ON u.id = NEW.seller_id
+    ON CONFLICT (item_id) DO UPDATE SET
+        seller_id = EXCLUDED.seller_id,
+        title = EXCLUDED.title,
+        price = EXCLUDED.price,
+        image_url = EXCLUDED.image_url,
+        category = EXCLUDED.category,
+        rarity = EXCLUDED.rarity,
+        is_sold = EXCLUDED.is_sold,
+        created_at = EXCLUDED.created_at,
+        seller_name = EXCLUDED.seller_name,
+        seller_sales_count = EXCLUDED.seller_sales_count,
+        status = EXCLUDED.status,
+        expires_at = EXCLUDED.expires_at,
+        thumb_url = EXCLUDED.thumb_url,
+        thumbs = EXCLUDED.thumbs;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- image-worker сохранял все варианты рядом с card/webp под тем же хешем:
+-- <база>/<hh>/<hash>_<размер>.<формат>. Триггер переносит заполненные thumbs в карточки
+UPDATE t_p99005675_game_items_marketpla.items
+SET thumbs = jsonb_build_object(
+    'card', jsonb_build_object('webp', base || '_card.webp', 'jpg', base || '_card.jpg'),
+    'small', jsonb_build_object('webp', base || '_small.webp', 'jpg', base || '_small.jpg')
+)
+FROM (
+    SELECT id AS item_id, regexp_replace(thumb_url, '_card\.webp$', '') AS base
+    FROM t_p99005675_game_items_marketpla.items
+    WHERE thumb_url ~ '_card\.webp$' AND thumbs IS NULL
+) variants
+WHERE items.id = variants.item_id;
+
+-- Карточки архивированных предметов триггер уже не обновит
+UPDATE t_p99005675_game_items_marketpla.listing_cards
+SET thumbs = jsonb_build_object(
+    'card', jsonb_build_object('webp', base || '_card.webp', 'jpg', base || '_card.jpg'),
+    'small', jsonb_build_object('webp', base || '_small.webp', 'jpg', base || '_small.jpg')
+)
+FROM (
+    SELECT item_id AS card_item_id, regexp_replace(thumb_url, '_card\.webp$', '') AS base
+    FROM t_p99005675_game_items_marketpla.listing_cards
+    WHERE thumb_url ~ '_card\.webp$' AND thumbs IS NULL
+) variants
+WHERE listing_cards.item_id = variants.card_item_id;
+
+-- Уже архивированные предметы получают миниатюры из своих карточек, хеш - из адреса
+UPDATE t_p99005675_game_items_marketpla.items_archive a
+SET thumb_url = c.thumb_url,
+    thumbs = c.thumbs,
+    image_hash = substring(c.thumb_url FROM '([0-9a-f]{64})_card\.webp$')
+FROM t_p99005675_game_items_marketpla.listing_cards c
+WHERE c.item_id = a.id AND a.thumb_url IS NULL AND c.thumb_url IS NOT NULL;
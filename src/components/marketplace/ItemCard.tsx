@@ -3,13 +3,15 @@ import { Button } from '@/components/ui/button';
 import { Badge } from '@/components/ui/badge';
 import Icon from '@/components/ui/icon';
 import { toast } from 'sonner';
+import { ItemThumb, Thumbs } from '@/components/marketplace/ItemThumb';
 
 interface Item {
   id: number;
   title: string;
   description: string;
   price: string;
-  image_url: string;
+  image_url: string | null;
+  thumbs?: Thumbs | null;
   category: string;
   rarity: string;
   seller_name: string;
@@ -38,8 +40,10 @@ export const ItemCard = ({ item, userId, onBuy, onChat }: ItemCardProps) => {
       className="group hover:scale-105 transition-all duration-300 hover:glow-effect cursor-pointer bg-card/80 backdrop-blur-sm border-border/50 animate-fade-in overflow-hidden"
     >
       <div className="relative overflow-hidden h-48">
-        <img 
-          src={item.image_url} 
+        <ItemThumb
+          thumbs={item.thumbs}
+          size="card"
+          imageUrl={item.image_url}
           alt={item.title}
           className="w-full h-full object-cover group-hover:scale-110 transition-transform duration-300"
         />
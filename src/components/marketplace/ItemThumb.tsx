@@ -0,0 +1,30 @@
+import React from 'react';
+
+// Варианты миниатюр из image-worker: {размер: {формат: url}}
+export type Thumbs = Record<string, { webp?: string; jpg?: string }>;
+
+interface ItemThumbProps {
+  thumbs?: Thumbs | null;
+  size: 'card' | 'small';
+  imageUrl?: string | null;
+  alt: string;
+  className?: string;
+  onError?: React.ReactEventHandler<HTMLImageElement>;
+}
+
+export const ItemThumb = ({ thumbs, size, imageUrl, alt, className, onError }: ItemThumbProps) => {
+  const variant = thumbs?.[size];
+
+  // Пока миниатюр нет, показывается исходное изображение
+  if (!variant) {
+    return <img src={imageUrl || ''} alt={alt} className={className} onError={onError} />;
+  }
+
+  // WebP для браузеров, которые его поддерживают, JPEG для остальных
+  return (
+    <picture>
+      {variant.webp && <source srcSet={variant.webp} type="image/webp" />}
+      <img src={variant.jpg || variant.webp} alt={alt} className={className} onError={onError} loading="lazy" />
+    </picture>
+  );
+};
@@ -3,13 +3,15 @@ import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import Icon from '@/components/ui/icon';
 import { ItemCard } from '@/components/marketplace/ItemCard';
+import { Thumbs } from '@/components/marketplace/ItemThumb';
 
 interface Item {
   id: number;
   title: string;
   description: string;
   price: string;
-  image_url: string;
+  image_url: string | null;
+  thumbs?: Thumbs | null;
   category: string;
   rarity: string;
   seller_name: string;
@@ -2,12 +2,14 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle } from '@/components/u
 import { Card } from '@/components/ui/card';
 import Icon from '@/components/ui/icon';
 import { Badge } from '@/components/ui/badge';
+import { ItemThumb, Thumbs } from '@/components/marketplace/ItemThumb';
 
 interface SaleItem {
   id: number;
   title: string;
   price: string;
   image_url: string;
+  thumbs?: Thumbs | null;
   category: string;
   rarity: string;
   is_sold: boolean;
@@ -104,8 +106,10 @@ export const MySalesDialog = ({ open, onOpenChange, items, totalEarned }: MySale
                 {soldItems.map(item => (
                   <Card key={item.id} className="p-4 hover:shadow-lg transition-shadow">
                     <div className="flex items-center gap-4">
-                      <img 
-                        src={item.image_url} 
+                      <ItemThumb
+                        thumbs={item.thumbs}
+                        size="small"
+                        imageUrl={item.image_url}
                         alt={item.title}
                         className="w-16 h-16 object-cover rounded-lg"
                         onError={(e) => {
@@ -165,8 +169,10 @@ export const MySalesDialog = ({ open, onOpenChange, items, totalEarned }: MySale
                 {activeItems.map(item => (
                   <Card key={item.id} className="p-4 hover:shadow-lg transition-shadow">
                     <div className="flex items-center gap-4">
-                      <img 
-                        src={item.image_url} 
+                      <ItemThumb
+                        thumbs={item.thumbs}
+                        size="small"
+                        imageUrl={item.image_url}
                         alt={item.title}
                         className="w-16 h-16 object-cover rounded-lg"
                         onError={(e) => {
@@ -3,13 +3,15 @@ import { toast } from 'sonner';
 import { UserHeader } from '@/components/marketplace/UserHeader';
 import { MarketplaceContent } from '@/components/marketplace/MarketplaceContent';
 import { DialogsContainer } from '@/components/marketplace/DialogsContainer';
+import { Thumbs } from '@/components/marketplace/ItemThumb';
 
 interface Item {
   id: number;
   title: string;
   description: string;
   price: string;
-  image_url: string;
+  image_url: string | null;
+  thumbs?: Thumbs | null;
   category: string;
   rarity: string;
   seller_name: string;
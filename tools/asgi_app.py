@@ -0,0 +1,113 @@
+'''
+Local ASGI server for the backend functions.
+
+Each request to /<function>/... is turned into the same handler(event, context)
+event the cloud runtime sends. Functions with an async_index.py (marketplace,
+balance, withdraw) are awaited on the server's event loop and share one asyncpg
+pool per process. Other functions run their synchronous handler in a thread pool.
+
+    uvicorn tools.asgi_app:app --workers 1
+'''
+import asyncio
+import importlib
+import json
+import os
+import sys
+import threading
+import uuid
+from types import SimpleNamespace
+from typing import Dict, Any, Callable, Tuple
+from urllib.parse import parse_qsl
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+_functions: Dict[str, Tuple[Callable, bool]] = {}
+_import_lock = threading.Lock()
+
+
+def load_function(name: str) -> Tuple[Callable, bool]:
+    '''
+    Imports backend/<name> and returns (handler, is_async). Function directories
+    all use the module name "index", so each one is imported with its own
+    directory first on sys.path and its modules are dropped from sys.modules
+    afterwards; the returned handler keeps its own module globals.
+    '''
+    if name in _functions:
+        return _functions[name]
+    with _import_lock:
+        if name in _functions:
+            return _functions[name]
+        function_dir = os.path.join(BACKEND_DIR, name)
+        if not os.path.isfile(os.path.join(function_dir, 'index.py')):
+            raise KeyError(name)
+        local_modules = {f[:-3] for f in os.listdir(function_dir) if f.endswith('.py')}
+        saved = {m: sys.modules.pop(m) for m in local_modules if m in sys.modules}
+        sys.path.insert(0, function_dir)
+        try:
+            if 'async_index' in local_modules and os.environ.get('ASYNC_HANDLERS', '1') == '1':
+                entry = (importlib.import_module('async_index').handler_async, True)
+            else:
+                entry = (importlib.import_module('index').handler, False)
+        finally:
+            sys.path.remove(function_dir)
+            for m in local_modules:
+                sys.modules.pop(m, None)
+            sys.modules.update(saved)
+        _functions[name] = entry
+        return entry
+
+
+async def read_body(receive: Callable) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def app(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    parts = scope['path'].strip('/').split('/', 1)
+    name = parts[0]
+    try:
+        handler, is_async = load_function(name)
+    except KeyError:
+        await send_response(send, {'statusCode': 404, 'headers': {}, 'body': json.dumps({'error': 'Unknown function'})})
+        return
+
+    body = await read_body(receive)
+    event = {
+        'httpMethod': scope['method'],
+        'path': '/' + (parts[1] if len(parts) > 1 else ''),
+        'headers': {k.decode('latin-1'): v.decode('latin-1') for k, v in scope['headers']},
+        'queryStringParameters': dict(parse_qsl(scope['query_string'].decode())),
+        'body': body.decode() if body else '{}',
+        'isBase64Encoded': False
+    }
+    context = SimpleNamespace(request_id=str(uuid.uuid4()), function_name=name)
+
+    if is_async:
+        response = await handler(event, context)
+    else:
+        response = await asyncio.get_running_loop().run_in_executor(None, handler, event, context)
+    await send_response(send, response)
+
+
+async def send_response(send: Callable, response: Dict[str, Any]) -> None:
+    body = response.get('body') or ''
+    payload = body.encode() if isinstance(body, str) else body
+    headers = [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in (response.get('headers') or {}).items()]
+    await send({'type': 'http.response.start', 'status': response.get('statusCode', 200), 'headers': headers})
+    await send({'type': 'http.response.body', 'body': payload})
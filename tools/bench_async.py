@@ -0,0 +1,86 @@
+'''
+Benchmark of requests per second per process: sync handlers vs the asyncpg variants.
+
+Writes an event log of the hot endpoints of marketplace, balance and withdraw
+and replays it with tools/replay.py as fast as possible (--speed 0), once per
+configuration, each in its own process:
+    sync x1:      index.handler, one request at a time, as a container runs today
+    sync xN:      index.handler in N threads (one psycopg2 connection per thread)
+    async xN:     async_index.handler_async, up to N requests in flight on one event loop
+Reads by default; --writes adds balance top-ups. Point --database-url at a local
+copy of the database, never production.
+
+    python tools/bench_async.py --database-url postgresql://localhost/market --requests 5000 --concurrency 16
+'''
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+READS = [
+    ('marketplace', {'httpMethod': 'GET', 'queryStringParameters': {}}),
+    ('marketplace', {'httpMethod': 'GET', 'queryStringParameters': {'user_id': '1', 'limit': '50'}}),
+    ('balance', {'httpMethod': 'GET', 'queryStringParameters': {'user_id': '1'}}),
+    ('withdraw', {'httpMethod': 'GET', 'queryStringParameters': {'user_id': '1'}})
+]
+TOP_UP = ('balance', {'httpMethod': 'POST', 'body': json.dumps({'user_id': 1, 'amount': 1})})
+
+
+def write_log(path: str, requests: int, writes: bool) -> None:
+    mix = READS + [TOP_UP] if writes else READS
+    with open(path, 'w', encoding='utf-8') as f:
+        for function, event in itertools.islice(itertools.cycle(mix), requests):
+            f.write(json.dumps({'function': function, 'event': dict(event, path='/')}) + '\n')
+
+
+def replay(log_path: str, mode: str, workers: int, database_url: str) -> dict:
+    with tempfile.NamedTemporaryFile(suffix='.json') as report:
+        subprocess.run(
+            [sys.executable, os.path.join(TOOLS_DIR, 'replay.py'), log_path, '--speed', '0',
+             '--mode', mode, '--workers', str(workers), '--database-url', database_url, '--json', report.name],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        with open(report.name, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--writes', action='store_true', help='add balance top-ups to the mix')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as log:
+        log_path = log.name
+    try:
+        write_log(log_path, args.requests, args.writes)
+        # A short unmeasured run first, so every configuration starts with the tables in shared buffers
+        write_log(log_path + '.warm', 200, False)
+        replay(log_path + '.warm', 'thread', 1, args.database_url)
+
+        print(f"requests={args.requests} mix={'reads + top-ups' if args.writes else 'reads'} cpus={os.cpu_count()}")
+        print(f"{'configuration':14s} {'req/s':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'errors':>7s}")
+        for label, mode, workers in [
+            ('sync x1', 'thread', 1),
+            (f'sync x{args.concurrency}', 'thread', args.concurrency),
+            (f'async x{args.concurrency}', 'async', args.concurrency)
+        ]:
+            report = replay(log_path, mode, workers, args.database_url)
+            overall = report['endpoints']['all']
+            print(f"{label:14s} {report['throughput_rps']:8.1f} {overall['service_ms']['p50']:8.2f} "
+                  f"{overall['service_ms']['p99']:8.2f} {overall['errors']:7d}")
+    finally:
+        for path in (log_path, log_path + '.warm'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+'''
+Benchmark of the listing feed: items JOIN users vs denormalized listing_cards.
+
+Builds a throwaway schema with --items rows (1M by default) and compares
+    join:          items JOIN users, the pre-V0009 feed
+    cards+counter: listing_cards that also carries seller_sales_count (V0009..V0015, V0022)
+    cards+join:    listing_cards + users.sales_count for the 5 feed rows (V0016..V0021)
+and the cost of a purchase bumping sales_count for a seller with --seller-items cards,
+of which --seller-active are still on sale: without fan-out (V0016, V0022) and with the
+fan-out to every card of the seller (V0009..V0015). For V0022 it also times the deferred
+copy of the counter into the seller's active cards that listing-archiver runs once per
+run for every seller whose count changed.
+Use a scratch database, the schema is dropped at the end.
+
+    python tools/bench_listing_cards.py --database-url postgresql://localhost/bench --items 1000000
+'''
+import argparse
+import statistics
+import time
+
+import psycopg2
+
+SCHEMA = 'bench_listing_cards'
+
+SETUP = f"""
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+CREATE TABLE {SCHEMA}.users (
+    id SERIAL PRIMARY KEY, username VARCHAR(50) NOT NULL, sales_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE {SCHEMA}.items (
+    id SERIAL PRIMARY KEY, title VARCHAR(200) NOT NULL, price DECIMAL(10, 2) NOT NULL,
+    image_url TEXT, category VARCHAR(50), rarity VARCHAR(50), seller_id INTEGER NOT NULL,
+    is_sold BOOLEAN NOT NULL DEFAULT FALSE, status VARCHAR(20) NOT NULL DEFAULT 'active',
+    created_at TIMESTAMP NOT NULL
+);
+INSERT INTO {SCHEMA}.users (username, sales_count)
+SELECT 'player' || g, g %% 500 FROM generate_series(1, %(sellers)s) g;
+-- The first seller_items rows belong to seller 1 (seller_active of them on sale),
+-- the rest are spread over all sellers with a third sold
+INSERT INTO {SCHEMA}.items (title, price, image_url, category, rarity, seller_id, is_sold, created_at)
+SELECT 'Легендарный меч #' || g, (g %% 5000) + 0.5, 'https://cdn.example.com/' || md5(g::text) || '.webp',
+       'Оружие', 'Легендарный', CASE WHEN g <= %(seller_items)s THEN 1 ELSE 1 + g %% %(sellers)s END,
+       CASE WHEN g <= %(seller_items)s THEN g > %(seller_active)s ELSE g %% 3 = 0 END,
+       TIMESTAMP '2024-01-01' + g * INTERVAL '1 second'
+FROM generate_series(1, %(items)s) g;
+CREATE INDEX ON {SCHEMA}.items (created_at DESC) WHERE is_sold = FALSE AND status = 'active';
+CREATE INDEX ON {SCHEMA}.items (seller_id, created_at DESC);
+CREATE TABLE {SCHEMA}.cards AS
+SELECT i.id AS item_id, i.seller_id, i.title, i.price, i.image_url, i.category, i.rarity, i.is_sold,
+       i.status, i.created_at, u.username AS seller_name, u.sales_count AS seller_sales_count
+FROM {SCHEMA}.items i JOIN {SCHEMA}.users u ON u.id = i.seller_id;
+ALTER TABLE {SCHEMA}.cards ADD PRIMARY KEY (item_id);
+CREATE INDEX ON {SCHEMA}.cards (created_at DESC) WHERE is_sold = FALSE AND status = 'active';
+CREATE INDEX ON {SCHEMA}.cards (seller_id, created_at DESC);
+CREATE INDEX ON {SCHEMA}.cards (seller_id) WHERE is_sold = FALSE AND status = 'active';
+ANALYZE;
+"""
+
+FEEDS = {
+    'join': f"""
+        SELECT i.id, i.title, i.price, i.image_url, i.category, i.rarity, i.seller_id,
+               u.username, u.sales_count
+        FROM {SCHEMA}.items i JOIN {SCHEMA}.users u ON u.id = i.seller_id
+        WHERE i.is_sold = FALSE AND i.status = 'active'
+        ORDER BY i.created_at DESC LIMIT 5
+    """,
+    'cards+counter': f"""
+        SELECT item_id, title, price, image_url, category, rarity, seller_id, seller_name, seller_sales_count
+        FROM {SCHEMA}.cards
+        WHERE is_sold = FALSE AND status = 'active'
+        ORDER BY created_at DESC LIMIT 5
+    """,
+    'cards+join': f"""
+        SELECT c.item_id, c.title, c.price, c.image_url, c.category, c.rarity, c.seller_id,
+               c.seller_name, COALESCE(u.sales_count, 0)
+        FROM {SCHEMA}.cards c LEFT JOIN {SCHEMA}.users u ON u.id = c.seller_id
+        WHERE c.is_sold = FALSE AND c.status = 'active'
+        ORDER BY c.created_at DESC LIMIT 5
+    """
+}
+
+HISTORY = {
+    'join': f"""
+        SELECT i.id, i.title, i.price, i.is_sold, u.username
+        FROM {SCHEMA}.items i JOIN {SCHEMA}.users u ON u.id = i.seller_id
+        WHERE i.seller_id = %s ORDER BY i.created_at DESC LIMIT 50
+    """,
+    'cards': f"""
+        SELECT item_id, title, price, is_sold, seller_name
+        FROM {SCHEMA}.cards WHERE seller_id = %s ORDER BY created_at DESC LIMIT 50
+    """
+}
+
+PURCHASES = {
+    'sales_count only': [f"UPDATE {SCHEMA}.users SET sales_count = sales_count + 1 WHERE id = 1"],
+    'sales_count + fan-out to all cards': [
+        f"UPDATE {SCHEMA}.users SET sales_count = sales_count + 1 WHERE id = 1",
+        f"UPDATE {SCHEMA}.cards SET seller_sales_count = seller_sales_count + 1 WHERE seller_id = 1"
+    ]
+}
+
+SYNC = [
+    f"UPDATE {SCHEMA}.cards SET seller_sales_count = seller_sales_count + 1 "
+    f"WHERE seller_id = 1 AND is_sold = FALSE AND status = 'active'"
+]
+
+
+def timed(cur, statements, params, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for sql in statements:
+            cur.execute(sql, params)
+            if cur.description:
+                cur.fetchall()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--items', type=int, default=1000000)
+    parser.add_argument('--sellers', type=int, default=10000)
+    parser.add_argument('--seller-items', type=int, default=20000)
+    parser.add_argument('--seller-active', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.database_url)
+    try:
+        with conn.cursor() as cur:
+            started = time.perf_counter()
+            cur.execute(SETUP, {'items': args.items, 'sellers': args.sellers, 'seller_items': args.seller_items,
+                                'seller_active': args.seller_active})
+            conn.commit()
+            print(f'items={args.items} sellers={args.sellers} seller 1 cards={args.seller_items} '
+                  f'(active {args.seller_active}) '
+                  f'(setup {time.perf_counter() - started:.1f} s), median of {args.repeat}')
+
+            for name, sql in FEEDS.items():
+                print(f'feed    {name:38s} {timed(cur, [sql], None, args.repeat):8.3f} ms')
+            for name, sql in HISTORY.items():
+                print(f'history {name:38s} {timed(cur, [sql], (1,), args.repeat):8.3f} ms')
+            conn.commit()
+
+            # Each purchase runs in its own rolled-back transaction so dead tuples do not pile up
+            for name, statements in PURCHASES.items():
+                samples = []
+                for _ in range(max(args.repeat // 10, 5)):
+                    samples.append(timed(cur, statements, None, 1))
+                    conn.rollback()
+                print(f'buy     {name:38s} {statistics.median(samples):8.3f} ms')
+            samples = []
+            for _ in range(max(args.repeat // 10, 5)):
+                samples.append(timed(cur, SYNC, None, 1))
+                conn.rollback()
+            print(f"sync    {'active cards of seller 1':38s} {statistics.median(samples):8.3f} ms")
+
+            cur.execute(f'DROP SCHEMA {SCHEMA} CASCADE')
+            conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+'''
+Benchmark of partition pruning on transactions: monthly partitions vs one plain table.
+
+Loads --rows transactions (100M by default) spread evenly over --months months into
+a table partitioned like V0011 and into an unpartitioned copy with the same indexes,
+then times the queries the functions run against transactions, with their WHERE
+clauses as written, and reports how many partitions each plan touches:
+    risk-scoring new events: the (created_at, id) watermark read of one run
+    risk-scoring warm-up:    the replay of the last 24 hours on a cold container
+    analytics export:        id watermark OR the refresh window (the OR defeats pruning)
+Seller history reads listing_cards and purchases only insert into transactions, so
+neither is here. The last step compares retention: DETACH + DROP of the oldest month
+vs DELETE of the same rows. Use a scratch database, the schema is dropped at the end.
+
+    python tools/bench_partitions.py --database-url postgresql://localhost/bench --rows 100000000
+'''
+import argparse
+import statistics
+import time
+
+import psycopg2
+
+SCHEMA = 'bench_partitions'
+START = '2024-01-01'
+
+# The WHERE clauses of backend/risk-scoring fetch_events / replay_events and
+# backend/analytics export_table, with their parameters placed at the recent end of the data
+QUERIES = {
+    'risk new events': """
+        SELECT id, buyer_id, seller_id, amount, transaction_type, created_at FROM {table}
+        WHERE created_at >= %(mark_ts)s AND (created_at, id) > (%(mark_ts)s, %(mark_id)s) AND created_at < %(horizon)s
+        ORDER BY created_at, id
+        LIMIT 10000
+    """,
+    'risk warm-up': """
+        SELECT id, buyer_id, seller_id, amount, transaction_type, created_at FROM {table}
+        WHERE created_at >= %(mark_ts)s::timestamp - INTERVAL '1 day' AND (created_at, id) <= (%(mark_ts)s, %(mark_id)s)
+        ORDER BY created_at, id
+    """,
+    'analytics export': """
+        SELECT id, buyer_id, seller_id, item_id, amount, transaction_type, created_at FROM {table}
+        WHERE id > %(export_id)s OR created_at >= %(refresh_from)s
+        ORDER BY created_at, id
+    """
+}
+
+
+def setup(cur, rows: int, months: int, users: int) -> None:
+    cur.execute(f"""
+        DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+        CREATE SCHEMA {SCHEMA};
+        CREATE TABLE {SCHEMA}.tx_part (
+            id BIGINT NOT NULL, buyer_id INTEGER, seller_id INTEGER, item_id INTEGER,
+            amount DECIMAL(10, 2) NOT NULL, transaction_type VARCHAR(50),
+            created_at TIMESTAMP NOT NULL, PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+    """)
+    for month in range(months):
+        cur.execute(f"""
+            SELECT format('CREATE TABLE {SCHEMA}.tx_p%%s PARTITION OF {SCHEMA}.tx_part FOR VALUES FROM (%%L) TO (%%L)',
+                          to_char(m, 'YYYYMM'), m, m + INTERVAL '1 month')
+            FROM (SELECT %s::date + make_interval(months => %s) AS m) s
+        """, (START, month))
+        cur.execute(cur.fetchone()[0])
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.tx_part (id, buyer_id, seller_id, item_id, amount, transaction_type, created_at)
+        SELECT g, 1 + g %% %(users)s, 1 + (g * 7) %% %(users)s, g, (g %% 5000) + 0.5, 'purchase',
+               %(start)s::timestamp + (g - 1) * ((%(start)s::timestamp + make_interval(months => %(months)s)
+                                                 - %(start)s::timestamp) / %(rows)s)
+        FROM generate_series(1, %(rows)s) g
+    """, {'rows': rows, 'months': months, 'users': users, 'start': START})
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.tx_flat (LIKE {SCHEMA}.tx_part INCLUDING DEFAULTS);
+        INSERT INTO {SCHEMA}.tx_flat SELECT * FROM {SCHEMA}.tx_part;
+        ALTER TABLE {SCHEMA}.tx_flat ADD PRIMARY KEY (id, created_at);
+    """)
+    for table in ('tx_part', 'tx_flat'):
+        cur.execute(f"""
+            CREATE INDEX ON {SCHEMA}.{table} (buyer_id, created_at);
+            CREATE INDEX ON {SCHEMA}.{table} (seller_id, created_at);
+            CREATE INDEX ON {SCHEMA}.{table} (created_at);
+        """)
+        cur.execute(f'VACUUM ANALYZE {SCHEMA}.{table}')
+
+
+def scanned_relations(cur, sql: str, params: dict) -> int:
+    cur.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+    relations = set()
+    stack = [cur.fetchone()[0][0]['Plan']]
+    while stack:
+        node = stack.pop()
+        if 'Relation Name' in node:
+            relations.add(node['Relation Name'])
+        stack.extend(node.get('Plans', []))
+    return len(relations)
+
+
+def timed(cur, sql: str, params: dict, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--rows', type=int, default=100000000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--keep', action='store_true', help='do not drop the schema at the end')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.database_url)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            started = time.perf_counter()
+            setup(cur, args.rows, args.months, args.users)
+            cur.execute(f"SELECT pg_size_pretty(pg_total_relation_size('{SCHEMA}.tx_flat'))")
+            print(f'rows={args.rows} months={args.months} users={args.users} '
+                  f'(setup {time.perf_counter() - started:.0f} s, plain table {cur.fetchone()[0]}), median of {args.repeat}')
+
+            # risk-scoring is 5 minutes behind the newest row; analytics last exported an hour
+            # ago and re-reads the day before yesterday onwards (refresh_days = 1)
+            cur.execute(f"""
+                SELECT created_at, id FROM {SCHEMA}.tx_flat
+                WHERE created_at <= (SELECT MAX(created_at) - INTERVAL '5 minutes' FROM {SCHEMA}.tx_flat)
+                ORDER BY created_at DESC, id DESC LIMIT 1
+            """)
+            mark_ts, mark_id = cur.fetchone()
+            cur.execute(f"""
+                SELECT MAX(created_at) + INTERVAL '1 second', MAX(created_at)::date - 1,
+                       (SELECT MAX(id) FROM {SCHEMA}.tx_flat
+                        WHERE created_at <= (SELECT MAX(created_at) - INTERVAL '1 hour' FROM {SCHEMA}.tx_flat))
+                FROM {SCHEMA}.tx_flat
+            """)
+            horizon, refresh_from, export_id = cur.fetchone()
+            params = {
+                'mark_ts': mark_ts, 'mark_id': mark_id, 'horizon': horizon,
+                'export_id': export_id, 'refresh_from': refresh_from
+            }
+            for name, template in QUERIES.items():
+                # Warm the cache so both tables are compared under the same conditions
+                for table in ('tx_part', 'tx_flat'):
+                    timed(cur, template.format(table=f'{SCHEMA}.{table}'), params, 1)
+                part_sql = template.format(table=f'{SCHEMA}.tx_part')
+                flat_sql = template.format(table=f'{SCHEMA}.tx_flat')
+                part = timed(cur, part_sql, params, args.repeat)
+                flat = timed(cur, flat_sql, params, args.repeat)
+                print(f'{name:20s} partitioned {part:9.2f} ms ({scanned_relations(cur, part_sql, params)} of '
+                      f'{args.months} partitions)   plain {flat:9.2f} ms')
+
+            cur.execute(f"SELECT to_char(%s::date, 'YYYYMM'), COUNT(*) FROM {SCHEMA}.tx_flat "
+                        f"WHERE created_at < %s::date + INTERVAL '1 month'", (START, START))
+            suffix, month_rows = cur.fetchone()
+            started = time.perf_counter()
+            cur.execute(f'ALTER TABLE {SCHEMA}.tx_part DETACH PARTITION {SCHEMA}.tx_p{suffix} CONCURRENTLY')
+            cur.execute(f'DROP TABLE {SCHEMA}.tx_p{suffix}')
+            detach = time.perf_counter() - started
+            started = time.perf_counter()
+            cur.execute(f"DELETE FROM {SCHEMA}.tx_flat WHERE created_at < %s::date + INTERVAL '1 month'", (START,))
+            delete = time.perf_counter() - started
+            print(f'retention of {month_rows} rows: detach + drop {detach * 1000:.0f} ms   DELETE {delete * 1000:.0f} ms')
+
+            if not args.keep:
+                cur.execute(f'DROP SCHEMA {SCHEMA} CASCADE')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
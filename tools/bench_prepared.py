@@ -0,0 +1,104 @@
+'''
+Benchmark of planning time for the marketplace query catalog: prepared vs unprepared.
+
+For each read query in backend/marketplace/queries.py CATALOG it compares
+    unprepared: the SQL sent as text on every call, parsed and planned each time
+    prepared:   PREPARE once, then EXECUTE, as queries.execute() does
+reporting the server-side planning time from EXPLAIN (ANALYZE) and the client
+round trip of a call. The prepared statement is executed --warmup times first,
+so Postgres has had the chance to switch to a generic plan; the plan kind it
+settled on is shown from pg_prepared_statements. Only reads run, item_for_purchase
+(FOR UPDATE) inside a transaction that is rolled back.
+
+    python tools/bench_prepared.py --database-url postgresql://localhost/market
+'''
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', 'marketplace'))
+from queries import CATALOG  # noqa: E402
+
+SCHEMA = 't_p99005675_game_items_marketpla'
+READS = ['feed', 'seller_history', 'item_for_purchase', 'buyer_balance']
+
+
+def as_text(sql: str) -> str:
+    '''$1, $2 ... of the catalog -> psycopg2 named placeholders, for the unprepared text query'''
+    return re.sub(r'\$(\d+)', lambda match: f'%(p{match.group(1)})s', sql)
+
+
+def planning_ms(cur, sql: str, params: dict) -> float:
+    cur.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, params)
+    return cur.fetchone()[0][0]['Planning Time']
+
+
+def timed(cur, sql: str, params, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--repeat', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=10)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.database_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT seller_id, COUNT(*) FROM {SCHEMA}.listing_cards
+                GROUP BY seller_id ORDER BY COUNT(*) DESC LIMIT 1
+            """)
+            seller_id, seller_cards = cur.fetchone()
+            cur.execute(f'SELECT MIN(id) FROM {SCHEMA}.items')
+            item_id = cur.fetchone()[0]
+            cur.execute(f'SELECT COUNT(*) FROM {SCHEMA}.listing_cards')
+            print(f'listing_cards={cur.fetchone()[0]} seller {seller_id} cards={seller_cards}, median of {args.repeat}')
+            values = {
+                'feed': (),
+                'seller_history': (seller_id, 50),
+                'item_for_purchase': (item_id,),
+                'buyer_balance': (seller_id,)
+            }
+            print(f"{'query':18s} {'plan text':>10s} {'plan prep':>10s} {'call text':>10s} {'call prep':>10s}  plan kind")
+            for name in READS:
+                types, sql = CATALOG[name]
+                params = values[name]
+                named = {f'p{position}': value for position, value in enumerate(params, 1)}
+                text_sql = as_text(sql)
+
+                cur.execute(f"PREPARE {name}{'(' + ', '.join(types) + ')' if types else ''} AS {sql}")
+                execute_sql = f"EXECUTE {name}({', '.join(['%s'] * len(params))})" if params else f'EXECUTE {name}'
+                for _ in range(args.warmup):
+                    cur.execute(execute_sql, params)
+                    cur.fetchall()
+
+                plan_text = statistics.median([planning_ms(cur, text_sql, named) for _ in range(args.repeat)])
+                plan_prepared = statistics.median([planning_ms(cur, execute_sql, params) for _ in range(args.repeat)])
+                call_text = timed(cur, text_sql, named, args.repeat)
+                call_prepared = timed(cur, execute_sql, params, args.repeat)
+                cur.execute('SELECT generic_plans, custom_plans FROM pg_prepared_statements WHERE name = %s', (name,))
+                generic_plans, custom_plans = cur.fetchone()
+                kind = 'generic' if generic_plans > custom_plans else 'custom'
+                print(f'{name:18s} {plan_text:8.3f}ms {plan_prepared:8.3f}ms {call_text:8.3f}ms {call_prepared:8.3f}ms  '
+                      f'{kind} ({generic_plans} generic / {custom_plans} custom)')
+                conn.rollback()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
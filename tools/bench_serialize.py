@@ -0,0 +1,143 @@
+'''
+Benchmark of list-response serialization.
+
+Without --database-url, synthetic listing rows are encoded three ways and the
+outputs are checked to be identical:
+    dict + json.dumps:  the old path (RealDictCursor-style dict per row, default=str)
+    by column:          serialize.encode_rows_by_column, the fallback without orjson
+    encode_rows:        serialize.encode_rows, orjson over the whole page when installed
+
+    python tools/bench_serialize.py --rows 10000 --repeat 20
+
+With --database-url, seller history is measured end to end against Postgres for
+several page sizes: the tuple path (seller_history, display_prices, encode_rows)
+vs the json_agg path (seller_history_json, the page is built by Postgres and
+returned as-is). The seller and its items are created inside a transaction that
+is rolled back at the end:
+
+    python tools/bench_serialize.py --database-url postgresql://localhost/market --rows 10000
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', 'marketplace'))
+
+import serialize  # noqa: E402
+
+COLUMNS = ['id', 'title', 'price', 'image_url', 'thumb_url', 'category', 'rarity', 'is_sold', 'status',
+           'seller_id', 'created_at', 'seller_name', 'buyer_id', 'buyer_name', 'sold_at', 'display_prices']
+PAGE_SIZES = [50, 200, 500, 1000, 5000, 10000]
+
+
+def make_rows(count: int) -> list:
+    start = datetime(2024, 1, 1)
+    return [
+        (
+            i, f'Легендарный меч пламени #{i}', Decimal(f'{i % 5000}.50'),
+            f'https://cdn.example.com/ab/{i:064x}_card.webp', f'/thumbnails/ab/{i:064x}_card.webp',
+            'Оружие', 'Легендарный', i % 3 == 0, 'active', i % 1000,
+            start + timedelta(minutes=i), 'Player1', (i % 1000) + 1 if i % 3 == 0 else None,
+            'ProGamer' if i % 3 == 0 else None, start + timedelta(minutes=i, seconds=30) if i % 3 == 0 else None,
+            {'RUB': Decimal(f'{i % 5000}.05')}
+        )
+        for i in range(count)
+    ]
+
+
+def best_of(repeat: int, fn) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_encoders(args) -> None:
+    rows = make_rows(args.rows)
+
+    def dict_path() -> str:
+        items = [dict(zip(COLUMNS, row)) for row in rows]
+        return json.dumps({'items': items}, default=str)
+
+    def column_path() -> str:
+        return '{"items":' + serialize.encode_rows_by_column(COLUMNS, rows) + '}'
+
+    def encode_rows_path() -> str:
+        return '{"items":' + serialize.encode_rows(COLUMNS, rows) + '}'
+
+    assert json.loads(dict_path()) == json.loads(column_path()) == json.loads(encode_rows_path())
+
+    baseline = best_of(args.repeat, dict_path)
+    by_column = best_of(args.repeat, column_path)
+    fast = best_of(args.repeat, encode_rows_path)
+    print(f'rows={args.rows} orjson={"yes" if serialize.orjson else "no"}')
+    print(f'dict + json.dumps(default=str): {baseline * 1000:8.2f} ms')
+    print(f'tuples + encode_rows_by_column: {by_column * 1000:8.2f} ms  ({baseline / by_column:.1f}x)')
+    print(f'tuples + encode_rows:           {fast * 1000:8.2f} ms  ({baseline / fast:.1f}x)')
+
+
+def bench_history(args) -> None:
+    os.environ['DATABASE_URL'] = args.database_url
+    import queries
+    from pricing import display_prices, get_rates
+
+    conn = queries.get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("INSERT INTO t_p99005675_game_items_marketpla.users (username) VALUES ('bench-serialize') RETURNING id")
+        seller_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO t_p99005675_game_items_marketpla.items (seller_id, title, price, image_url, category, rarity)
+            SELECT %s, 'Легендарный меч пламени #' || i, (i %% 5000) + 0.5,
+                   'https://cdn.example.com/ab/' || md5(i::text) || '_card.webp', 'Оружие', 'Легендарный'
+            FROM generate_series(1, %s) AS i
+        """, (seller_id, args.rows))
+        rates = get_rates(conn)
+        currencies = list(rates)
+
+        def tuple_path(limit: int) -> str:
+            queries.execute(cur, 'seller_history', (seller_id, limit))
+            rows = cur.fetchall()
+            columns = serialize.cursor_columns(cur)
+            price_index = columns.index('price')
+            prices = display_prices([row[price_index] for row in rows], rates, currencies)
+            return '{"items":' + serialize.encode_rows(columns + ['display_prices'], [row + (p,) for row, p in zip(rows, prices)]) + '}'
+
+        def json_agg_path(limit: int) -> str:
+            queries.execute(cur, 'seller_history_json', (seller_id, limit, currencies, [rates[c] for c in currencies]))
+            return '{"items":' + cur.fetchone()[0] + '}'
+
+        print(f'seller history, {args.rows} items, orjson={"yes" if serialize.orjson else "no"}, best of {args.repeat}')
+        print(f'{"limit":>6s} {"tuples+encode":>14s} {"json_agg":>10s}')
+        for limit in [size for size in PAGE_SIZES if size <= args.rows]:
+            assert json.loads(tuple_path(limit)) == json.loads(json_agg_path(limit))
+            tuples = best_of(args.repeat, lambda: tuple_path(limit))
+            aggregated = best_of(args.repeat, lambda: json_agg_path(limit))
+            print(f'{limit:6d} {tuples * 1000:11.2f} ms {aggregated * 1000:7.2f} ms')
+    finally:
+        cur.close()
+        conn.rollback()
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database-url', help='measure seller history against this database instead of synthetic rows')
+    args = parser.parse_args()
+
+    if args.database_url:
+        bench_history(args)
+    else:
+        bench_encoders(args)
+
+
+if __name__ == '__main__':
+    main()
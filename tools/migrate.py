@@ -0,0 +1,559 @@
+'''
+Schema migration runner for db_migrations/VNNNN__name.sql.
+
+Applied versions are tracked in <schema>.schema_migrations together with a
+checksum of the file. Each session runs with search_path = <schema>, public, so
+scripts with bare table names and schema-qualified ones resolve to the same
+tables.
+
+A script is split into statements (quotes, comments and $tag$ bodies aware) and
+run in steps:
+
+- consecutive ordinary statements run in one transaction with lock_timeout;
+  if a lock cannot be taken in time the step is rolled back and retried
+  instead of queueing purchases behind it;
+- CREATE INDEX on a table that already existed before the migration is built
+  online: the current transaction is committed and the index is created with
+  CONCURRENTLY IF NOT EXISTS in autocommit (an INVALID leftover from an earlier
+  failed build is dropped first). Partitioned tables cannot be indexed
+  concurrently, so the parent index is created ON ONLY the parent, each
+  partition is indexed concurrently and attached;
+- CREATE INDEX on a table created earlier in the same transaction stays in
+  that transaction: the table is not visible to anyone yet, and splitting
+  would expose a half-applied rebuild (e.g. V0011);
+- statements that cannot run in a transaction (... CONCURRENTLY, VACUUM) run
+  in autocommit.
+
+A pending script that drops an index and later creates one under the same name
+is refused: the online build would leave the table without the index until it
+finishes. Build the replacement under another name, then DROP the old index and
+RENAME the new one in one transaction (see V0010).
+
+Progress inside a script is committed together with each transactional step, so
+a failed migration resumes from the first statement that did not commit.
+
+For every step the report shows duration, time spent waiting for locks and the
+largest number of other sessions that were waiting on the migration, sampled
+from pg_blocking_pids by a monitor connection.
+
+    python tools/migrate.py --database-url postgresql://... --baseline V0015
+    python tools/migrate.py --database-url postgresql://...
+    python tools/migrate.py --dry-run
+'''
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+DEFAULT_SCHEMA = 't_p99005675_game_items_marketpla'
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db_migrations')
+FILENAME_RE = re.compile(r'^(V\d+)__(.+)\.sql$')
+INDEX_RE = re.compile(
+    r'^CREATE\s+(?P<unique>UNIQUE\s+)?INDEX\s+(?P<concurrently>CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?'
+    r'(?P<name>(?!ON\b)[\w$]+|"[^"]+")\s+ON\s+(?P<only>ONLY\s+)?(?P<table>(?:[\w$]+|"[^"]+")(?:\.(?:[\w$]+|"[^"]+"))?)\s*(?P<rest>.*)$',
+    re.IGNORECASE | re.DOTALL
+)
+CREATE_TABLE_RE = re.compile(
+    r'^CREATE\s+(?:UNLOGGED\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(?P<table>(?:[\w$]+|"[^"]+")(?:\.(?:[\w$]+|"[^"]+"))?)',
+    re.IGNORECASE
+)
+DROP_INDEX_RE = re.compile(
+    r'^DROP\s+INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+EXISTS\s+)?(?P<names>.+?)\s*(?:\b(?:CASCADE|RESTRICT)\b)?\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+NON_TRANSACTIONAL_RE = re.compile(r'\bCONCURRENTLY\b|^VACUUM\b|^(CREATE|DROP)\s+DATABASE\b', re.IGNORECASE)
+
+
+# ---------- Parsing ----------
+
+def split_statements(sql: str) -> List[str]:
+    '''Splits a script on top-level semicolons, skipping quotes, comments and dollar-quoted bodies'''
+    statements = []
+    start = 0
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch == '-' and sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = n if end == -1 else end + 1
+        elif ch == '/' and sql.startswith('/*', i):
+            # Block comments nest in Postgres
+            depth = 1
+            i += 2
+            while i < n and depth:
+                if sql.startswith('/*', i):
+                    depth += 1
+                    i += 2
+                elif sql.startswith('*/', i):
+                    depth -= 1
+                    i += 2
+                else:
+                    i += 1
+        elif ch in ("'", '"'):
+            i += 1
+            while i < n:
+                if sql[i] == ch:
+                    if i + 1 < n and sql[i + 1] == ch:
+                        i += 2
+                        continue
+                    break
+                i += 1
+            i += 1
+        elif ch == '$':
+            match = re.match(r'\$([A-Za-z_][\w]*)?\$', sql[i:])
+            if match and not (i > 0 and (sql[i - 1].isalnum() or sql[i - 1] == '_')):
+                tag = match.group(0)
+                end = sql.find(tag, i + len(tag))
+                i = n if end == -1 else end + len(tag)
+            else:
+                i += 1
+        elif ch == ';':
+            statements.append(sql[start:i])
+            i += 1
+            start = i
+        else:
+            i += 1
+    statements.append(sql[start:])
+    return [s.strip() for s in statements if strip_leading_comments(s)]
+
+
+def strip_leading_comments(statement: str) -> str:
+    text = statement.strip()
+    while True:
+        if text.startswith('--'):
+            end = text.find('\n')
+            text = '' if end == -1 else text[end + 1:].lstrip()
+        elif text.startswith('/*'):
+            end = text.find('*/')
+            text = '' if end == -1 else text[end + 2:].lstrip()
+        else:
+            return text
+
+
+def relation_name(name: str) -> str:
+    '''Unqualified relation name for comparing table references'''
+    last = name.rsplit('.', 1)[-1]
+    return last[1:-1] if last.startswith('"') else last.lower()
+
+
+def rebuilt_after_drop(statements: List[str]) -> List[str]:
+    '''Indexes a script drops and then creates again under the same name'''
+    dropped = set()
+    rebuilt = []
+    for statement in statements:
+        text = strip_leading_comments(statement)
+        match = DROP_INDEX_RE.match(text)
+        if match:
+            dropped.update(relation_name(name.strip()) for name in match.group('names').split(','))
+            continue
+        match = INDEX_RE.match(text)
+        if match and relation_name(match.group('name')) in dropped:
+            rebuilt.append(relation_name(match.group('name')))
+    return rebuilt
+
+
+def summary(statement: str, width: int = 70) -> str:
+    text = ' '.join(strip_leading_comments(statement).split())
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+
+def load_migrations(directory: str) -> List[Dict[str, Any]]:
+    migrations = []
+    for path in sorted(glob.glob(os.path.join(directory, 'V*__*.sql'))):
+        match = FILENAME_RE.match(os.path.basename(path))
+        if not match:
+            continue
+        with open(path, encoding='utf-8') as f:
+            sql = f.read()
+        migrations.append({
+            'version': match.group(1),
+            'name': match.group(2),
+            'checksum': hashlib.sha256(sql.encode()).hexdigest(),
+            'statements': split_statements(sql)
+        })
+    migrations.sort(key=lambda m: int(m['version'][1:]))
+    return migrations
+
+
+# ---------- Lock monitor ----------
+
+class LockMonitor:
+    '''Samples on a separate connection whether the migration session waits for locks and who waits for it'''
+
+    def __init__(self, dsn: str, pid: int, interval: float = 0.05):
+        import psycopg2
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+        self.pid = pid
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.lock_wait = 0.0
+        self.max_blocked = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.lock_wait = 0.0
+            self.max_blocked = 0
+
+    def take(self) -> Tuple[float, int]:
+        with self.lock:
+            result = (self.lock_wait, self.max_blocked)
+        self.reset()
+        return result
+
+    def _run(self) -> None:
+        last = time.monotonic()
+        with self.conn.cursor() as cur:
+            while not self.stop_event.wait(self.interval):
+                cur.execute("""
+                    SELECT
+                        (SELECT wait_event_type = 'Lock' FROM pg_stat_activity WHERE pid = %(pid)s),
+                        (SELECT COUNT(*) FROM pg_stat_activity WHERE %(pid)s = ANY(pg_blocking_pids(pid)))
+                """, {'pid': self.pid})
+                waiting, blocked = cur.fetchone()
+                now = time.monotonic()
+                with self.lock:
+                    if waiting:
+                        self.lock_wait += now - last
+                    self.max_blocked = max(self.max_blocked, blocked)
+                last = now
+
+    def close(self) -> None:
+        self.stop_event.set()
+        self.thread.join()
+        self.conn.close()
+
+
+# ---------- Runner ----------
+
+class Runner:
+    def __init__(self, dsn: str, schema: str, lock_timeout: str, retries: int):
+        import psycopg2
+        import psycopg2.errors
+        self.psycopg2 = psycopg2
+        self.dsn = dsn
+        self.schema = schema
+        self.lock_timeout = lock_timeout
+        self.retries = retries
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+        with self.conn.cursor() as cur:
+            cur.execute(f'SET search_path TO {schema}, public')
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {schema}.schema_migrations (
+                    version VARCHAR(20) PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    checksum VARCHAR(64) NOT NULL,
+                    status VARCHAR(20) NOT NULL DEFAULT 'running',
+                    statements_done INTEGER NOT NULL DEFAULT 0,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    applied_at TIMESTAMP,
+                    duration_ms INTEGER
+                )
+            """)
+        self.monitor = LockMonitor(dsn, self.conn.get_backend_pid())
+        self.steps: List[Dict[str, Any]] = []
+
+    def close(self) -> None:
+        self.monitor.close()
+        self.conn.close()
+
+    def applied(self) -> Dict[str, Dict[str, Any]]:
+        with self.conn.cursor() as cur:
+            cur.execute(f'SELECT version, checksum, status, statements_done FROM {self.schema}.schema_migrations')
+            return {row[0]: {'checksum': row[1], 'status': row[2], 'statements_done': row[3]} for row in cur.fetchall()}
+
+    def baseline(self, migrations: List[Dict[str, Any]], upto: str) -> int:
+        '''Marks migrations up to a version as applied without running them (databases migrated by hand)'''
+        count = 0
+        with self.conn.cursor() as cur:
+            for migration in migrations:
+                if int(migration['version'][1:]) > int(upto[1:]):
+                    break
+                cur.execute(f"""
+                    INSERT INTO {self.schema}.schema_migrations (version, name, checksum, status, statements_done, applied_at, duration_ms)
+                    VALUES (%s, %s, %s, 'baseline', %s, NOW(), 0)
+                    ON CONFLICT (version) DO NOTHING
+                """, (migration['version'], migration['name'], migration['checksum'], len(migration['statements'])))
+                count += cur.rowcount
+        return count
+
+    # --- steps ---
+
+    def record_step(self, version: str, kind: str, statements: List[str], started: float, attempts: int) -> None:
+        lock_wait, max_blocked = self.monitor.take()
+        step = {
+            'version': version,
+            'kind': kind,
+            'statements': len(statements),
+            'first': summary(statements[0]) if statements else '',
+            'duration_ms': round((time.monotonic() - started) * 1000, 1),
+            'lock_wait_ms': round(lock_wait * 1000, 1),
+            'max_blocked_sessions': max_blocked,
+            'attempts': attempts
+        }
+        self.steps.append(step)
+        print_step(step)
+
+    def set_progress(self, cur: Any, migration: Dict[str, Any], done: int) -> None:
+        cur.execute(f"""
+            INSERT INTO {self.schema}.schema_migrations (version, name, checksum, status, statements_done)
+            VALUES (%s, %s, %s, 'running', %s)
+            ON CONFLICT (version) DO UPDATE SET statements_done = EXCLUDED.statements_done
+        """, (migration['version'], migration['name'], migration['checksum'], done))
+
+    def index_target(self, cur: Any, table: str) -> Optional[Tuple[str, bool]]:
+        '''(relkind, pg_class row written by the current transaction) for the indexed table, None if it does not exist'''
+        cur.execute("""
+            SELECT c.relkind, c.xmin = xid(pg_current_xact_id())
+            FROM pg_class c
+            WHERE c.oid = to_regclass(%s)
+        """, (table,))
+        return cur.fetchone()
+
+    def apply(self, migration: Dict[str, Any], resume_from: int) -> None:
+        statements = migration['statements']
+        position = resume_from
+        started_all = time.monotonic()
+        while position < len(statements):
+            position = self.run_transaction_step(migration, position)
+            if position < len(statements):
+                position = self.run_autocommit_step(migration, position)
+
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {self.schema}.schema_migrations
+                SET status = 'applied', statements_done = %s, applied_at = NOW(),
+                    duration_ms = COALESCE(duration_ms, 0) + %s
+                WHERE version = %s
+            """, (len(statements), int((time.monotonic() - started_all) * 1000), migration['version']))
+
+    def run_transaction_step(self, migration: Dict[str, Any], start: int) -> int:
+        '''Runs statements from start in one transaction until one that must run outside; returns its position'''
+        statements = migration['statements']
+        Errors = self.psycopg2.errors
+        self.monitor.reset()
+        started = time.monotonic()
+        for attempt in range(1, self.retries + 2):
+            position = start
+            created = set()
+            self.conn.autocommit = False
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute('SET LOCAL lock_timeout = %s', (self.lock_timeout,))
+                    while position < len(statements) and not self.needs_autocommit(cur, statements[position], created):
+                        cur.execute(statements[position])
+                        match = CREATE_TABLE_RE.match(strip_leading_comments(statements[position]))
+                        if match:
+                            created.add(relation_name(match.group('table')))
+                        position += 1
+                    if position > start:
+                        self.set_progress(cur, migration, position)
+                self.conn.commit()
+            except Errors.LockNotAvailable:
+                self.conn.rollback()
+                self.conn.autocommit = True
+                if attempt > self.retries:
+                    raise
+                time.sleep(min(2 ** attempt * 0.1, 5))
+                continue
+            except Exception:
+                self.conn.rollback()
+                self.conn.autocommit = True
+                raise
+            self.conn.autocommit = True
+            if position > start:
+                self.record_step(migration['version'], 'transaction', statements[start:position], started, attempt)
+            return position
+        return start
+
+    def needs_autocommit(self, cur: Any, statement: str, created: set) -> bool:
+        text = strip_leading_comments(statement)
+        if NON_TRANSACTIONAL_RE.search(text):
+            return True
+        match = INDEX_RE.match(text)
+        if not match or match.group('only'):
+            return False
+        target = self.index_target(cur, match.group('table'))
+        if target is None:
+            # Left to CREATE INDEX itself to report
+            return False
+        # CREATE TABLE IF NOT EXISTS on an existing table does not rewrite its pg_class row
+        created_here = target[1] and relation_name(match.group('table')) in created
+        return not created_here
+
+    def run_autocommit_step(self, migration: Dict[str, Any], position: int) -> int:
+        statement = migration['statements'][position]
+        text = strip_leading_comments(statement)
+        match = INDEX_RE.match(text)
+        self.monitor.reset()
+        started = time.monotonic()
+        with self.conn.cursor() as cur:
+            if match and not match.group('concurrently'):
+                relkind = self.index_target(cur, match.group('table'))[0]
+                if relkind == 'p':
+                    kind, attempts = 'partitioned index', self.build_partitioned_index(cur, match)
+                else:
+                    kind, attempts = 'online index', self.build_index_concurrently(cur, match, match.group('table'))
+            else:
+                kind, attempts = 'autocommit', 1
+                cur.execute(statement)
+            self.set_progress(cur, migration, position + 1)
+        self.record_step(migration['version'], kind, [statement], started, attempts)
+        return position + 1
+
+    def drop_invalid_index(self, cur: Any, index: str, table: str) -> None:
+        cur.execute("""
+            SELECT quote_ident(n.nspname) || '.' || quote_ident(c.relname)
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE n.oid = (SELECT relnamespace FROM pg_class WHERE oid = to_regclass(%s))
+                AND c.relname = %s AND NOT i.indisvalid
+        """, (table, index.strip('"')))
+        row = cur.fetchone()
+        if row:
+            cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {row[0]}')
+
+    def build_index_concurrently(self, cur: Any, match: Any, table: str, name: Optional[str] = None) -> int:
+        name = name or match.group('name')
+        self.drop_invalid_index(cur, name, table)
+        cur.execute(
+            f"CREATE {match.group('unique') or ''}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {match.group('rest')}"
+        )
+        return 1
+
+    def build_partitioned_index(self, cur: Any, match: Any) -> int:
+        '''ON ONLY parent, CONCURRENTLY per partition, then ATTACH: no long lock on the partitioned table'''
+        parent_index = match.group('name')
+        table = match.group('table')
+        attempts = self.with_lock_timeout(cur, f"CREATE {match.group('unique') or ''}INDEX IF NOT EXISTS {parent_index} ON ONLY {table} {match.group('rest')}")
+        cur.execute("""
+            SELECT c.oid::regclass::text, c.relname, c.relkind
+            FROM pg_inherits inh
+            JOIN pg_class c ON c.oid = inh.inhrelid
+            WHERE inh.inhparent = to_regclass(%s)
+            ORDER BY c.relname
+        """, (table,))
+        for partition, relname, relkind in cur.fetchall():
+            child_index = f'{parent_index.strip(chr(34))}_{relname}'[:63]
+            if relkind == 'p':
+                # Sub-partitioned: index the sub-parent the ordinary way, Postgres cascades to its partitions
+                self.with_lock_timeout(cur, f"CREATE {match.group('unique') or ''}INDEX IF NOT EXISTS {child_index} ON {partition} {match.group('rest')}")
+            else:
+                self.build_index_concurrently(cur, match, partition, child_index)
+            attempts += self.with_lock_timeout(cur, f'ALTER INDEX {parent_index} ATTACH PARTITION {child_index}') - 1
+        return attempts
+
+    def with_lock_timeout(self, cur: Any, statement: str) -> int:
+        '''Runs a short DDL statement in autocommit with lock_timeout and retries; returns attempts'''
+        Errors = self.psycopg2.errors
+        cur.execute('SET lock_timeout = %s', (self.lock_timeout,))
+        try:
+            for attempt in range(1, self.retries + 2):
+                try:
+                    cur.execute(statement)
+                    return attempt
+                except Errors.LockNotAvailable:
+                    if attempt > self.retries:
+                        raise
+                    time.sleep(min(2 ** attempt * 0.1, 5))
+        finally:
+            cur.execute('RESET lock_timeout')
+        return self.retries + 1
+
+
+# ---------- CLI ----------
+
+def print_step(step: Dict[str, Any]) -> None:
+    print(
+        f"{step['version']:<7} {step['kind']:<18} {step['statements']:>4} stmt "
+        f"{step['duration_ms']:>10.1f} ms  lock wait {step['lock_wait_ms']:>8.1f} ms  "
+        f"blocked {step['max_blocked_sessions']:>3}  attempts {step['attempts']}  {step['first']}"
+    )
+
+
+def plan(migrations: List[Dict[str, Any]]) -> None:
+    '''Prints how each statement would be run without connecting to the database'''
+    for migration in migrations:
+        print(f"{migration['version']} {migration['name']} ({len(migration['statements'])} statements)")
+        for statement in migration['statements']:
+            text = strip_leading_comments(statement)
+            match = INDEX_RE.match(text)
+            if NON_TRANSACTIONAL_RE.search(text):
+                kind = 'autocommit'
+            elif match and not match.group('only'):
+                kind = 'index*'
+            else:
+                kind = 'transaction'
+            print(f'    {kind:<12} {summary(statement)}')
+        for index in rebuilt_after_drop(migration['statements']):
+            print(f'    refused: {index} is dropped before it is rebuilt')
+    print('index* - built online if the table existed before the migration, otherwise in its transaction')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Apply db_migrations with online index builds')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--schema', default=os.environ.get('DB_SCHEMA', DEFAULT_SCHEMA))
+    parser.add_argument('--dir', default=MIGRATIONS_DIR)
+    parser.add_argument('--target', help='apply up to and including this version')
+    parser.add_argument('--baseline', help='mark versions up to this one as applied without running them')
+    parser.add_argument('--lock-timeout', default='3s', help='lock_timeout for transactional steps and short DDL')
+    parser.add_argument('--retries', type=int, default=5, help='retries of a step that hit lock_timeout')
+    parser.add_argument('--dry-run', action='store_true', help='print the plan without connecting')
+    parser.add_argument('--json', dest='json_path', help='also write the step report as JSON to this file')
+    args = parser.parse_args()
+
+    migrations = load_migrations(args.dir)
+    if args.target:
+        migrations = [m for m in migrations if int(m['version'][1:]) <= int(args.target[1:])]
+    if args.dry_run:
+        plan(migrations)
+        return
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    runner = Runner(args.database_url, args.schema, args.lock_timeout, args.retries)
+    try:
+        if args.baseline:
+            print(f'baselined {runner.baseline(migrations, args.baseline)} migrations')
+        applied = runner.applied()
+        for migration in migrations:
+            state = applied.get(migration['version'])
+            resume_from = 0
+            if state:
+                if state['status'] != 'running':
+                    if state['checksum'] != migration['checksum']:
+                        print(f"warning: {migration['version']} changed after it was applied")
+                    continue
+                if state['checksum'] != migration['checksum']:
+                    raise SystemExit(f"{migration['version']} changed while partially applied, resolve by hand")
+                resume_from = state['statements_done']
+                print(f"resuming {migration['version']} from statement {resume_from + 1}")
+            rebuilt = rebuilt_after_drop(migration['statements'])
+            if rebuilt:
+                raise SystemExit(
+                    f"{migration['version']} drops {', '.join(rebuilt)} before rebuilding it; build the new index "
+                    f"under another name, then DROP the old one and RENAME the new one in one transaction"
+                )
+            print(f"applying {migration['version']} {migration['name']}")
+            runner.apply(migration, resume_from)
+    finally:
+        runner.close()
+        if args.json_path:
+            with open(args.json_path, 'w', encoding='utf-8') as f:
+                json.dump(runner.steps, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
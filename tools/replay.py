@@ -0,0 +1,316 @@
+'''
+Offline replay of recorded handler events for capacity planning.
+
+Reads an event log and calls backend/<function>/index.py handlers directly,
+keeping the recorded spacing between events divided by --speed. Point
+--database-url at a local Postgres loaded with a copy of the data.
+
+Event log: JSON lines, one per request, in the handler(event, context) shape
+plus the function name and the time it was received:
+
+    {"function": "marketplace", "ts": 1718000000.125, "event": {"httpMethod": "GET", "path": "/",
+     "queryStringParameters": {"user_id": "1"}, "headers": {}, "body": "{}"}}
+
+"ts" is epoch seconds or an ISO timestamp; "event" may also be given inline
+(httpMethod, path, ... at the top level). --from-tests builds a synthetic log
+from backend/*/tests.json instead, spaced at --rate events per second.
+
+    python tools/replay.py events.jsonl --speed 10 --workers 32 --mode thread
+    python tools/replay.py --from-tests --repeat 200 --rate 50 --mode process --workers 8
+
+Modes: thread (sync handlers in a thread pool), process (sync handlers in a
+process pool, each worker imports the functions once) and async (async_index
+handlers on one event loop, other functions in its thread pool), matching the
+ASYNC_HANDLERS switch of tools/asgi_app.py.
+
+Per function, method and path the report shows service time (handler call)
+and response time (from the scheduled send time, so it includes queueing when
+the workers cannot keep up) as percentiles, plus status counts and errors.
+'''
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(os.path.dirname(TOOLS_DIR), 'backend')
+sys.path.insert(0, TOOLS_DIR)
+
+PERCENTILES = (50, 90, 99)
+
+# (function, event, scheduled offset in seconds)
+Record = Tuple[str, Dict[str, Any], float]
+# (function, method, path, status, scheduled, started, finished, error)
+Result = Tuple[str, str, str, int, float, float, float, Optional[str]]
+
+
+# ---------- Event log ----------
+
+def parse_ts(value: Any) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+def read_log(paths: List[str]) -> Iterator[Tuple[str, Dict[str, Any], Optional[float]]]:
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                function = record.get('function') or record.get('function_name')
+                if not function:
+                    raise ValueError(f'{path}:{line_no}: missing "function"')
+                event = record.get('event')
+                if event is None:
+                    event = {k: v for k, v in record.items() if k not in ('function', 'function_name', 'ts')}
+                yield function, normalize_event(event), parse_ts(record['ts']) if 'ts' in record else None
+
+
+def tests_log(functions: Optional[List[str]], repeat: int) -> Iterator[Tuple[str, Dict[str, Any], Optional[float]]]:
+    '''Builds events from the cases in backend/*/tests.json'''
+    cases = []
+    for tests_path in sorted(glob.glob(os.path.join(BACKEND_DIR, '*', 'tests.json'))):
+        function = os.path.basename(os.path.dirname(tests_path))
+        if functions and function not in functions:
+            continue
+        with open(tests_path, encoding='utf-8') as f:
+            for test in json.load(f).get('tests', []):
+                path, _, query = test.get('path', '/').partition('?')
+                cases.append((function, {
+                    'httpMethod': test.get('method', 'GET'),
+                    'path': path,
+                    'queryStringParameters': dict(parse_qsl(query)),
+                    'headers': test.get('headers', {}),
+                    'body': json.dumps(test['body']) if 'body' in test else '{}'
+                }))
+    for _ in range(repeat):
+        for function, event in cases:
+            yield function, normalize_event(event), None
+
+
+def normalize_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    event = dict(event)
+    event.setdefault('httpMethod', 'GET')
+    event.setdefault('path', '/')
+    event.setdefault('headers', {})
+    event['queryStringParameters'] = event.get('queryStringParameters') or {}
+    body = event.get('body')
+    if body is None:
+        event['body'] = '{}'
+    elif not isinstance(body, str):
+        event['body'] = json.dumps(body)
+    event.setdefault('isBase64Encoded', False)
+    return event
+
+
+def schedule(entries: Iterator[Tuple[str, Dict[str, Any], Optional[float]]], speed: float, rate: float) -> List[Record]:
+    '''Turns event times into offsets from the start of the run, compressed by speed'''
+    records = []
+    first_ts = None
+    for index, (function, event, ts) in enumerate(entries):
+        if ts is None:
+            offset = index / rate if rate > 0 else 0.0
+        else:
+            if first_ts is None:
+                first_ts = ts
+            offset = (ts - first_ts) / speed if speed > 0 else 0.0
+        records.append((function, event, offset))
+    records.sort(key=lambda record: record[2])
+    return records
+
+
+# ---------- Handlers ----------
+
+def call_handler(function: str, event: Dict[str, Any], scheduled: float) -> Result:
+    '''Calls a sync handler; runs both in pool threads and in child processes'''
+    from asgi_app import load_function
+
+    started = time.monotonic()
+    status, error = 0, None
+    try:
+        handler, _ = load_function(function)
+        response = handler(event, SimpleNamespace(request_id=str(uuid.uuid4()), function_name=function))
+        status = int(response.get('statusCode', 200))
+    except Exception:
+        error = traceback.format_exc(limit=3).strip().splitlines()[-1]
+    return function, event['httpMethod'], event['path'], status, scheduled, started, time.monotonic(), error
+
+
+def replay_pool(records: List[Record], mode: str, workers: int) -> Tuple[List[Result], float]:
+    executor_class = ProcessPoolExecutor if mode == 'process' else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        if mode == 'process':
+            # Best effort: imports happen before the clock starts in most workers
+            names = sorted({record[0] for record in records})
+            list(executor.map(warm_up, [names] * workers))
+        else:
+            warm_up(sorted({record[0] for record in records}))
+        # time.monotonic is system-wide on Linux, so timestamps compare across workers
+        origin = time.monotonic()
+        futures = []
+        for function, event, offset in records:
+            delay = origin + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(call_handler, function, event, origin + offset))
+        results = [future.result() for future in futures]
+    return results, origin
+
+
+def warm_up(names: List[str]) -> None:
+    from asgi_app import load_function
+    for name in names:
+        try:
+            load_function(name)
+        except Exception:
+            # Import errors are reported per request by call_handler
+            pass
+
+
+async def replay_async(records: List[Record], workers: int) -> Tuple[List[Result], float]:
+    from asgi_app import load_function
+
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers))
+    handlers = {name: load_function(name) for name in {record[0] for record in records}}
+    limiter = asyncio.Semaphore(workers)
+
+    async def run(function: str, event: Dict[str, Any], scheduled: float) -> Result:
+        async with limiter:
+            handler, is_async = handlers[function]
+            started = time.monotonic()
+            status, error = 0, None
+            context = SimpleNamespace(request_id=str(uuid.uuid4()), function_name=function)
+            try:
+                if is_async:
+                    response = await handler(event, context)
+                else:
+                    response = await loop.run_in_executor(None, handler, event, context)
+                status = int(response.get('statusCode', 200))
+            except Exception:
+                error = traceback.format_exc(limit=3).strip().splitlines()[-1]
+            return function, event['httpMethod'], event['path'], status, scheduled, started, time.monotonic(), error
+
+    origin = time.monotonic()
+    tasks = []
+    for function, event, offset in records:
+        delay = origin + offset - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(run(function, event, origin + offset)))
+    return list(await asyncio.gather(*tasks)), origin
+
+
+# ---------- Report ----------
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    '''Nearest-rank percentile'''
+    if not sorted_values:
+        return 0.0
+    rank = max(int(-(-p * len(sorted_values) // 100)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(results: List[Result], origin: float) -> Dict[str, Any]:
+    groups: Dict[Tuple[str, str, str], List[Result]] = defaultdict(list)
+    for result in results:
+        groups[result[:3]].append(result)
+    named = [(f'{function} {method} {path}', group) for (function, method, path), group in sorted(groups.items())]
+
+    summary = {}
+    for name, group in named + [('all', results)]:
+        service = sorted((r[6] - r[5]) * 1000 for r in group)
+        response = sorted((r[6] - r[4]) * 1000 for r in group)
+        errors = [r[7] for r in group if r[7]]
+        summary[name] = {
+            'count': len(group),
+            'errors': len(errors) + sum(1 for r in group if r[3] >= 500),
+            'statuses': dict(Counter(str(r[3]) for r in group if not r[7])),
+            'service_ms': {f'p{p}': round(percentile(service, p), 2) for p in PERCENTILES} | {'max': round(service[-1], 2)},
+            'response_ms': {f'p{p}': round(percentile(response, p), 2) for p in PERCENTILES} | {'max': round(response[-1], 2)},
+            'sample_error': errors[0] if errors else None
+        }
+    elapsed = max((r[6] for r in results), default=origin) - origin
+    return {
+        'requests': len(results),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 1) if elapsed > 0 else None,
+        'endpoints': summary
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"requests={report['requests']} elapsed={report['elapsed_s']}s throughput={report['throughput_rps']} rps")
+    header = f"{'endpoint':<40} {'count':>7} {'err':>5} " + ' '.join(f'{"svc p" + str(p):>9}' for p in PERCENTILES) + f" {'svc max':>9} {'resp p99':>9}"
+    print(header)
+    print('-' * len(header))
+    for name, row in report['endpoints'].items():
+        service = row['service_ms']
+        print(
+            f"{name[:40]:<40} {row['count']:>7} {row['errors']:>5} "
+            + ' '.join(f"{service[f'p{p}']:>9.2f}" for p in PERCENTILES)
+            + f" {service['max']:>9.2f} {row['response_ms']['p99']:>9.2f}"
+        )
+    for name, row in report['endpoints'].items():
+        if row['sample_error']:
+            print(f'{name}: {row["sample_error"]}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Replay recorded handler events against local functions')
+    parser.add_argument('logs', nargs='*', help='JSONL event logs')
+    parser.add_argument('--from-tests', action='store_true', help='build events from backend/*/tests.json')
+    parser.add_argument('--repeat', type=int, default=1, help='repetitions of the tests.json cases')
+    parser.add_argument('--rate', type=float, default=0, help='events per second for events without ts (0 = no pacing)')
+    parser.add_argument('--speed', type=float, default=1.0, help='time compression of recorded ts (0 = as fast as possible)')
+    parser.add_argument('--functions', help='comma-separated functions to replay (default: all in the log)')
+    parser.add_argument('--mode', choices=['thread', 'process', 'async'], default='thread')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--database-url', help='DATABASE_URL for the handlers (a local copy, never production)')
+    parser.add_argument('--json', dest='json_path', help='also write the report as JSON to this file')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    # Threads and processes call the sync handlers, async mode awaits handler_async
+    os.environ['ASYNC_HANDLERS'] = '1' if args.mode == 'async' else '0'
+
+    functions = args.functions.split(',') if args.functions else None
+    if args.from_tests:
+        entries = tests_log(functions, args.repeat)
+    elif args.logs:
+        entries = (entry for entry in read_log(args.logs) if not functions or entry[0] in functions)
+    else:
+        parser.error('pass event logs or --from-tests')
+    records = schedule(entries, args.speed, args.rate)
+    if not records:
+        parser.error('no events to replay')
+
+    if args.mode == 'async':
+        results, origin = asyncio.run(replay_async(records, args.workers))
+    else:
+        results, origin = replay_pool(records, args.mode, args.workers)
+
+    report = summarize(results, origin)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
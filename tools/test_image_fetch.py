@@ -0,0 +1,98 @@
+'''
+Tests of the image-worker HTTP fetcher against redirects out of the public web.
+
+A local server plays the image host. Loopback is not a public address, so the
+test allows exactly that server's address for the first hop; every other hop
+goes through the real check. Needs the image-worker requirements (Pillow,
+psycopg2) installed:
+
+    python -m unittest tools/test_image_fetch.py
+'''
+import os
+import sys
+import threading
+import unittest
+import urllib.error
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', 'image-worker'))
+import index  # noqa: E402
+
+REDIRECTS = {
+    '/to-ftp': 'ftp://ftp.example.com/image.png',
+    '/to-file': 'file:///etc/passwd',
+    '/to-private': 'http://10.0.0.5/image.png',
+    '/to-metadata': 'http://169.254.169.254/latest/meta-data/',
+    '/to-loopback-name': 'http://localhost:1/image.png'
+}
+IMAGE = b'\x89PNG\r\n\x1a\n' + b'\0' * 32
+
+
+class RedirectingHost(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path in REDIRECTS:
+            self.send_response(302)
+            self.send_header('Location', REDIRECTS[self.path])
+            self.end_headers()
+        elif self.path == '/image.png':
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(IMAGE)))
+            self.end_headers()
+            self.wfile.write(IMAGE)
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FetchHttpRedirectTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = HTTPServer(('127.0.0.1', 0), RedirectingHost)
+        cls.port = cls.server.server_address[1]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.real_public_address = index.public_address
+
+        def public_address(host: str, port: int):
+            if host == '127.0.0.1' and port == cls.port:
+                return host, port
+            return cls.real_public_address(host, port)
+
+        index.public_address = public_address
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        index.public_address = cls.real_public_address
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def url(self, path: str) -> str:
+        return f'http://127.0.0.1:{self.port}{path}'
+
+    def test_fetches_allowed_host(self) -> None:
+        self.assertEqual(index.fetch_http(self.url('/image.png')), IMAGE)
+
+    def test_redirect_to_ftp_rejected(self) -> None:
+        with self.assertRaisesRegex(ValueError, 'ftp:// is not allowed'):
+            index.fetch_http(self.url('/to-ftp'))
+
+    def test_redirect_to_file_rejected(self) -> None:
+        # urllib itself refuses file:// redirects before the handler sees them
+        with self.assertRaises((ValueError, urllib.error.HTTPError)):
+            index.fetch_http(self.url('/to-file'))
+
+    def test_redirect_to_private_address_rejected(self) -> None:
+        for path in ('/to-private', '/to-metadata', '/to-loopback-name'):
+            with self.subTest(path=path), self.assertRaisesRegex(ValueError, 'non-public address'):
+                index.fetch_http(self.url(path))
+
+    def test_opener_has_only_http_handlers(self) -> None:
+        for url in ('ftp://ftp.example.com/image.png', 'file:///etc/passwd', 'data:image/png;base64,AAAA'):
+            with self.subTest(url=url), self.assertRaises(urllib.error.URLError):
+                index.HTTP_OPENER.open(url, timeout=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
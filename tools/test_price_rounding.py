@@ -0,0 +1,95 @@
+'''
+Pins the two seller-history paths to each other.
+
+Small pages get display_prices from pricing.convert_prices in Python; pages above
+JSON_AGG_THRESHOLD are built by Postgres (seller_history_json) with
+ROUND(price / points_per_unit, 2). Both must give the same string for every price,
+including ties and rates that do not divide evenly, and the whole page must match
+what encode_rows gives for the tuple path (timestamps included). Runs both catalog
+queries against a migrated database inside a transaction that is rolled back:
+
+    DATABASE_URL=postgresql://... python -m unittest tools/test_price_rounding.py
+'''
+import json
+import os
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', 'marketplace'))
+from pricing import display_prices  # noqa: E402
+from serialize import cursor_columns, encode_rows  # noqa: E402
+import queries  # noqa: E402
+
+PRICES = [
+    '0.01', '0.04', '0.05', '0.15', '0.25', '0.35', '1.00', '1.05', '2.50', '9.99',
+    '10.00', '33.33', '66.67', '100.05', '1234.45', '4999.95', '99999999.95', '99999999.99'
+]
+# currency_rates.points_per_unit is NUMERIC(12, 4)
+RATES = {
+    'R10': Decimal('10.0000'),
+    'R3': Decimal('3.0000'),
+    'R7': Decimal('7.0000'),
+    'RTH': Decimal('0.3333'),
+    'RQ': Decimal('0.0001'),
+    'RX': Decimal('91.2345'),
+    'RB': Decimal('12345678.9999')
+}
+# str(datetime) keeps trailing zeros of microseconds and drops a zero fraction, ::text does neither
+CREATED_AT = ['2024-01-01 10:00:00', '2024-01-01 10:00:01.5', '2024-01-01 10:00:02.120000', '2024-01-01 10:00:03.123456']
+
+
+@unittest.skipUnless(os.environ.get('DATABASE_URL'), 'needs DATABASE_URL of a migrated database')
+class SellerHistoryRoundingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conn = queries.get_connection()
+        self.cur = self.conn.cursor()
+        self.cur.execute("""
+            INSERT INTO t_p99005675_game_items_marketpla.users (username)
+            VALUES ('rounding-test') RETURNING id
+        """)
+        self.user_id = self.cur.fetchone()[0]
+        for index, price in enumerate(PRICES):
+            self.cur.execute("""
+                INSERT INTO t_p99005675_game_items_marketpla.items (seller_id, title, price, category, rarity, created_at)
+                VALUES (%s, %s, %s, 'test', 'common', %s::timestamp - make_interval(days => %s))
+            """, (self.user_id, f'price {price}', price, CREATED_AT[index % len(CREATED_AT)], index))
+
+    def tearDown(self) -> None:
+        self.cur.close()
+        queries.release_connection(self.conn)
+
+    def test_json_agg_matches_python(self) -> None:
+        currencies = list(RATES)
+        queries.execute(self.cur, 'seller_history_json', (self.user_id, len(PRICES), currencies, [RATES[c] for c in currencies]))
+        from_sql = {item['price']: item['display_prices'] for item in json.loads(self.cur.fetchone()[0])}
+
+        queries.execute(self.cur, 'seller_history', (self.user_id, len(PRICES)))
+        rows = self.cur.fetchall()
+        price_index = cursor_columns(self.cur).index('price')
+        prices = [row[price_index] for row in rows]
+        from_python = {
+            str(price): {currency: str(value) for currency, value in converted.items()}
+            for price, converted in zip(prices, display_prices(prices, RATES, currencies))
+        }
+
+        self.assertEqual(len(from_python), len(PRICES))
+        self.assertEqual(from_sql, from_python)
+
+    def test_json_agg_page_matches_encode_rows(self) -> None:
+        currencies = list(RATES)
+        queries.execute(self.cur, 'seller_history_json', (self.user_id, len(PRICES), currencies, [RATES[c] for c in currencies]))
+        from_sql = json.loads(self.cur.fetchone()[0])
+
+        queries.execute(self.cur, 'seller_history', (self.user_id, len(PRICES)))
+        rows = self.cur.fetchall()
+        columns = cursor_columns(self.cur)
+        prices = display_prices([row[columns.index('price')] for row in rows], RATES, currencies)
+        from_python = json.loads(encode_rows(columns + ['display_prices'], [row + (p,) for row, p in zip(rows, prices)]))
+
+        self.assertEqual(len(from_python), len(PRICES))
+        self.assertEqual(from_sql, from_python)
+
+
+if __name__ == '__main__':
+    unittest.main()